@@ -0,0 +1,73 @@
+"""
+Compare the tairHash response decoders with the raw replies callers used to re-walk themselves.
+
+The parser output is built once per round, then either the caller-side conversion that was needed before the
+decoders existed or the decoder itself is applied to it. tracemalloc reports how many blocks and bytes each
+variant allocates and keeps; no server is needed.
+
+    PYTHONPATH=. python benchmarks/bench_decoders.py --fields 1000000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from tairClient.client import parse_exhgetall, parse_exhmgetwithver
+
+
+def caller_exhgetall(reply):
+    # what callers wrote on top of the flat list
+    return dict(zip(reply[::2], reply[1::2]))
+
+
+def caller_exhmgetwithver(reply):
+    return [tuple(r) if r else None for r in reply]
+
+
+def measure(name, make_reply, convert, rounds):
+    reply = make_reply()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        convert(reply)
+    elapsed = (time.perf_counter() - start) / rounds
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = convert(reply)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    kept = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    del result
+    print('%-32s %9.2f ms %12d blocks kept %10.1f MB kept %10.1f MB peak'
+          % (name, elapsed * 1000, blocks, kept / 1e6, peak / 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fields', type=int, default=200000)
+    parser.add_argument('--rounds', type=int, default=5)
+    options = parser.parse_args()
+    n = options.fields
+
+    def getall_reply():
+        reply = []
+        for i in range(n):
+            reply.append(b'field:%d' % i)
+            reply.append(b'value:%d' % i)
+        return reply
+
+    def withver_reply():
+        return [[b'value:%d' % i, i] for i in range(n)]
+
+    print('%d fields' % n)
+    measure('EXHGETALL raw + caller dict', getall_reply, caller_exhgetall, options.rounds)
+    measure('EXHGETALL decoder', getall_reply, parse_exhgetall, options.rounds)
+    measure('EXHMGETWITHVER raw + caller', withver_reply, caller_exhmgetwithver, options.rounds)
+    measure('EXHMGETWITHVER decoder', withver_reply, parse_exhmgetwithver, options.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Compare redis-py's command packing with the CommandPacker installed by ``Client(fast_encoder=True)``.
+
+Arguments are built by the real exh* methods, then packed by a plain redis-py ``Connection`` and by a
+``PackerConnection``, one command at a time and as a pipeline. Both outputs are checked to be identical first.
+No server is needed.
+
+    PYTHONPATH=. python benchmarks/bench_encoder.py --commands 200000 --depth 100
+"""
+import argparse
+import time
+
+from redis.connection import Connection, ConnectionPool
+
+from tairClient.client import TairCommands
+from tairClient.resp import install_packer
+
+
+class ArgsRecorder(TairCommands):
+    # builds the argument tuples exactly like Client, without sending them
+    def execute_command(self, *args, **options):
+        return args
+
+
+def workload(n):
+    commands = ArgsRecorder()
+    args = []
+    for i in range(n):
+        field = 'field:%d' % (i % 100)
+        kind = i % 4
+        if kind == 0:
+            args.append(commands.exhset('user:%d' % (i % 1000), field, 'v' * 32, ex=60, ver=i % 7 + 1))
+        elif kind == 1:
+            args.append(commands.exhincrby('counter:%d' % (i % 1000), field, 1, px=5000, maxval=1 << 20))
+        elif kind == 2:
+            args.append(commands.exhget('user:%d' % (i % 1000), field))
+        else:
+            args.append(commands.exhmget('user:%d' % (i % 1000), [field, 'name', 'email']))
+    return args
+
+
+def measure(name, pack, batches):
+    start = time.perf_counter()
+    for batch in batches:
+        pack(batch)
+    elapsed = time.perf_counter() - start
+    commands = sum(len(batch) for batch in batches)
+    print('%-28s %8.3f s %12.0f commands/s' % (name, elapsed, commands / elapsed))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--commands', type=int, default=200000)
+    parser.add_argument('--depth', type=int, default=100, help='commands per pipeline')
+    options = parser.parse_args()
+
+    args = workload(options.commands)
+    plain = Connection()
+    pool = ConnectionPool()
+    install_packer(pool)
+    fast = pool.make_connection()
+
+    for command in args[:1000]:
+        assert b''.join(plain.pack_command(*command)) == b''.join(fast.pack_command(*command))
+
+    singles = [[command] for command in args]
+    depth = options.depth
+    pipelines = [args[i:i + depth] for i in range(0, len(args), depth)]
+    base = measure('redis-py pack_command', lambda batch: plain.pack_command(*batch[0]), singles)
+    new = measure('packer pack_command', lambda batch: fast.pack_command(*batch[0]), singles)
+    print('%-28s %8.2fx' % ('speedup', base / new))
+    base = measure('redis-py pack_commands', plain.pack_commands, pipelines)
+    new = measure('packer pack_commands', fast.pack_commands, pipelines)
+    print('%-28s %8.2fx' % ('speedup', base / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Measure the cost of ``Client.enable_metrics()``.
+
+The recording alone (two ``perf_counter`` calls and ``CommandMetrics.record``) is timed in a loop. Then the same
+exhget and pipeline workload runs against the in-process stand-in server with and without metrics, alternating
+rounds so both see the same machine state, and the per-command difference is reported.
+
+    PYTHONPATH=. python benchmarks/bench_metrics.py --commands 20000 --rounds 5
+"""
+import argparse
+import time
+
+from tairClient import Client
+from tairClient.metrics import CommandMetrics
+from tairClient.server import TairHashServer
+
+
+def record_cost(n):
+    metrics = CommandMetrics()
+    start = time.perf_counter()
+    for _ in range(n):
+        begin = time.perf_counter()
+        metrics.record('EXHGET', time.perf_counter() - begin)
+    return (time.perf_counter() - start) / n
+
+
+def run(client, commands, depth):
+    start = time.perf_counter()
+    for _ in range(commands):
+        client.exhget('bench', 'f')
+    singles = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(commands // depth):
+        pipe = client.pipeline(transaction=False)
+        for _ in range(depth):
+            pipe.exhget('bench', 'f')
+        pipe.execute()
+    pipelined = time.perf_counter() - start
+    return singles / commands, pipelined / commands
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--commands', type=int, default=20000)
+    parser.add_argument('--depth', type=int, default=50, help='commands per pipeline')
+    parser.add_argument('--rounds', type=int, default=5)
+    options = parser.parse_args()
+
+    print('%-28s %10.3f us' % ('record()', record_cost(options.commands * 10) * 1e6))
+    with TairHashServer(port=0) as server:
+        plain = Client(port=server.port)
+        measured = Client(port=server.port)
+        measured.enable_metrics()
+        plain.exhset('bench', 'f', 'v' * 32)
+        best = {}
+        for _ in range(options.rounds):
+            for name, client in (('off', plain), ('on', measured)):
+                result = run(client, options.commands, options.depth)
+                best[name] = [min(a, b) for a, b in zip(best.get(name, result), result)]
+        for i, kind in enumerate(('exhget', 'pipelined exhget')):
+            off, on = best['off'][i], best['on'][i]
+            print('%-28s %10.3f us off %10.3f us on %+8.3f us %+7.1f%%'
+                  % (kind, off * 1e6, on * 1e6, (on - off) * 1e6, (on / off - 1) * 100))
+
+
+if __name__ == '__main__':
+    main()
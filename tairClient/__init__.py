@@ -1,2 +1,3 @@
-
 from .client import Client
+from .aio import AsyncClient
+from .cluster import ClusterClient
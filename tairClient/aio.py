@@ -0,0 +1,481 @@
+import asyncio
+from itertools import chain
+
+from redis._compat import nativestr
+from redis.client import CaseInsensitiveDict
+from redis.connection import (
+    BaseParser,
+    Encoder,
+    SYM_STAR,
+    SYM_DOLLAR,
+    SYM_CRLF,
+    SYM_EMPTY,
+    SERVER_CLOSED_CONNECTION_ERROR,
+)
+from redis.exceptions import (
+    ConnectionError,
+    ExecAbortError,
+    InvalidResponse,
+    ResponseError,
+    TimeoutError,
+    WatchError,
+)
+
+from .client import Client, TairCommands, remove_tairhash_callbacks
+
+
+class AsyncParser(BaseParser):
+    """
+    Plain RESP parser reading from an asyncio ``StreamReader``.
+    """
+
+    def __init__(self, reader, encoder):
+        self._reader = reader
+        self.encoder = encoder
+
+    async def read_response(self):
+        try:
+            raw = await self._reader.readuntil(SYM_CRLF)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError(SERVER_CLOSED_CONNECTION_ERROR)
+
+        byte, response = raw[:1], raw[1:-2]
+
+        if byte not in (b'-', b'+', b':', b'$', b'*'):
+            raise InvalidResponse("Protocol Error: %r" % raw)
+
+        if byte == b'-':
+            error = self.parse_error(nativestr(response))
+            if isinstance(error, ConnectionError):
+                raise error
+            return error
+        elif byte == b'+':
+            pass
+        elif byte == b':':
+            response = int(response)
+        elif byte == b'$':
+            length = int(response)
+            if length == -1:
+                return None
+            try:
+                response = (await self._reader.readexactly(length + 2))[:-2]
+            except asyncio.IncompleteReadError:
+                raise ConnectionError(SERVER_CLOSED_CONNECTION_ERROR)
+        elif byte == b'*':
+            length = int(response)
+            if length == -1:
+                return None
+            response = [await self.read_response() for _ in range(length)]
+        if isinstance(response, bytes):
+            response = self.encoder.decode(response)
+        return response
+
+
+class AsyncConnection(object):
+    """
+    Manages one asyncio stream connection to a Tair server.
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, socket_timeout=None,
+                 socket_connect_timeout=None, encoding='utf-8', encoding_errors='strict', decode_responses=False,
+                 retry_on_timeout=False, client_name=None, username=None, ssl=None):
+        self.host = host
+        self.port = int(port)
+        self.db = db
+        self.username = username
+        self.password = password
+        self.client_name = client_name
+        self.socket_timeout = socket_timeout
+        self.socket_connect_timeout = socket_connect_timeout or socket_timeout
+        self.retry_on_timeout = retry_on_timeout
+        self.ssl = ssl
+        self.encoder = Encoder(encoding, encoding_errors, decode_responses)
+        self._reader = None
+        self._writer = None
+        self._parser = None
+
+    def __repr__(self):
+        return '%s<host=%s,port=%s,db=%s>' % (self.__class__.__name__, self.host, self.port, self.db)
+
+    @property
+    def is_connected(self):
+        return self._writer is not None
+
+    async def connect(self):
+        """
+        Connects to the server if not already connected.
+        """
+        if self._writer is not None:
+            return
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.socket_connect_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Timeout connecting to server")
+        except OSError as e:
+            raise ConnectionError("Error connecting to %s:%s. %s." % (self.host, self.port, e))
+        self._parser = AsyncParser(self._reader, self.encoder)
+        try:
+            await self.on_connect()
+        except BaseException:
+            self.disconnect()
+            raise
+
+    async def on_connect(self):
+        if self.username or self.password:
+            auth_args = (self.username, self.password) if self.username else (self.password,)
+            await self.send_command('AUTH', *auth_args)
+            if nativestr(await self.read_response()) != 'OK':
+                raise ConnectionError('Invalid Username or Password')
+        if self.client_name:
+            await self.send_command('CLIENT', 'SETNAME', self.client_name)
+            if nativestr(await self.read_response()) != 'OK':
+                raise ConnectionError('Error setting client name')
+        if self.db:
+            await self.send_command('SELECT', self.db)
+            if nativestr(await self.read_response()) != 'OK':
+                raise ConnectionError('Invalid Database')
+
+    def disconnect(self):
+        """
+        Disconnects from the server. Any reply still in flight on this connection is lost.
+        """
+        writer = self._writer
+        self._reader = self._writer = self._parser = None
+        if writer is not None:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    def pack_command(self, *args):
+        """
+        Pack a series of arguments into the Redis protocol.
+        """
+        if isinstance(args[0], str):
+            args = tuple(args[0].encode().split()) + args[1:]
+        elif b' ' in args[0]:
+            args = tuple(args[0].split()) + args[1:]
+        pieces = [SYM_STAR, str(len(args)).encode(), SYM_CRLF]
+        for arg in map(self.encoder.encode, args):
+            pieces.extend((SYM_DOLLAR, str(len(arg)).encode(), SYM_CRLF, arg, SYM_CRLF))
+        return SYM_EMPTY.join(pieces)
+
+    def pack_commands(self, commands):
+        return SYM_EMPTY.join(self.pack_command(*args) for args in commands)
+
+    async def send_packed_command(self, command):
+        if self._writer is None:
+            await self.connect()
+        try:
+            self._writer.write(command)
+            await self._writer.drain()
+        except OSError as e:
+            self.disconnect()
+            raise ConnectionError("Error while writing to socket. %s." % (e,))
+        except BaseException:
+            self.disconnect()
+            raise
+
+    async def send_command(self, *args):
+        await self.send_packed_command(self.pack_command(*args))
+
+    async def read_response(self):
+        """
+        Read the response from a previously sent command.
+        """
+        if self._parser is None:
+            raise ConnectionError(SERVER_CLOSED_CONNECTION_ERROR)
+        try:
+            if self.socket_timeout:
+                response = await asyncio.wait_for(self._parser.read_response(), self.socket_timeout)
+            else:
+                response = await self._parser.read_response()
+        except asyncio.TimeoutError:
+            self.disconnect()
+            raise TimeoutError("Timeout reading from %s:%s" % (self.host, self.port))
+        except OSError as e:
+            self.disconnect()
+            raise ConnectionError("Error while reading from %s:%s : %s" % (self.host, self.port, e.args))
+        except BaseException:
+            # a cancelled or failed read leaves the stream in an unknown position
+            self.disconnect()
+            raise
+        if isinstance(response, ResponseError):
+            raise response
+        return response
+
+
+class AsyncConnectionPool(object):
+    """
+    Blocking asyncio connection pool. It behaves like redis-py's ``BlockingConnectionPool``: at most
+    ``max_connections`` connections are opened, and a coroutine asking for a connection while all of them are in
+    use waits up to ``timeout`` seconds (``None`` waits forever) before ``ConnectionError`` is raised.
+    """
+
+    def __init__(self, max_connections=50, timeout=20, connection_class=AsyncConnection, **connection_kwargs):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.connection_class = connection_class
+        self.connection_kwargs = connection_kwargs
+        self.reset()
+
+    def __repr__(self):
+        return '%s<%s>' % (type(self).__name__, repr(self.connection_class(**self.connection_kwargs)))
+
+    def reset(self):
+        # like BlockingConnectionPool, ``None`` placeholders are replaced by real connections on demand
+        self.pool = asyncio.LifoQueue(self.max_connections)
+        while not self.pool.full():
+            self.pool.put_nowait(None)
+        self._connections = []
+
+    def make_connection(self):
+        connection = self.connection_class(**self.connection_kwargs)
+        self._connections.append(connection)
+        return connection
+
+    async def get_connection(self, command_name=None):
+        """
+        Get a connection, waiting up to ``self.timeout`` seconds until one is available.
+        """
+        try:
+            connection = await asyncio.wait_for(self.pool.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError("No connection available.")
+        if connection is None:
+            connection = self.make_connection()
+        try:
+            await connection.connect()
+        except BaseException:
+            self.release(connection)
+            raise
+        return connection
+
+    def release(self, connection):
+        self.pool.put_nowait(connection)
+
+    def disconnect(self):
+        for connection in self._connections:
+            connection.disconnect()
+
+
+class AsyncClient(TairCommands):
+    """
+    asyncio version of :class:`tairClient.client.Client`. It offers the same ``exh*`` commands and argument
+    builders, every command is a coroutine:
+
+        tair = AsyncClient()
+        await tair.exhset("key", "field", "value", ex=10)
+        await tair.exhget("key", "field")
+
+    Commands are sent over asyncio streams borrowed from an :class:`AsyncConnectionPool`, so one event loop can
+    keep up to ``max_connections`` requests in flight without threads.
+    """
+
+    RESPONSE_CALLBACKS = Client.RESPONSE_CALLBACKS
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, socket_timeout=None,
+                 socket_connect_timeout=None, connection_pool=None, encoding='utf-8', encoding_errors='strict',
+                 decode_responses=False, retry_on_timeout=False, max_connections=50, pool_timeout=20,
+                 client_name=None, username=None, ssl=None, raw_replies=False):
+        """
+        Creates a new asyncio tairHash client.
+        :param raw_replies: skip the tairHash decoders, like ``Client(raw_replies=True)``
+        """
+        if not connection_pool:
+            connection_pool = AsyncConnectionPool(
+                max_connections=max_connections,
+                timeout=pool_timeout,
+                host=host,
+                port=port,
+                db=db,
+                username=username,
+                password=password,
+                socket_timeout=socket_timeout,
+                socket_connect_timeout=socket_connect_timeout,
+                encoding=encoding,
+                encoding_errors=encoding_errors,
+                decode_responses=decode_responses,
+                retry_on_timeout=retry_on_timeout,
+                client_name=client_name,
+                ssl=ssl)
+        self.connection_pool = connection_pool
+        self.response_callbacks = CaseInsensitiveDict(self.__class__.RESPONSE_CALLBACKS)
+        if raw_replies:
+            remove_tairhash_callbacks(self.response_callbacks)
+
+    def __repr__(self):
+        return "%s<%s>" % (type(self).__name__, repr(self.connection_pool))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        self.connection_pool.disconnect()
+
+    def set_response_callback(self, command, callback):
+        self.response_callbacks[command] = callback
+
+    async def execute_command(self, *args, **options):
+        """
+        Execute a command and return a parsed response.
+        """
+        pool = self.connection_pool
+        command_name = args[0]
+        conn = await pool.get_connection(command_name)
+        try:
+            await conn.send_command(*args)
+            return await self.parse_response(conn, command_name, **options)
+        except (ConnectionError, TimeoutError) as e:
+            conn.disconnect()
+            if not (conn.retry_on_timeout and isinstance(e, TimeoutError)):
+                raise
+            await conn.send_command(*args)
+            return await self.parse_response(conn, command_name, **options)
+        finally:
+            pool.release(conn)
+
+    async def parse_response(self, connection, command_name, **options):
+        response = await connection.read_response()
+        if command_name in self.response_callbacks:
+            return self.response_callbacks[command_name](response, **options)
+        return response
+
+    def ping(self):
+        return self.execute_command('PING')
+
+    def flushall(self):
+        return self.execute_command('FLUSHALL')
+
+    def pipeline(self, transaction=True):
+        """
+        Return a new pipeline object that can queue multiple commands for later execution. Queueing is
+        synchronous, only ``await pipe.execute()`` talks to the server.
+        """
+        return AsyncPipeline(self.connection_pool, self.response_callbacks, transaction)
+
+
+class AsyncPipeline(AsyncClient):
+    """
+    asyncio pipeline. Commands are queued with the usual ``exh*`` methods and sent in one write by ``execute``,
+    wrapped in MULTI/EXEC when ``transaction`` is true.
+    """
+
+    def __init__(self, connection_pool, response_callbacks, transaction):
+        self.connection_pool = connection_pool
+        self.response_callbacks = response_callbacks
+        self.transaction = transaction
+        self.reset()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def __bool__(self):
+        return True
+
+    def reset(self):
+        self.command_stack = []
+
+    def execute_command(self, *args, **options):
+        self.command_stack.append((args, options))
+        return self
+
+    async def _execute_transaction(self, connection, commands, raise_on_error):
+        cmds = chain([(('MULTI',), {})], commands, [(('EXEC',), {})])
+        await connection.send_packed_command(connection.pack_commands([args for args, _ in cmds]))
+        errors = []
+
+        try:
+            await connection.read_response()
+        except ResponseError as e:
+            errors.append((0, e))
+
+        for i, command in enumerate(commands):
+            try:
+                await connection.read_response()
+            except ResponseError as e:
+                self.annotate_exception(e, i + 1, command[0])
+                errors.append((i, e))
+
+        try:
+            response = await connection.read_response()
+        except ExecAbortError:
+            if errors:
+                raise errors[0][1]
+            raise
+
+        if response is None:
+            raise WatchError("Watched variable changed.")
+
+        for i, e in errors:
+            response.insert(i, e)
+
+        if len(response) != len(commands):
+            connection.disconnect()
+            raise ResponseError("Wrong number of response items from pipeline execution")
+
+        if raise_on_error:
+            self.raise_first_error(commands, response)
+
+        data = []
+        for r, (args, options) in zip(response, commands):
+            if not isinstance(r, Exception) and args[0] in self.response_callbacks:
+                r = self.response_callbacks[args[0]](r, **options)
+            data.append(r)
+        return data
+
+    async def _execute_pipeline(self, connection, commands, raise_on_error):
+        await connection.send_packed_command(connection.pack_commands([args for args, _ in commands]))
+
+        response = []
+        for args, options in commands:
+            try:
+                response.append(await self.parse_response(connection, args[0], **options))
+            except ResponseError as e:
+                response.append(e)
+
+        if raise_on_error:
+            self.raise_first_error(commands, response)
+        return response
+
+    def raise_first_error(self, commands, response):
+        for i, r in enumerate(response):
+            if isinstance(r, ResponseError):
+                self.annotate_exception(r, i + 1, commands[i][0])
+                raise r
+
+    def annotate_exception(self, exception, number, command):
+        cmd = ' '.join(map(str, command))
+        msg = 'Command # %d (%s) of pipeline caused error: %s' % (number, cmd, exception.args[0])
+        exception.args = (msg,) + exception.args[1:]
+
+    async def execute(self, raise_on_error=True):
+        """
+        Execute all the commands in the current pipeline.
+        """
+        stack = self.command_stack
+        if not stack:
+            return []
+        execute = self._execute_transaction if self.transaction else self._execute_pipeline
+
+        pool = self.connection_pool
+        conn = await pool.get_connection('MULTI')
+        try:
+            return await execute(conn, stack, raise_on_error)
+        except (ConnectionError, TimeoutError):
+            # queued commands may be partially applied, so they are never retried
+            conn.disconnect()
+            raise
+        finally:
+            self.reset()
+            pool.release(conn)
@@ -0,0 +1,383 @@
+"""
+Benchmarks for tairClient.
+
+    python -m tairClient.bench server --port 6379 --output new.json
+    python -m tairClient.bench micro --output micro.json
+    python -m tairClient.bench compare old.json new.json --threshold 0.1
+
+``server`` measures ops/s and per-call p50/p99 latency of the exh* commands against a running Tair, for every
+combination of the given value sizes or field counts, pipeline depths and connection counts. Its keys start with
+``tairclient-bench:`` and are deleted afterwards. ``micro`` needs no server: it times argument building, command
+packing, RESP reply parsing and the tairHash decoders. ``compare`` prints the change of every scenario found in
+both files and exits with status 1 when ops/s dropped, or p99 grew, by more than the threshold.
+"""
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+from array import array
+
+import redis
+from redis.connection import Connection, ConnectionPool, PythonParser, SocketBuffer
+
+from .client import Client, TairCommands, parse_exhgetall, parse_exhmgetwithver, parse_exhscan
+from .resp import install_packer, read_numeric_reply
+
+KEY_PREFIX = 'tairclient-bench:'
+
+
+def percentile(samples, fraction):
+    """
+    Return the ``fraction`` quantile of a sorted list, 0.0 for an empty one.
+    """
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def scenario_id(name, params):
+    return ' '.join([name] + ['%s=%s' % item for item in sorted(params.items())])
+
+
+def make_result(name, params, ops, elapsed, latencies):
+    latencies.sort()
+    return {
+        'id': scenario_id(name, params),
+        'name': name,
+        'params': params,
+        'ops': ops,
+        'ops_per_sec': ops / elapsed if elapsed else 0.0,
+        'p50_us': percentile(latencies, 0.5) * 1e6,
+        'p99_us': percentile(latencies, 0.99) * 1e6,
+    }
+
+
+# ###################################### server benchmarks ######################################################
+
+def _fields(count):
+    return ['f%d' % i for i in range(count)]
+
+
+def _fill(c, key, size):
+    c.exhmset(key, dict.fromkeys(_fields(size), b'v' * 16))
+
+
+def _fill_1000(c, key, size):
+    _fill(c, key, 1000)
+
+
+def _one_field(c, key, size):
+    c.exhset(key, 'f', b'v' * max(size, 1), ex=3600)
+
+
+# name -> (dimension, setup(client, key, size), op(client, key, size, i)). Commands writing to a field cycle over 1000 fields; exhdel empties them
+# in its first 1000 calls, the calls after that are misses
+SERVER_COMMANDS = {
+    'exhset': ('value_size', None,
+               lambda c, key, size, i: c.exhset(key, 'f%d' % (i % 1000), b'v' * size)),
+    'exhget': ('value_size', _one_field,
+               lambda c, key, size, i: c.exhget(key, 'f')),
+    'exhgetwithver': ('value_size', _one_field,
+                      lambda c, key, size, i: c.exhgetwithver(key, 'f')),
+    'exhstrlen': ('value_size', _one_field,
+                  lambda c, key, size, i: c.exhstrlen(key, 'f')),
+    'exhexists': (None, _one_field,
+                  lambda c, key, size, i: c.exhexists(key, 'f')),
+    'exhver': (None, _one_field,
+               lambda c, key, size, i: c.exhver(key, 'f')),
+    'exhttl': (None, _one_field,
+               lambda c, key, size, i: c.exhttl(key, 'f')),
+    'exhpttl': (None, _one_field,
+                lambda c, key, size, i: c.exhpttl(key, 'f')),
+    'exhsetver': (None, _one_field,
+                  lambda c, key, size, i: c.exhsetver(key, 'f', i % 1000 + 1)),
+    'exhincrby': (None, None,
+                  lambda c, key, size, i: c.exhincrby(key, 'f%d' % (i % 1000), 1)),
+    'exhincrbyfloat': (None, None,
+                       lambda c, key, size, i: c.exhincrbyfloat(key, 'f%d' % (i % 1000), 0.5)),
+    'exhexpire': (None, _fill_1000,
+                  lambda c, key, size, i: c.exhexpire(key, 'f%d' % (i % 1000), 3600)),
+    'exhpexpire': (None, _fill_1000,
+                   lambda c, key, size, i: c.exhpexpire(key, 'f%d' % (i % 1000), 3600000)),
+    'exhexpireat': (None, _fill_1000,
+                    lambda c, key, size, i: c.exhexpireat(key, 'f%d' % (i % 1000), int(time.time()) + 3600)),
+    'exhpexpireat': (None, _fill_1000,
+                     lambda c, key, size, i: c.exhpexpireat(key, 'f%d' % (i % 1000),
+                                                            int(time.time() * 1000) + 3600000)),
+    'exhdel': (None, _fill_1000,
+               lambda c, key, size, i: c.exhdel(key, 'f%d' % (i % 1000))),
+    'exhlen': ('fields', _fill,
+               lambda c, key, size, i: c.exhlen(key)),
+    'exhmset': ('fields', None,
+                lambda c, key, size, i: c.exhmset(key, dict.fromkeys(_fields(size), b'v' * 16))),
+    'exhmget': ('fields', _fill,
+                lambda c, key, size, i: c.exhmget(key, _fields(size))),
+    'exhmgetwithver': ('fields', _fill,
+                       lambda c, key, size, i: c.exhmgetwithver(key, *_fields(size))),
+    'exhkeys': ('fields', _fill,
+                lambda c, key, size, i: c.exhkeys(key)),
+    'exhvals': ('fields', _fill,
+                lambda c, key, size, i: c.exhvals(key)),
+    'exhgetall': ('fields', _fill,
+                  lambda c, key, size, i: c.exhgetall(key)),
+    'exhscan': ('fields', _fill,
+                lambda c, key, size, i: c.exhscan(key, 0, count=size)),
+}
+
+
+def run_scenario(client, name, size, depth, connections, duration):
+    dimension, setup, op = SERVER_COMMANDS[name]
+    key = KEY_PREFIX + name
+    client.delete(key)
+    if setup is not None:
+        setup(client, key, size)
+    deadline = time.perf_counter() + duration
+    latencies = []
+    counts = []
+
+    def worker():
+        local = []
+        calls = 0
+        target = client.pipeline(transaction=False) if depth > 1 else client
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            if depth > 1:
+                for j in range(depth):
+                    op(target, key, size, calls * depth + j)
+                target.execute()
+            else:
+                op(target, key, size, calls)
+            local.append(time.perf_counter() - start)
+            calls += 1
+        latencies.extend(local)
+        counts.append(calls * depth)
+
+    threads = [threading.Thread(target=worker) for _ in range(connections)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    client.delete(key)
+    params = {'depth': depth, 'connections': connections}
+    if dimension is not None:
+        params[dimension] = size
+    return make_result(name, params, sum(counts), elapsed, latencies)
+
+
+def run_server(options):
+    client = Client(host=options.host, port=options.port, password=options.password,
+                    max_connections=max(options.connections) + 1, fast_encoder=options.fast_encoder)
+    client.ping()
+    results = []
+    for name in options.commands:
+        if name not in SERVER_COMMANDS:
+            raise SystemExit('unknown command %s, choose from %s' % (name, ', '.join(SERVER_COMMANDS)))
+        dimension = SERVER_COMMANDS[name][0]
+        sizes = {'value_size': options.value_sizes, 'fields': options.fields, None: [0]}[dimension]
+        for size in sizes:
+            for depth in options.depths:
+                for connections in options.connections:
+                    result = run_scenario(client, name, size, depth, connections, options.duration)
+                    print_result(result)
+                    results.append(result)
+    return results
+
+
+# ###################################### client-only benchmarks ######################################################
+
+class ArgsRecorder(TairCommands):
+    # builds the argument tuples exactly like Client, without sending them
+    def execute_command(self, *args, **options):
+        return args
+
+
+class ReplySocket(object):
+    """
+    Endless socket-like source repeating one encoded reply, for timing the RESP parser without a server.
+    """
+
+    def __init__(self, reply):
+        self.data = reply * max(1, 65536 // len(reply))
+
+    def recv(self, size):
+        return self.data
+
+    def settimeout(self, timeout):
+        pass
+
+
+def reply_parser(reply):
+    parser = PythonParser(65536)
+    parser._buffer = SocketBuffer(ReplySocket(reply), 65536, None)
+    parser.encoder = Connection().encoder
+    return parser
+
+
+def encode_reply(value):
+    if isinstance(value, list):
+        return b'*%d\r\n' % len(value) + b''.join(encode_reply(v) for v in value)
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if value is None:
+        return b'$-1\r\n'
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def micro_cases(fields):
+    commands = ArgsRecorder()
+    plain = Connection()
+    pool = ConnectionPool()
+    install_packer(pool)
+    fast = pool.make_connection()
+    exhset_args = commands.exhset('user:1', 'field', b'v' * 32, ex=60, ver=3)
+    pipeline_args = [exhset_args] * 100
+
+    getall = []
+    for i in range(fields):
+        getall.extend([b'field:%d' % i, b'value:%d' % i])
+    withver = [[b'value:%d' % i, i] for i in range(fields)]
+    getall_parser = reply_parser(encode_reply(getall))
+    scan_parser = reply_parser(encode_reply([b'0', getall]))
+    numbers = encode_reply([b'%d.125' % i for i in range(fields)])
+    vals_parser = reply_parser(numbers)
+    vals_array_parser = reply_parser(numbers)
+
+    return [
+        ('build exhset', 1, lambda: commands.exhset('user:1', 'field', b'v' * 32, ex=60, ver=3)),
+        ('build exhincrby', 1, lambda: commands.exhincrby('user:1', 'field', 1, px=5000, maxval=100)),
+        ('build exhmset', 1, lambda: commands.exhmset('user:1', {'a': 1, 'b': 2, 'c': 3})),
+        ('pack exhset redis-py', 1, lambda: plain.pack_command(*exhset_args)),
+        ('pack exhset packer', 1, lambda: fast.pack_command(*exhset_args)),
+        ('pack pipeline100 redis-py', 100, lambda: plain.pack_commands(pipeline_args)),
+        ('pack pipeline100 packer', 100, lambda: fast.pack_commands(pipeline_args)),
+        ('parse exhgetall', fields, lambda: parse_exhgetall(getall_parser.read_response())),
+        ('parse exhscan', fields, lambda: parse_exhscan(scan_parser.read_response())),
+        ('parse exhvals float()', fields, lambda: array('d', map(float, vals_parser.read_response()))),
+        ('parse exhvals_array', fields, lambda: read_numeric_reply(vals_array_parser)),
+        ('decode exhmgetwithver', fields, lambda: parse_exhmgetwithver(withver)),
+    ]
+
+
+def run_micro(options):
+    results = []
+    for name, ops, case in micro_cases(options.fields[-1]):
+        # calibrate so one batch takes about a millisecond
+        batch = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(batch):
+                case()
+            if time.perf_counter() - start > 0.001 or batch >= 1 << 20:
+                break
+            batch *= 2
+        latencies = []
+        total = 0.0
+        for _ in range(options.rounds):
+            start = time.perf_counter()
+            for _ in range(batch):
+                case()
+            elapsed = time.perf_counter() - start
+            latencies.append(elapsed / batch)
+            total += elapsed
+        result = make_result(name, {'ops_per_call': ops}, ops * batch * options.rounds, total, latencies)
+        print_result(result)
+        results.append(result)
+    return results
+
+
+# ###################################### reporting ######################################################
+
+def print_result(result):
+    print('%-52s %14.0f ops/s %12.1f us p50 %12.1f us p99'
+          % (result['id'], result['ops_per_sec'], result['p50_us'], result['p99_us']))
+
+
+def save(path, mode, results):
+    report = {
+        'meta': {
+            'mode': mode,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'redis-py': redis.__version__,
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def compare(base, new, threshold):
+    """
+    Print the change of every scenario present in both reports and return the ids of the regressed ones.
+    """
+    base = {r['id']: r for r in base['results']}
+    regressions = []
+    for result in new['results']:
+        old = base.get(result['id'])
+        if old is None:
+            continue
+        ops = result['ops_per_sec'] / old['ops_per_sec'] - 1 if old['ops_per_sec'] else 0.0
+        p99 = result['p99_us'] / old['p99_us'] - 1 if old['p99_us'] else 0.0
+        regressed = ops < -threshold or p99 > threshold
+        if regressed:
+            regressions.append(result['id'])
+        print('%-52s %+8.1f%% ops/s %+8.1f%% p99 %s'
+              % (result['id'], ops * 100, p99 * 100, 'REGRESSION' if regressed else ''))
+    return regressions
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tairClient.bench', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='mode')
+    server = sub.add_parser('server', help='exh* commands against a running server')
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=6379)
+    server.add_argument('--password', default=None)
+    server.add_argument('--commands', type=lambda v: v.split(','), default=list(SERVER_COMMANDS))
+    server.add_argument('--value-sizes', type=int_list, default=[16, 1024, 16384])
+    server.add_argument('--fields', type=int_list, default=[10, 100, 1000])
+    server.add_argument('--depths', type=int_list, default=[1, 16, 128])
+    server.add_argument('--connections', type=int_list, default=[1, 8])
+    server.add_argument('--duration', type=float, default=1.0, help='seconds per scenario')
+    server.add_argument('--fast-encoder', action='store_true', help='use Client(fast_encoder=True)')
+    server.add_argument('--output', help='write the results to this JSON file')
+    micro = sub.add_parser('micro', help='client-only costs, no server needed')
+    micro.add_argument('--fields', type=int_list, default=[1000], help='reply size of the parsing cases')
+    micro.add_argument('--rounds', type=int, default=200)
+    micro.add_argument('--output', help='write the results to this JSON file')
+    diff = sub.add_parser('compare', help='compare two JSON result files')
+    diff.add_argument('base')
+    diff.add_argument('new')
+    diff.add_argument('--threshold', type=float, default=0.1, help='allowed relative change, 0.1 for 10%%')
+    options = parser.parse_args(argv)
+
+    if options.mode == 'compare':
+        with open(options.base) as f:
+            base = json.load(f)
+        with open(options.new) as f:
+            new = json.load(f)
+        return 1 if compare(base, new, options.threshold) else 0
+    if options.mode == 'server':
+        results = run_server(options)
+    elif options.mode == 'micro':
+        results = run_micro(options)
+    else:
+        parser.print_help()
+        return 2
+    if options.output:
+        save(options.output, options.mode, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
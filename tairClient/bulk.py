@@ -0,0 +1,166 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+# exhset keyword options an entry may carry
+ENTRY_OPTIONS = ('ex', 'exat', 'px', 'pxat', 'nx', 'xx', 'ver', 'abs', 'noactive')
+
+
+def entry_parts(entry):
+    """
+    Split a bulk entry, ``(key, field, value)`` or ``(key, field, value, options)`` with ``options`` a dict of
+    exhset keyword options, into its parts. Empty options count as none.
+    """
+    if len(entry) == 3:
+        return entry[0], entry[1], entry[2], None
+    name, field, value, options = entry
+    if options:
+        unknown = set(options).difference(ENTRY_OPTIONS)
+        if unknown:
+            raise ValueError('unknown exhset options %s' % ', '.join(sorted(unknown)))
+    return name, field, value, options or None
+
+
+def plan_commands(entries):
+    """
+    Turn a chunk of entries into commands, as (method, args, kwargs, entries) tuples. Entries without options are
+    merged into one EXHMSET per key; an entry with options becomes its own EXHSET and ends the key's EXHMSET, so
+    that writes to the same field keep their order.
+    """
+    commands = []
+    open_mappings = {}
+    for entry in entries:
+        name, field, value, options = entry_parts(entry)
+        if options is not None:
+            open_mappings.pop(name, None)
+            commands.append(('exhset', (name, field, value), options, [entry]))
+            continue
+        command = open_mappings.get(name)
+        if command is None:
+            command = ('exhmset', (name, {}), {}, [])
+            open_mappings[name] = command
+            commands.append(command)
+        command[1][1][field] = value
+        command[3].append(entry)
+    return commands
+
+
+class BulkWriter(object):
+    """
+    Writes an iterable of entries in chunks of ``chunk_size``, each chunk as one non-transactional pipeline. At
+    most ``max_in_flight`` chunks are built or being sent at a time; reading the iterable pauses until one of
+    them completes, so memory stays bounded whatever the input size. Used by
+    :meth:`tairClient.client.Client.exhset_bulk`.
+    """
+
+    def __init__(self, client, chunk_size=1000, max_in_flight=4, on_error=None, max_errors=100):
+        if chunk_size < 1 or max_in_flight < 1:
+            raise ValueError('chunk_size and max_in_flight must be positive')
+        self.client = client
+        self.chunk_size = chunk_size
+        self.max_in_flight = max_in_flight
+        self.on_error = on_error
+        self.max_errors = max_errors
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._reset()
+
+    def _reset(self):
+        self.items = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.commands = 0
+        self.errors = []
+
+    def write(self, entries):
+        """
+        Write all entries and return the report, see :meth:`report`. An exception raised while writing a chunk,
+        e.g. by ``on_error``, stops reading the entries and is raised once the chunks in flight are done.
+        """
+        self._reset()
+        start = monotonic()
+        futures = []
+        with ThreadPoolExecutor(self.max_in_flight, thread_name_prefix='tair-bulk') as executor:
+            chunk = []
+            for entry in entries:
+                chunk.append(entry)
+                if len(chunk) >= self.chunk_size:
+                    self._submit(executor, chunk, futures)
+                    chunk = []
+            if chunk:
+                self._submit(executor, chunk, futures)
+        for future in futures:
+            future.result()
+        return self.report(monotonic() - start)
+
+    def _submit(self, executor, chunk, futures):
+        self._slots.acquire()
+        try:
+            future = executor.submit(self._write_chunk, chunk)
+        except BaseException:
+            self._slots.release()
+            raise
+        # completed chunks are checked as we go, so the list stays about max_in_flight long
+        pending = []
+        for f in futures:
+            if f.done():
+                f.result()
+            else:
+                pending.append(f)
+        pending.append(future)
+        futures[:] = pending
+
+    def _write_chunk(self, chunk):
+        try:
+            try:
+                commands = plan_commands(chunk)
+            except Exception as e:
+                # one malformed entry makes it impossible to tell which of the others are well formed
+                self._record(chunk, [(entry, e) for entry in chunk], 0)
+                return
+            pipe = self.client.pipeline(transaction=False)
+            for method, args, kwargs, _ in commands:
+                getattr(pipe, method)(*args, **kwargs)
+            try:
+                replies = pipe.execute(raise_on_error=False)
+            except Exception as e:
+                replies = [e] * len(commands)
+            failures = []
+            for (_, _, _, entries), reply in zip(commands, replies):
+                if isinstance(reply, Exception):
+                    failures.extend((entry, reply) for entry in entries)
+            self._record(chunk, failures, len(commands))
+        finally:
+            self._slots.release()
+
+    def _record(self, chunk, failures, commands):
+        with self._lock:
+            self.items += len(chunk)
+            self.written += len(chunk) - len(failures)
+            self.failed += len(failures)
+            self.batches += 1
+            self.commands += commands
+            room = self.max_errors - len(self.errors)
+            if room > 0:
+                self.errors.extend(failures[:room])
+        if self.on_error is not None:
+            for entry, error in failures:
+                self.on_error(entry, error)
+
+    def report(self, elapsed):
+        """
+        :return: dict with the number of entries read, written and failed, the pipelines and commands sent, the
+                 elapsed seconds, entries per second, and the first ``max_errors`` failures as (entry, error) pairs
+        """
+        with self._lock:
+            return {
+                'items': self.items,
+                'written': self.written,
+                'failed': self.failed,
+                'batches': self.batches,
+                'commands': self.commands,
+                'elapsed': elapsed,
+                'items_per_sec': self.items / elapsed if elapsed else 0.0,
+                'errors': list(self.errors),
+            }
@@ -0,0 +1,379 @@
+import logging
+import threading
+from collections import OrderedDict
+from itertools import islice
+from time import monotonic, time
+
+from redis._compat import nativestr
+from redis.connection import Encoder
+from redis.exceptions import ConnectionError, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+# rough per-entry bookkeeping cost (tuple key, entry list, dict slots) added to the payload size
+ENTRY_OVERHEAD = 200
+# number of least recently used entries compared when the LFU policy picks a victim
+LFU_SAMPLES = 8
+
+
+def _payload_size(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_payload_size(v) for v in value)
+    return 16
+
+
+class NearCache(object):
+    """
+    Bounded in-process cache of TairHash field replies, used by :meth:`tairClient.client.Client.enable_near_cache`.
+
+    Entries are keyed by (hash's key, field) and evicted by LRU, or by LFU among the ``LFU_SAMPLES`` least recently
+    used entries, once ``max_entries`` or ``max_bytes`` is exceeded. Every entry carries a deadline that is never
+    later than the field's server TTL, and never later than ``max_ttl`` seconds after it was filled when that is set.
+
+    Fills race with invalidations: a reader takes a ``token()`` before asking the server, and ``put`` drops the
+    reply when the field was invalidated after that token was taken. Written values race with other writes, see
+    ``put_written``.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, policy='lru', max_ttl=None):
+        """
+        :param max_entries: maximum number of cached fields
+        :param max_bytes: approximate memory cap for the cached values
+        :param policy: 'lru' or 'lfu'
+        :param max_ttl: upper bound in seconds on how long an entry is served, None for no bound. Without
+                        CLIENT TRACKING this bounds how stale a field changed by another client can be.
+        """
+        if policy not in ('lru', 'lfu'):
+            raise ValueError("policy must be 'lru' or 'lfu'")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.max_ttl = max_ttl
+        self.encoder = Encoder('utf-8', 'strict', False)
+        self._lock = threading.Lock()
+        # (name, field) -> [value, withver, deadline, size, hits]
+        self._entries = OrderedDict()
+        # name -> set of cached fields, for key-level invalidation
+        self._names = {}
+        # (name, field) or name -> epoch of its last invalidation; bounded by ``_floor``
+        self._stamps = {}
+        self._floor = 0
+        self._epoch = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, name, field):
+        encode = self.encoder.encode
+        return encode(name), encode(field)
+
+    def get(self, name, field, withver=False):
+        """
+        Return ``(True, reply)`` for a live entry, ``(False, None)`` otherwise. With ``withver`` only entries
+        that hold the EXHGETWITHVER reply are hits.
+        """
+        key = self._key(name, field)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] is not None and entry[2] <= monotonic():
+                    self._remove(key)
+                elif not withver or entry[1] is not None:
+                    self._entries.move_to_end(key)
+                    entry[4] += 1
+                    self.hits += 1
+                    return True, entry[1] if withver else entry[0]
+            self.misses += 1
+            return False, None
+
+    def token(self):
+        """
+        Return the fill token to pass to ``put`` for a reply requested from now on.
+        """
+        return self._epoch
+
+    def put(self, name, field, value, pttl, token, withver=None):
+        """
+        Cache the reply of a field.
+        :param value: the field's value, None for a field that does not exist
+        :param pttl: the field's EXHPTTL reply, -1 for no expiration and -2 for a missing field
+        :param token: ``token()`` taken before the reply was requested
+        :param withver: the EXHGETWITHVER reply, if known
+        :return: True when the entry was stored
+        """
+        if (value is None) != (pttl == -2) or pttl < -2 or pttl == 0:
+            return False
+        now = monotonic()
+        deadline = now + pttl / 1000.0 if pttl > 0 else None
+        if self.max_ttl is not None and (deadline is None or deadline > now + self.max_ttl):
+            deadline = now + self.max_ttl
+        return self._store(name, field, value, deadline, token, withver)
+
+    def put_written(self, args, token):
+        """
+        Cache the value of a successful EXHSET that carried an expiration, so the field's deadline is known
+        without asking the server, and invalidate the field otherwise. ``args`` is the full command, name included,
+        and ``token`` what ``invalidate`` returned for the field before the write was sent.
+
+        Two writes of the same field may be answered in another order than the server applied them, so the value
+        is only cached when neither the field nor its key was invalidated since ``token``, by another write or
+        otherwise.
+        """
+        name, field, value = args[1], args[2], args[3]
+        deadline = write_deadline(args)
+        key = self._key(name, field)
+        # other values are deserialized by a codec, and reads return a new object each time
+        cacheable = deadline is not None and isinstance(value, (bytes, str, int, float))
+        if cacheable:
+            if self.max_ttl is not None:
+                deadline = min(deadline, monotonic() + self.max_ttl)
+            value = self.encoder.decode(self.encoder.encode(value))
+            size = _payload_size(value) + len(key[0]) + len(key[1]) + ENTRY_OVERHEAD
+        with self._lock:
+            current = self._stamps.get(key) == token and self._stamps.get(key[0], -1) < token
+            # a new stamp drops the fills of reads sent before the write was applied
+            self._stamp(key)
+            self._remove(key)
+            if not (cacheable and current):
+                return False
+            return self._insert(key, value, None, deadline, size)
+
+    def _store(self, name, field, value, deadline, token, withver):
+        key = self._key(name, field)
+        size = _payload_size(value) + _payload_size(withver) + len(key[0]) + len(key[1]) + ENTRY_OVERHEAD
+        with self._lock:
+            if token < self._floor or self._stamps.get(key, -1) > token or self._stamps.get(key[0], -1) > token:
+                return False
+            return self._insert(key, value, withver, deadline, size)
+
+    def _insert(self, key, value, withver, deadline, size):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = [value, withver, deadline, size, 0]
+        self._names.setdefault(key[0], set()).add(key[1])
+        self.bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._remove(self._victim(key))
+            self.evictions += 1
+        return key in self._entries
+
+    def _victim(self, new_key):
+        if self.policy == 'lru' or len(self._entries) == 1:
+            return next(iter(self._entries))
+        # the entry being stored has no hits yet, so it is never the LFU victim
+        candidates = ((k, e) for k, e in self._entries.items() if k != new_key)
+        return min(islice(candidates, LFU_SAMPLES), key=lambda item: item[1][4])[0]
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry[3]
+        fields = self._names.get(key[0])
+        if fields is not None:
+            fields.discard(key[1])
+            if not fields:
+                del self._names[key[0]]
+
+    def _stamp(self, key):
+        self._epoch += 1
+        self._stamps[key] = self._epoch
+        if len(self._stamps) > max(self.max_entries, 1024):
+            # forget old stamps, rejecting every fill that started before now instead
+            self._stamps.clear()
+            self._floor = self._epoch
+
+    def invalidate(self, name, field=None):
+        """
+        Drop one field, or every field of the hash when ``field`` is None. Returns the epoch of the invalidation.
+        """
+        name = self.encoder.encode(name)
+        with self._lock:
+            self.invalidations += 1
+            if field is None:
+                self._stamp(name)
+                for f in list(self._names.get(name, ())):
+                    self._remove((name, f))
+            else:
+                key = (name, self.encoder.encode(field))
+                self._stamp(key)
+                self._remove(key)
+            return self._epoch
+
+    def invalidate_command(self, args):
+        """
+        Drop the fields a write command touches. ``args`` is the full command, name included.
+        """
+        command = nativestr(args[0]).upper()
+        fields = WRITE_COMMAND_FIELDS.get(command)
+        if fields is None or len(args) < 2:
+            return
+        if fields == 'all':
+            self.invalidate(args[1])
+        elif fields == 'one':
+            self.invalidate(args[1], args[2])
+        elif fields == 'rest':
+            for field in args[2:]:
+                self.invalidate(args[1], field)
+        elif fields == 'pairs':
+            for field in args[2::2]:
+                self.invalidate(args[1], field)
+        elif fields == 'keys':
+            # a script may write any field of the keys it is given
+            for name in args[3:3 + int(args[2])]:
+                self.invalidate(name)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._names.clear()
+            self._stamps.clear()
+            self._epoch += 1
+            self._floor = self._epoch
+            self.bytes = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+# how the fields touched by a write command are found in its arguments
+WRITE_COMMAND_FIELDS = {
+    'EXHSET': 'one',
+    'EXHSETVER': 'one',
+    'EXHINCRBY': 'one',
+    'EXHINCRBYFLOAT': 'one',
+    'EXHEXPIRE': 'one',
+    'EXHPEXPIRE': 'one',
+    'EXHEXPIREAT': 'one',
+    'EXHPEXPIREAT': 'one',
+    'EXHPERSIST': 'one',
+    'EXHMSET': 'pairs',
+    'EXHDEL': 'rest',
+    'DEL': 'all',
+    'UNLINK': 'all',
+    'EXPIRE': 'all',
+    'PEXPIRE': 'all',
+    'EXPIREAT': 'all',
+    'PEXPIREAT': 'all',
+    'EVAL': 'keys',
+    'EVALSHA': 'keys',
+}
+
+
+def write_deadline(args):
+    """
+    Return the ``time.monotonic()`` deadline an EXHSET's EX/PX/EXAT/PXAT option sets, or None.
+    """
+    for i in range(4, len(args) - 1):
+        token = nativestr(args[i]).upper() if isinstance(args[i], (str, bytes)) else None
+        if token == 'EX':
+            return monotonic() + int(args[i + 1])
+        if token == 'PX':
+            return monotonic() + int(args[i + 1]) / 1000.0
+        if token == 'EXAT':
+            return monotonic() + int(args[i + 1]) - time()
+        if token == 'PXAT':
+            return monotonic() + int(args[i + 1]) / 1000.0 - time()
+    return None
+
+
+class InvalidationListener(threading.Thread):
+    """
+    Keeps a NearCache in sync with writes made by other clients using CLIENT TRACKING in broadcasting mode.
+    One connection subscribes to ``__redis__:invalidate`` and a second one enables tracking with REDIRECT to it,
+    so keys modified on the server invalidate every cached field of that key. When either connection is lost, or
+    the server answers with an error, the cache is cleared, because messages may have been missed, and both
+    connections are re-established every ``retry_interval`` seconds until that succeeds.
+    """
+
+    def __init__(self, connection_pool, cache, prefixes=None, ping_interval=10, retry_interval=1):
+        threading.Thread.__init__(self, name='tair-near-cache-invalidation', daemon=True)
+        self.connection_pool = connection_pool
+        self.cache = cache
+        self.prefixes = prefixes or ()
+        self.ping_interval = ping_interval
+        self.retry_interval = retry_interval
+        self._stopped = threading.Event()
+        self._subscriber = None
+        self._control = None
+        self.connect()
+
+    def _new_connection(self):
+        pool = self.connection_pool
+        connection = pool.connection_class(**pool.connection_kwargs)
+        connection.connect()
+        return connection
+
+    def connect(self):
+        self.close_connections()
+        self._subscriber = subscriber = self._new_connection()
+        subscriber.send_command('CLIENT', 'ID')
+        client_id = subscriber.read_response()
+        subscriber.send_command('SUBSCRIBE', '__redis__:invalidate')
+        subscriber.read_response()
+
+        self._control = control = self._new_connection()
+        pieces = ['CLIENT', 'TRACKING', 'ON', 'REDIRECT', client_id, 'BCAST']
+        for prefix in self.prefixes:
+            pieces.extend(['PREFIX', prefix])
+        control.send_command(*pieces)
+        control.read_response()
+
+    def close_connections(self):
+        for connection in (self._subscriber, self._control):
+            if connection is not None:
+                connection.disconnect()
+        self._subscriber = self._control = None
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        next_ping = monotonic() + self.ping_interval
+        while not self._stopped.is_set():
+            try:
+                if self._subscriber is None:
+                    self.connect()
+                if self._subscriber.can_read(timeout=1):
+                    self.handle(self._subscriber.read_response())
+                if monotonic() >= next_ping:
+                    self._control.send_command('PING')
+                    self._control.read_response()
+                    next_ping = monotonic() + self.ping_interval
+            except Exception as e:
+                # a dead listener would leave entries that are never invalidated, so it retries whatever failed
+                if not isinstance(e, (ConnectionError, TimeoutError, OSError)):
+                    logger.warning('near cache invalidation failed, reconnecting', exc_info=True)
+                self.cache.clear()
+                self.close_connections()
+                self._stopped.wait(self.retry_interval)
+        self.close_connections()
+
+    def handle(self, message):
+        if not isinstance(message, list) or len(message) != 3 or nativestr(message[0]) != 'message':
+            return
+        keys = message[2]
+        if keys is None:
+            # FLUSHALL/FLUSHDB or the server dropped tracking state
+            self.cache.clear()
+            return
+        for key in keys:
+            self.cache.invalidate(key)
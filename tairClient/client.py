@@ -1,20 +1,133 @@
 from datetime import datetime, timedelta
-from redis.client import Redis, Pipeline
+from functools import partial
+from time import perf_counter
+from redis.client import EMPTY_RESPONSE, Redis, Pipeline, dict_merge
 
 from redis._compat import iteritems
 
 from redis.client import list_or_args
 from redis.exceptions import (
     DataError,
+    RedisError,
+    ResponseError,
+    TimeoutError,
 )
 
+from .bulk import BulkWriter
+from .cache import NearCache, InvalidationListener
+from .codec import ValueCodec
+from .counters import CounterBuffer
+from .hedging import HedgePolicy
+from .metrics import CommandMetrics
+from .multiplex import EXCLUSIVE_COMMANDS, Multiplexer
+from .pool import TairConnectionPool
+from .ratelimit import RateLimiter
+from .resp import NUMERIC_ARRAY, NUMERIC_NUMPY, install_packer, iter_array_reply, numeric_array, read_numeric_array
+from .routing import READ_COMMAND_FIELDS, ReplicaRouter
+from .scan import exhscan_iter, exhscan_partitioned
+from .scripts import ScriptRegistry
+from .tracing import CommandTracer
+from .versioned import UpdateStats, exhupdate
 
-class Client(Redis):
+
+NEAR_CACHED_COMMANDS = {'EXHGET', 'EXHMGET', 'EXHGETWITHVER'}
+
+
+class FieldVersion(object):
     """
-    tairClient-py is a package that gives developers easy access to tair or tairModules. The package extends
-    redis-py's interface with Tair's API.
+    A field's value with its version, as returned by exhgetwithver and exhmgetwithver. It unpacks like the raw
+    ``[value, version]`` reply and compares equal to it, while taking 48 bytes instead of a list's 72.
+    """
+    __slots__ = ('value', 'version')
+
+    def __init__(self, value, version):
+        self.value = value
+        self.version = version
+
+    def __iter__(self):
+        yield self.value
+        yield self.version
+
+    def __getitem__(self, index):
+        return (self.value, self.version)[index]
+
+    def __len__(self):
+        return 2
+
+    def __eq__(self, other):
+        if isinstance(other, FieldVersion):
+            return self.value == other.value and self.version == other.version
+        if isinstance(other, (list, tuple)):
+            return len(other) == 2 and self.value == other[0] and self.version == other[1]
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash((self.value, self.version))
+
+    def __repr__(self):
+        return 'FieldVersion(value=%r, version=%r)' % (self.value, self.version)
+
+
+def parse_exhgetall(response, **options):
+    it = iter(response)
+    return dict(zip(it, it))
+
+
+def parse_exhscan(response, **options):
+    cursor, r = response
+    it = iter(r)
+    return cursor if options.get('raw_cursor') else int(cursor), dict(zip(it, it))
+
+
+def parse_exhgetwithver(response, **options):
+    return response and FieldVersion(*response)
+
+
+def parse_exhmgetwithver(response, **options):
+    return [r and FieldVersion(*r) for r in response]
+
+
+TAIRHASH_RESPONSE_CALLBACKS = {
+    'EXHGETALL': parse_exhgetall,
+    'EXHSCAN': parse_exhscan,
+    'EXHGETWITHVER': parse_exhgetwithver,
+    'EXHMGETWITHVER': parse_exhmgetwithver,
+}
+
+
+def parse_numeric(response, **options):
+    # replies read without read_numeric_array, e.g. in a transaction or through the multiplexer
+    typecode = options.get(NUMERIC_ARRAY)
+    if typecode is None or not isinstance(response, list):
+        return response
+    return numeric_array(response, typecode, options.get(NUMERIC_NUMPY, False))
+
+
+# kept with raw_replies, they only act on the replies of exhvals_array and exhmget_array
+NUMERIC_RESPONSE_CALLBACKS = {
+    'EXHMGET': parse_numeric,
+    'EXHVALS': parse_numeric,
+}
+
+
+def remove_tairhash_callbacks(response_callbacks):
+    for command in TAIRHASH_RESPONSE_CALLBACKS:
+        response_callbacks.pop(command, None)
+
+
+class TairCommands(object):
+    """
+    Tair's command names, argument builders and command methods. Every command method only builds the arguments and
+    returns ``self.execute_command(...)``, so the same surface is shared by the blocking and the asyncio clients.
     """
 
+    # ValueCodec applied to the values exhset and exhmset write, see Client.enable_codec
+    codec = None
+
     TAIRHASH_EXHSET = "EXHSET"
     TAIRHASH_EXHMSET = "EXHMSET"
     TAIRHASH_EXHPEXPIREAT = "EXHPEXPIREAT"
@@ -54,12 +167,6 @@ class Client(Redis):
     TAIRSTRING_EXPREPEND = "EXPREPEND"
     TAIRSTRING_EXGAE = "EXGAE"
 
-    def __init__(self, *args, **kwargs):
-        """
-        Creates a new tairHash client.
-        """
-        Redis.__init__(self, *args, **kwargs)
-
     @staticmethod
     def appendExpire(pieces, ex, exat, px, pxat):
         if ex is not None:
@@ -157,6 +264,8 @@ class Client(Redis):
         :return:
         """
 
+        if self.codec is not None:
+            value = self.codec.encode(value)
         pieces = [name, field, value]
 
         self.appendExpire(pieces, ex, exat, px, pxat)
@@ -186,8 +295,10 @@ class Client(Redis):
         if not mapping:
             raise DataError("'exhmset' with 'mapping' of length 0")
         pieces = []
-        for pair in iteritems(mapping):
-            pieces.extend(pair)
+        codec = self.codec
+        for field, value in iteritems(mapping):
+            pieces.append(field)
+            pieces.append(value if codec is None else codec.encode(value))
         return self.execute_command(self.TAIRHASH_EXHMSET, name, *pieces)
 
     def exhpexpireat(self, name, field, pxat, ver=None, abs=None, noactive=False):
@@ -485,7 +596,7 @@ class Client(Redis):
             pieces.extend(['MATCH', match])
         if count is not None:
             pieces.extend(['COUNT', count])
-        return self.execute_command(self.TAIRHASH_EXHSCAN_EE, *pieces)
+        return self.execute_command(self.TAIRHASH_EXHSCAN_EE, *pieces, raw_cursor=True)
 
     # ###################################### tairString Function ######################################################
 
@@ -698,6 +809,374 @@ class Client(Redis):
     #     self.appendExpire(pieces, ex, exat, px, pxat)
     #     return self.execute_command(self.TAIRSTRING_EXGAE, *pieces)
 
+
+class Client(TairCommands, Redis):
+    """
+    tairClient-py is a package that gives developers easy access to tair or tairModules. The package extends
+    redis-py's interface with Tair's API.
+    """
+
+    RESPONSE_CALLBACKS = dict_merge(Redis.RESPONSE_CALLBACKS, TAIRHASH_RESPONSE_CALLBACKS, NUMERIC_RESPONSE_CALLBACKS)
+
+    near_cache = None
+    _near_cache_listener = None
+    multiplexer = None
+    update_stats = None
+    script_registry = None
+    metrics = None
+    tracer = None
+    router = None
+    hedger = None
+    _plain_callbacks = None
+
+    def __init__(self, *args, **kwargs):
+        """
+        Creates a new tairHash client.
+        :param near_cache: optional NearCache put in front of exhget, exhmget and exhgetwithver
+        :param raw_replies: skip the tairHash decoders, so exhgetall and exhscan return flat lists and the
+                            withver commands return [value, version] lists as sent by the server
+        :param fast_encoder: pack commands with a CommandPacker that caches encoded command headers, option tokens
+                             and hot keys and field names. Applies to this client's pipelines too, and changes the
+                             connection class of a ``connection_pool`` passed in
+        :param pool_timeout: use a TairConnectionPool of ``max_connections`` (50 by default) connections, where a
+                             checkout waits up to this many seconds for a free connection instead of opening more.
+                             Its ``stats()`` report connections in use and idle and the time spent waiting
+        :param warm_up: open and PING this many connections now, implies a TairConnectionPool
+        :param idle_check_interval: PING connections idle for this many seconds from a background thread,
+                                    implies a TairConnectionPool
+        """
+        near_cache = kwargs.pop('near_cache', None)
+        raw_replies = kwargs.pop('raw_replies', False)
+        fast_encoder = kwargs.pop('fast_encoder', False)
+        pool_timeout = kwargs.pop('pool_timeout', None)
+        warm_up = kwargs.pop('warm_up', 0)
+        idle_check_interval = kwargs.pop('idle_check_interval', None)
+        Redis.__init__(self, *args, **kwargs)
+        self.update_stats = UpdateStats()
+        self.script_registry = ScriptRegistry(self)
+        if pool_timeout is not None or warm_up or idle_check_interval:
+            pool = self.connection_pool
+            if not isinstance(pool, TairConnectionPool):
+                if kwargs.get('connection_pool') is not None:
+                    raise DataError('pool_timeout, warm_up and idle_check_interval need a TairConnectionPool')
+                # the default pool has not opened anything yet, rebuild it with the same connection settings
+                self.connection_pool = pool = TairConnectionPool(
+                    max_connections=kwargs.get('max_connections') or 50,
+                    timeout=pool_timeout if pool_timeout is not None else 20,
+                    connection_class=pool.connection_class, **pool.connection_kwargs)
+        if fast_encoder:
+            install_packer(self.connection_pool)
+        if warm_up:
+            self.connection_pool.warm_up(warm_up)
+        if idle_check_interval:
+            self.connection_pool.start_health_checks(idle_check_interval)
+        if raw_replies:
+            remove_tairhash_callbacks(self.response_callbacks)
+        if near_cache is not None:
+            self.enable_near_cache(near_cache)
+
+    def close(self):
+        self.disable_near_cache()
+        self.disable_multiplexing()
+        self.disable_hedging()
+        self.disable_replica_reads()
+        if isinstance(self.connection_pool, TairConnectionPool):
+            self.connection_pool.stop_health_checks()
+        Redis.close(self)
+
+    def execute_command(self, *args, **options):
+        """
+        Execute a command and return a parsed response. With a near cache enabled, cached reads are answered
+        locally and writes sent through this client invalidate the fields they touch.
+        """
+        cache = self.near_cache
+        if cache is None:
+            return self._execute(*args, **options)
+        command_name = args[0]
+        if command_name in NEAR_CACHED_COMMANDS and NUMERIC_ARRAY not in options:
+            # hits and misses are recorded under the command's name, like uncached reads
+            if self.metrics is None and self.tracer is None:
+                return self._execute_cached(cache, *args, **options)
+            return self._observed(partial(self._execute_cached, cache), args, options)
+        if command_name != self.TAIRHASH_EXHSET:
+            try:
+                return self._execute(*args, **options)
+            finally:
+                cache.invalidate_command(args)
+        # the field is invalidated before the write is sent, so put_written can tell whether another write overlapped
+        token = cache.invalidate(args[1], args[2])
+        try:
+            response = self._execute(*args, **options)
+        except BaseException:
+            cache.invalidate_command(args)
+            raise
+        if response not in (0, 1):
+            cache.invalidate_command(args)
+            return response
+        if self.codec is not None:
+            args = args[:3] + (self.codec.decode(args[3]),) + args[4:]
+        cache.put_written(args, token)
+        return response
+
+    def parse_response(self, connection, command_name, **options):
+        typecode = options.get(NUMERIC_ARRAY)
+        if typecode is not None:
+            return read_numeric_array(connection, typecode, options.get(NUMERIC_NUMPY, False))
+        return Redis.parse_response(self, connection, command_name, **options)
+
+    def _execute(self, *args, **options):
+        if self.metrics is None and self.tracer is None:
+            return self._send(*args, **options)
+        return self._observed(self._send, args, options)
+
+    def _observed(self, send, args, options):
+        metrics = self.metrics
+        tracer = self.tracer
+        response = error = None
+        start = perf_counter()
+        try:
+            response = send(*args, **options)
+            return response
+        except TimeoutError as e:
+            error = e
+            if metrics is not None:
+                metrics.record_error(args[0], timeout=True)
+            raise
+        except RedisError as e:
+            error = e
+            if metrics is not None:
+                metrics.record_error(args[0])
+            raise
+        finally:
+            elapsed = perf_counter() - start
+            if metrics is not None:
+                metrics.record(args[0], elapsed)
+            if tracer is not None:
+                tracer.observe(args, response, elapsed, error)
+
+    def _send(self, *args, **options):
+        hedger = self.hedger
+        if hedger is not None and args[0] in hedger.commands:
+            return hedger.run(self._send_routed, args, options)
+        return self._send_routed(*args, **options)
+
+    def _send_routed(self, *args, **options):
+        router = self.router
+        if router is None:
+            return self._send_primary(*args, **options)
+        if args[0] in READ_COMMAND_FIELDS:
+            return router.read(self._send_primary, args, options)
+        response = self._send_primary(*args, **options)
+        router.note_write(args)
+        return response
+
+    def _send_primary(self, *args, **options):
+        multiplexer = self.multiplexer
+        if multiplexer is None or args[0] in EXCLUSIVE_COMMANDS:
+            return Redis.execute_command(self, *args, **options)
+        try:
+            response = multiplexer.submit(args).result()
+        except ResponseError:
+            if EMPTY_RESPONSE in options:
+                return options[EMPTY_RESPONSE]
+            raise
+        command_name = args[0]
+        if command_name in self.response_callbacks:
+            return self.response_callbacks[command_name](response, **options)
+        return response
+
+    def _execute_cached(self, cache, *args, **options):
+        command_name, name = args[0], args[1]
+        if command_name == self.TAIRHASH_EXHMGET:
+            return self._execute_cached_exhmget(cache, name, args[2:], **options)
+
+        field = args[2]
+        withver = command_name == self.TAIRHASH_EXHGETWITHVER
+        hit, response = cache.get(name, field, withver)
+        if hit:
+            return response
+        token = cache.token()
+        pipe = self._fill_pipeline()
+        pipe.execute_command(*args, **options)
+        pipe.exhpttl(name, field)
+        response, pttl = pipe.execute()
+        if withver:
+            cache.put(name, field, response[0] if response is not None else None, pttl, token, response)
+        else:
+            cache.put(name, field, response, pttl, token)
+        return response
+
+    def _execute_cached_exhmget(self, cache, name, fields, **options):
+        response = []
+        missing = []
+        for i, field in enumerate(fields):
+            hit, value = cache.get(name, field)
+            response.append(value)
+            if not hit:
+                missing.append(i)
+        if not missing:
+            return response
+
+        token = cache.token()
+        pipe = self._fill_pipeline()
+        pipe.execute_command(self.TAIRHASH_EXHMGET, name, *[fields[i] for i in missing], **options)
+        for i in missing:
+            pipe.exhpttl(name, fields[i])
+        replies = pipe.execute()
+        for i, value, pttl in zip(missing, replies[0], replies[1:]):
+            response[i] = value
+            cache.put(name, fields[i], value, pttl, token)
+        return response
+
+    def _fill_pipeline(self):
+        # a miss is recorded as the cached command by its caller, not as a PIPELINE
+        pipe = self.pipeline()
+        pipe.metrics = pipe.tracer = None
+        return pipe
+
+    def enable_near_cache(self, cache=None, tracking=False, prefixes=None):
+        """
+        Put an in-process cache in front of exhget, exhmget and exhgetwithver. Misses read the value and its
+        EXHPTTL in one MULTI/EXEC, so no entry outlives the field's server TTL. Writes sent through this client
+        and its pipelines invalidate the fields they touch.
+        :param cache: the NearCache to use, a default NearCache() when None
+        :param tracking: also drop entries changed by other clients, using CLIENT TRACKING in broadcasting mode
+        :param prefixes: key prefixes to track, all keys when empty
+        :return: the NearCache, whose stats() reports hits and misses
+        """
+        self.disable_near_cache()
+        cache = cache if cache is not None else NearCache()
+        cache.encoder = self.connection_pool.get_encoder()
+        if tracking:
+            listener = InvalidationListener(self.connection_pool, cache, prefixes)
+            listener.start()
+            self._near_cache_listener = listener
+        self.near_cache = cache
+        return cache
+
+    def disable_near_cache(self):
+        listener = self._near_cache_listener
+        if listener is not None:
+            listener.stop()
+            self._near_cache_listener = None
+        self.near_cache = None
+
+    def enable_multiplexing(self, connections=1, batch_window=0.0, max_batch=128):
+        """
+        Send the commands of all threads over a few shared connections instead of one pooled connection per call.
+        Commands issued at the same time go out in one write and each caller still blocks for its own reply.
+        Transactions, pipelines and commands that change or block a connection keep using the pool.
+        :param connections: number of shared connections, used round robin
+        :param batch_window: seconds a write waits for more commands after the first one, 0 to only combine the
+                             commands that queued up while the previous write was in progress
+        :param max_batch: maximum number of commands per write
+        :return: the Multiplexer, whose stats() reports the average batch size
+        """
+        self.disable_multiplexing()
+        self.multiplexer = Multiplexer(self.connection_pool, connections, batch_window, max_batch)
+        return self.multiplexer
+
+    def disable_multiplexing(self):
+        multiplexer = self.multiplexer
+        if multiplexer is not None:
+            self.multiplexer = None
+            multiplexer.close()
+
+    def enable_metrics(self, metrics=None):
+        """
+        Record the latency of every command in a per command histogram, errors and timeouts, and the size and latency
+        of pipelines. Recording costs about a microsecond per command.
+        :param metrics: the CommandMetrics to fill, a new one when None
+        :return: the CommandMetrics, whose snapshot() and prometheus() export what was recorded
+        """
+        self.metrics = metrics if metrics is not None else CommandMetrics()
+        return self.metrics
+
+    def disable_metrics(self):
+        self.metrics = None
+
+    def enable_tracing(self, tracer=None, **kwargs):
+        """
+        Record the size and duration of a sample of the commands and pipelines sent, keeping the largest and slowest.
+        :param tracer: the CommandTracer to use, a new one built from ``kwargs`` (sample_rate, top_n, slow_threshold,
+                       callback) when None
+        :return: the CommandTracer, whose largest() and slowest() list the top records
+        """
+        tracer = tracer if tracer is not None else CommandTracer(**kwargs)
+        tracer.encoder = self.connection_pool.get_encoder()
+        self.tracer = tracer
+        return tracer
+
+    def disable_tracing(self):
+        self.tracer = None
+
+    def enable_replica_reads(self, replicas, read_your_writes=False, max_lag=1.0, retry_interval=5.0):
+        """
+        Send the read-only exh* commands (exhget, exhmget, exhgetall, exhscan, exhttl, ...) to replicas, each to the
+        one with the fewest requests in flight. Writes, other commands, transactions and pipelines stay on the
+        primary. A replica that fails is skipped for ``retry_interval`` seconds and the read goes to the primary.
+        :param replicas: (host, port) of each replica; the other connection settings are the primary's
+        :param read_your_writes: send the reads of fields and keys written through this client to the primary for
+                                 up to ``max_lag`` seconds, or until a replica returns the version the write set
+        :param max_lag: seconds a replica is assumed to need to apply a write
+        :return: the ReplicaRouter, whose stats() reports the reads each replica served and those sent to the primary
+        """
+        self.disable_replica_reads()
+        self.router = ReplicaRouter(self, replicas, read_your_writes, max_lag, retry_interval)
+        return self.router
+
+    def disable_replica_reads(self):
+        router = self.router
+        if router is not None:
+            self.router = None
+            router.close()
+
+    def enable_hedging(self, policy=None, **kwargs):
+        """
+        Hedge idempotent reads (exhget, exhmget, exhgetwithver, exhmgetwithver): a read not answered within the
+        policy's threshold is sent again over another connection, or to another replica with replica reads enabled,
+        and the first reply is returned. Pipelines and cached reads are not hedged.
+        :param policy: the HedgePolicy to use, a new one built from ``kwargs`` (threshold, percentile, budget, ...)
+                       when None
+        :return: the HedgePolicy, whose stats() reports the hedge rate and the hedges that answered first
+        """
+        self.disable_hedging()
+        self.hedger = policy if policy is not None else HedgePolicy(**kwargs)
+        return self.hedger
+
+    def disable_hedging(self):
+        hedger = self.hedger
+        if hedger is not None:
+            self.hedger = None
+            hedger.close()
+
+    def enable_codec(self, codec=None, **kwargs):
+        """
+        Encode the values written by exhset and exhmset, compressing the large ones, and decode them transparently
+        in exhget, exhmget, exhgetall, exhvals, exhscan, exhgetwithver and exhmgetwithver, including in pipelines.
+        Ints, floats and small values are written unchanged, so exhincrby counters keep working.
+        :param codec: the ValueCodec to use, a new one built from ``kwargs`` (threshold, compressor, serializer,
+                      decompressors) when None
+        :return: the ValueCodec, whose stats() reports the compression ratio
+        """
+        encoder = self.connection_pool.get_encoder()
+        if encoder.decode_responses:
+            raise DataError('a value codec needs decode_responses=False')
+        self.disable_codec()
+        codec = codec if codec is not None else ValueCodec(**kwargs)
+        codec.encoder = encoder
+        self._plain_callbacks = self.response_callbacks
+        # a copy of the same type, redis-py's callbacks are a CaseInsensitiveDict
+        self.response_callbacks = type(self.response_callbacks)(self.response_callbacks)
+        codec.wrap_callbacks(self.response_callbacks)
+        self.codec = codec
+        return codec
+
+    def disable_codec(self):
+        if self.codec is not None:
+            self.codec = None
+            self.response_callbacks = self._plain_callbacks
+
     def pipeline(self, transaction=True, shard_hint=None):
         """
         Return a new pipeline object that can queue multiple commands for
@@ -708,11 +1187,370 @@ class Client(Redis):
             response_callbacks=self.response_callbacks,
             transaction=transaction,
             shard_hint=shard_hint)
+        p.invalidated_cache = self.near_cache
+        p.script_registry = self.script_registry
+        p.metrics = self.metrics
+        p.tracer = self.tracer
+        p.router = self.router
+        p.codec = self.codec
         return p
 
+    # ###################################### composite operations ##############################################
+
+    def exhget_or_set(self, name, field, value, ex=None, exat=None, px=None, pxat=None, noactive=False):
+        """
+        Return the value of a field, or set it to ``value`` with the given TTL when it does not exist and return
+        ``value``. One round trip, run as a Lua script.
+        :param name: same as hash's key
+        :param field: same as hash's field
+        :param value: value set when the field does not exist
+        :param ex: set an expire flag on field for ``ex`` seconds.
+        :param exat: Set the absolute expiration time for a field in seconds
+        :param px: set an expire flag on field for ``px`` milliseconds.
+        :param pxat: set the absolute expiration time for a field in milliseconds
+        :param noactive: Setting NOACTIVE means that the field does not use active expiration strategy
+        :return:
+        """
+        pieces = [field, value]
+        self.appendExpire(pieces, ex, exat, px, pxat)
+        self.appendNoActive(pieces, noactive)
+        return self.script_registry.run(self, 'exhget_or_set', [name], pieces)
+
+    def exhdel_if_version(self, name, field, ver):
+        """
+        Delete a field only if its version is ``ver``. One round trip, run as a Lua script.
+        :param name: same as hash's key
+        :param field: same as hash's field
+        :param ver: the version the field must have
+        :return: 1 if the field was deleted, 0 if it does not exist or has another version
+        """
+        return self.script_registry.run(self, 'exhdel_if_version', [name], [field, ver])
+
+    def exhincrby_pttl(self, name, field, digit, ex=None, exat=None, px=None, pxat=None, minval=None, maxval=None):
+        """
+        Increase the value of a field like exhincrby and return the new value together with the field's TTL in
+        milliseconds. One round trip, run as a Lua script.
+        :param name: same as hash's key
+        :param field: same as hash's field
+        :param digit: int value which will be incr for the field
+        :param ex: set an expire flag on field for ``ex`` seconds.
+        :param exat: Set the absolute expiration time for a field in seconds
+        :param px: set an expire flag on field for ``px`` milliseconds.
+        :param pxat: set the absolute expiration time for a field in milliseconds
+        :param minval: The minimum value of value. If it is less than this value, an exception will be prompted.
+        :param maxval: The maximum value of value. If it is more than this value, an exception will be prompted.
+        :return: [value, pttl], pttl being -1 for a field without TTL
+        """
+        pieces = [field, digit]
+        self.appendExpire(pieces, ex, exat, px, pxat)
+        self.appendMinVal(pieces, minval)
+        self.appendMaxVal(pieces, maxval)
+        return self.script_registry.run(self, 'exhincrby_pttl', [name], pieces)
+
+    def exhmove(self, source, destination, field):
+        """
+        Move a field with its value and remaining TTL from one TairHash to another, overwriting the destination's
+        field. The version is not kept. One round trip, run as a Lua script; on a cluster both keys must be in the
+        same slot, e.g. by sharing a {hash tag}.
+        :param source: hash's key the field is taken from
+        :param destination: hash's key the field is written to
+        :param field: same as hash's field
+        :return: 1 if the field was moved, 0 if it does not exist in ``source``
+        """
+        return self.script_registry.run(self, 'exhmove', [source, destination], [field])
+
+    # ###################################### numeric arrays ######################################################
+
+    def exhvals_array(self, name, typecode='d', as_numpy=False):
+        """
+        Get the values of all fields in TairHash specified by key, decoded as numbers straight from the reply.
+        :param name: same as hash's key
+        :param typecode: array typecode of the values, 'd' for floats, 'q' for 64-bit integers
+        :param as_numpy: return NumPy arrays instead of array.array and bytearray
+        :return: (values, mask), mask is 1 where a value is missing
+        """
+        return self.execute_command(self.TAIRHASH_EXHVALS, name, numeric_array=typecode, as_numpy=as_numpy)
+
+    def exhmget_array(self, name, fields, typecode='d', as_numpy=False):
+        """
+        Get the values of many fields in TairHash specified by key, decoded as numbers straight from the reply.
+        :param name: same as hash's key
+        :param fields: list of fields
+        :param typecode: array typecode of the values, 'd' for floats, 'q' for 64-bit integers
+        :param as_numpy: return NumPy arrays instead of array.array and bytearray
+        :return: (values, mask) in the order of ``fields``, mask is 1 where a field does not exist; the missing
+                 values are NaN in float arrays and 0 in integer ones
+        """
+        return self.execute_command(self.TAIRHASH_EXHMGET, name, *fields,
+                                    numeric_array=typecode, as_numpy=as_numpy)
+
+    # ###################################### streamed replies ######################################################
+
+    def exhgetall_stream(self, name):
+        """
+        Yield the (field, value) pairs of a TairHash while the EXHGETALL reply is received, instead of building one
+        list and dict of the whole hash. Unlike exhscan_iter, the server still sends the hash in one reply.
+        The connection is held until the reply is consumed; an iterator closed early disconnects it.
+        :param name: same as hash's key
+        """
+        return self._stream(self.TAIRHASH_EXHGETALL, name, pairs=True)
+
+    def exhkeys_stream(self, name):
+        """
+        Yield the fields of a TairHash while the EXHKEYS reply is received, see exhgetall_stream.
+        :param name: same as hash's key
+        """
+        return self._stream(self.TAIRHASH_EXHKEYS, name, values=False)
+
+    def exhvals_stream(self, name):
+        """
+        Yield the values of a TairHash while the EXHVALS reply is received, see exhgetall_stream.
+        :param name: same as hash's key
+        """
+        return self._stream(self.TAIRHASH_EXHVALS, name)
+
+    def _stream_pool(self, args):
+        return self.connection_pool
+
+    def _stream(self, command, name, pairs=False, values=True):
+        pool = self._stream_pool((command, name))
+        connection = pool.get_connection(command)
+        drained = False
+        try:
+            connection.send_command(command, name)
+            items = iter_array_reply(connection._parser)
+            decode = self.codec.decode if self.codec is not None and values else None
+            if pairs:
+                for field in items:
+                    value = next(items)
+                    yield field, value if decode is None else decode(value)
+            elif decode is not None:
+                for value in items:
+                    yield decode(value)
+            else:
+                for item in items:
+                    yield item
+            drained = True
+        except ResponseError:
+            # an error reply was read whole
+            drained = True
+            raise
+        finally:
+            if not drained:
+                # the rest of the reply is still on its way: drop the connection rather than read it all
+                connection.disconnect()
+            pool.release(connection)
+
+    # ###################################### batch helpers ######################################################
+
+    def exhmget_batch(self, mapping, withver=False, chunk_size=1000):
+        """
+        Get fields from many TairHash keys at once. One EXHMGET (or EXHMGETWITHVER) per key is queued in a
+        non-transactional pipeline, and a new pipeline round trip is started whenever ``chunk_size`` fields
+        have been queued, so the reply size stays bounded.
+        :param mapping: dict of hash's key -> list of fields
+        :param withver: use EXHMGETWITHVER, every value becomes a FieldVersion
+        :param chunk_size: maximum number of fields requested per round trip
+        :return: dict of hash's key -> dict of field -> value, missing fields map to None
+        """
+        command = 'exhmgetwithver' if withver else 'exhmget'
+        result = {}
+        batch = []
+        queued = 0
+        for name, fields in iteritems(mapping):
+            fields = list_or_args(fields, [])
+            if not fields:
+                result[name] = {}
+                continue
+            batch.append((name, fields))
+            queued += len(fields)
+            if queued >= chunk_size:
+                self._exhmget_chunk(command, batch, result)
+                batch = []
+                queued = 0
+        if batch:
+            self._exhmget_chunk(command, batch, result)
+        return result
+
+    def _exhmget_chunk(self, command, batch, result):
+        pipe = self.pipeline(transaction=False)
+        for name, fields in batch:
+            getattr(pipe, command)(name, fields)
+        for (name, fields), values in zip(batch, pipe.execute()):
+            result[name] = dict(zip(fields, values))
+
+    def exhexpire_many(self, mapping, ex=None, ver=None, abs=None, noactive=False, chunk_size=1000,
+                       failures_only=False):
+        """
+        Set the relative expiration time, in seconds, of many fields with EXHEXPIRE commands sent in
+        non-transactional pipelines of ``chunk_size`` commands.
+        :param mapping: dict of hash's key -> list of fields, which all get ``ex``, or hash's key -> dict of
+                        field -> seconds for a TTL per field
+        :param ex: seconds applied to the fields given as lists
+        :param ver: set the field's version
+        :param abs: set the absolute field's version
+        :param noactive: Setting NOACTIVE means that the field does not use active expiration strategy
+        :param chunk_size: commands per round trip
+        :param failures_only: only report the fields that were not updated
+        :return: dict of hash's key -> dict of field -> 1 when updated, 0 when the field does not exist, or the
+                 ResponseError of the command; keys without a reported field are left out
+        """
+        return self._expire_many('exhexpire', mapping, ex, ver, abs, noactive, chunk_size, failures_only)
+
+    def exhpexpire_many(self, mapping, px=None, ver=None, abs=None, noactive=False, chunk_size=1000,
+                        failures_only=False):
+        """
+        Like exhexpire_many, in milliseconds, with EXHPEXPIRE.
+        """
+        return self._expire_many('exhpexpire', mapping, px, ver, abs, noactive, chunk_size, failures_only)
+
+    def exhexpireat_many(self, mapping, exat=None, ver=None, abs=None, noactive=False, chunk_size=1000,
+                         failures_only=False):
+        """
+        Like exhexpire_many, with an absolute expiration time in seconds, with EXHEXPIREAT.
+        """
+        return self._expire_many('exhexpireat', mapping, exat, ver, abs, noactive, chunk_size, failures_only)
+
+    def exhpexpireat_many(self, mapping, pxat=None, ver=None, abs=None, noactive=False, chunk_size=1000,
+                          failures_only=False):
+        """
+        Like exhexpire_many, with an absolute expiration time in milliseconds, with EXHPEXPIREAT.
+        """
+        return self._expire_many('exhpexpireat', mapping, pxat, ver, abs, noactive, chunk_size, failures_only)
+
+    def _expire_many(self, command, mapping, default, ver, abs, noactive, chunk_size, failures_only):
+        result = {}
+        batch = []
+        for name, fields in iteritems(mapping):
+            if isinstance(fields, dict):
+                batch.extend((name, field, value) for field, value in iteritems(fields))
+            else:
+                if default is None:
+                    raise DataError("'%s_many' needs a TTL for the fields of %r" % (command, name))
+                batch.extend((name, field, default) for field in list_or_args(fields, []))
+            while len(batch) >= chunk_size:
+                self._expire_chunk(command, batch[:chunk_size], ver, abs, noactive, failures_only, result)
+                del batch[:chunk_size]
+        if batch:
+            self._expire_chunk(command, batch, ver, abs, noactive, failures_only, result)
+        return result
+
+    def _expire_chunk(self, command, batch, ver, abs, noactive, failures_only, result):
+        pipe = self.pipeline(transaction=False)
+        for name, field, value in batch:
+            getattr(pipe, command)(name, field, value, ver=ver, abs=abs, noactive=noactive)
+        for (name, field, _), reply in zip(batch, pipe.execute(raise_on_error=False)):
+            if failures_only and reply == 1:
+                continue
+            result.setdefault(name, {})[field] = reply
+
+    def exhset_bulk(self, entries, chunk_size=1000, max_in_flight=4, on_error=None, max_errors=100):
+        """
+        Load a stream of fields into TairHash keys. Entries are read lazily and written in non-transactional
+        pipelines of ``chunk_size`` entries: plain entries of the same key become one EXHMSET, entries with options
+        an EXHSET each. A failed command fails only the entries it carried; the load goes on.
+        :param entries: iterable of ``(key, field, value)`` or ``(key, field, value, options)`` tuples, ``options``
+                        being a dict of exhset keyword options such as ``{'ex': 60, 'ver': 3}``
+        :param chunk_size: entries per pipeline
+        :param max_in_flight: pipelines sent at once, each on its own pooled connection. Reading ``entries`` waits
+                              while that many are pending
+        :param on_error: called as ``on_error(entry, error)`` for every failed entry, from a worker thread
+        :param max_errors: number of failures kept in the report
+        :return: dict with items, written, failed, batches, commands, elapsed, items_per_sec and errors
+        """
+        writer = BulkWriter(self, chunk_size=chunk_size, max_in_flight=max_in_flight, on_error=on_error,
+                            max_errors=max_errors)
+        return writer.write(entries)
+
+    def exhupdate(self, name, fields, func, max_attempts=10, backoff=0.001, max_backoff=0.1):
+        """
+        Read-modify-write fields of the TairHash specified by the key with optimistic version checks. Each round
+        reads the pending fields with one EXHMGETWITHVER, calls ``func(field, value)`` for each, and writes the
+        results back in one pipeline of EXHSET guarded by the version read, or by NX for fields that did not exist.
+        Fields whose guard failed are read and computed again in the next round, after a jittered exponential
+        backoff; the others are done. ``update_stats.stats()`` reports the conflict rate of all calls.
+        :param name: same as hash's key
+        :param fields: fields to update
+        :param func: called with the field and its current value, None when missing, returns the new value or
+                     None to leave the field unchanged. It may be called several times for the same field
+        :param max_attempts: rounds before giving up with a VersionConflictError
+        :param backoff: seconds of the first backoff, doubled every round
+        :param max_backoff: upper bound of the backoff
+        :return: dict of field -> value written
+        """
+        return exhupdate(self, name, fields, func, max_attempts=max_attempts, backoff=backoff,
+                         max_backoff=max_backoff, stats=self.update_stats)
+
+    def counter_buffer(self, interval=1.0, max_pending=10000, requeue=True, flush_at_exit=True, on_error=None):
+        """
+        Return a started CounterBuffer, which sums exhincrby and exhincrbyfloat calls per field in memory and sends
+        the totals in one pipeline every ``interval`` seconds. Increments not sent yet are lost if the process dies.
+        :param interval: seconds between flushes, the longest an increment waits before being sent
+        :param max_pending: distinct counters that trigger an early flush
+        :param requeue: keep the totals of a flush that could not reach the server for the next flush
+        :param flush_at_exit: flush at interpreter exit, in addition to ``close()``
+        :param on_error: called as ``on_error(name, field, amount, error)`` for every total dropped
+        :return: the CounterBuffer, call its incrby and incrbyfloat, and close() when done
+        """
+        return CounterBuffer(self, interval=interval, max_pending=max_pending, requeue=requeue,
+                             flush_at_exit=flush_at_exit, on_error=on_error)
+
+    def rate_limiter(self, name, limit, window, sliding=False, lease=None):
+        """
+        Return a RateLimiter admitting ``limit`` tokens per ``window`` seconds and tenant, counted in the TairHash
+        ``name``. Tokens are leased from the server in batches, so most ``acquire`` calls are answered locally.
+        :param name: same as hash's key, one field per tenant and window
+        :param limit: tokens per window
+        :param window: window length in seconds
+        :param sliding: weight in the previous window's count instead of resetting at every window start
+        :param lease: tokens taken per server call, limit // 20 by default. Larger leases mean fewer calls, and more
+                      tokens left unused by a process when its window ends
+        :return: the RateLimiter, call ``acquire(tenant, tokens=1)``
+        """
+        return RateLimiter(self, name, limit, window, sliding=sliding, lease=lease)
+
+    # ###################################### scan helpers ######################################################
+
+    def exhscan_iter(self, name, match=None, count=None, prefetch=True, **adaptive_options):
+        """
+        Iterate over the TairHash specified by the key, yielding (field, value) pairs. While a page is being
+        consumed the next one is already requested from a background thread, on a second pooled connection.
+        :param name: same as hash's key
+        :param match: Used to filter scan results.
+        :param count: fixed COUNT for every page. When None, COUNT starts at 100 and is tuned after each page
+                      so that pages take about ``target_latency`` seconds and about ``target_bytes`` bytes
+        :param prefetch: set to False to fetch pages serially on the calling thread
+        :param adaptive_options: initial, minimum, maximum, target_latency and target_bytes of the COUNT tuning
+        :return: a generator; fields changed during the scan may be yielded twice or not at all, like EXHSCAN
+        """
+        return exhscan_iter(self, name, match=match, count=count, prefetch=prefetch, **adaptive_options)
+
+    def exhscan_partitioned(self, name, partitions=None, boundaries=None, callback=None, match=None, count=1000,
+                            samples=1000, max_workers=None):
+        """
+        Scan one large TairHash as several field ranges at once, each range walked with exhscan_ee on its own
+        worker thread and pooled connection. Needs the enterprise scan of tair, and a connection pool that allows
+        at least one connection per worker.
+        :param name: same as hash's key
+        :param partitions: number of ranges, os.cpu_count() by default. The split points are the quantiles of
+                           ``samples`` fields read with exhscan
+        :param boundaries: sorted split points to use instead of sampling, n points give n + 1 ranges
+        :param callback: called as ``callback(partition, items)`` from the worker threads with every page of a
+                         range, ``items`` being a list of (field, value) pairs in field order
+        :param match: Used to filter scan results.
+        :param count: COUNT of every exhscan_ee call
+        :param max_workers: threads and connections used, one per range by default
+        :return: with a callback, the number of fields scanned per range once all ranges are done. Otherwise a
+                 generator of (field, value) pairs from all ranges as they arrive, not in field order
+        """
+        return exhscan_partitioned(self, name, partitions=partitions, boundaries=boundaries, callback=callback,
+                                   match=match, count=count, samples=samples, max_workers=max_workers)
+
 
 class Pipeline(Pipeline, Client):
 
+    invalidated_cache = None
+
     def __init__(self, connection_pool, response_callbacks, transaction, shard_hint):
         self.connection_pool = connection_pool
         self.connection = None
@@ -722,3 +1560,48 @@ class Pipeline(Pipeline, Client):
 
         self.watching = False
         self.reset()
+
+    def parse_response(self, connection, command_name, **options):
+        if options.get(NUMERIC_ARRAY) is not None:
+            return Client.parse_response(self, connection, command_name, **options)
+        return super(Pipeline, self).parse_response(connection, command_name, **options)
+
+    def execute(self, raise_on_error=True):
+        """
+        Execute all the commands in the current pipeline, then drop the near cache entries its writes touched and,
+        with replica reads, pin them to the primary.
+        """
+        stack = self.command_stack
+        metrics = self.metrics
+        response = error = None
+        start = perf_counter()
+        try:
+            response = super(Pipeline, self).execute(raise_on_error)
+            if metrics is not None:
+                for (args, _), reply in zip(stack, response):
+                    if isinstance(reply, ResponseError):
+                        metrics.record_error(args[0])
+            return response
+        except TimeoutError as e:
+            error = e
+            if metrics is not None:
+                metrics.record_error('PIPELINE', timeout=True)
+            raise
+        except RedisError as e:
+            error = e
+            if metrics is not None:
+                metrics.record_error('PIPELINE')
+            raise
+        finally:
+            elapsed = perf_counter() - start
+            if metrics is not None:
+                metrics.record_pipeline(len(stack), elapsed)
+            if self.tracer is not None:
+                self.tracer.observe_pipeline(stack, response, elapsed, error)
+            cache = self.invalidated_cache
+            if cache is not None:
+                for args, _ in stack:
+                    cache.invalidate_command(args)
+            if self.router is not None:
+                for args, _ in stack:
+                    self.router.note_write(args)
@@ -0,0 +1,410 @@
+import random
+import threading
+from time import perf_counter
+
+from redis._compat import nativestr
+from redis.client import CaseInsensitiveDict
+from redis.connection import ConnectionPool, Encoder
+from redis.exceptions import (
+    ConnectionError,
+    RedisError,
+    ResponseError,
+    TimeoutError,
+)
+
+from .client import Client, remove_tairhash_callbacks
+from .resp import install_packer
+from .scripts import ScriptRegistry
+from .versioned import UpdateStats
+
+CLUSTER_SLOTS = 16384
+
+# CRC16-CCITT (XMODEM), the checksum Tair and Redis use for key slots
+_CRC16_TABLE = []
+for _byte in range(256):
+    _crc = _byte << 8
+    for _ in range(8):
+        _crc = ((_crc << 1) ^ 0x1021) if _crc & 0x8000 else (_crc << 1)
+    _CRC16_TABLE.append(_crc & 0xFFFF)
+
+
+def crc16(data):
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFF00) ^ _CRC16_TABLE[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+
+def key_slot(key, encoder=None):
+    """
+    Return the cluster slot of ``key``. Like Tair, only the part between the first ``{`` and the following ``}``
+    is hashed when it is not empty, so ``{user1}.a`` and ``{user1}.b`` share a slot.
+    :param key: str, bytes or number
+    :param encoder: redis-py ``Encoder`` used to turn the key into bytes
+    :return:
+    """
+    key = (encoder or _DEFAULT_ENCODER).encode(key)
+    start = key.find(b'{')
+    if start > -1:
+        end = key.find(b'}', start + 1)
+        if end > start + 1:
+            key = key[start + 1:end]
+    return crc16(key) % CLUSTER_SLOTS
+
+
+_DEFAULT_ENCODER = Encoder('utf-8', 'strict', False)
+
+
+def parse_redirection(error):
+    """
+    Parse a ``MOVED slot host:port`` or ``ASK slot host:port`` error. Returns ``(kind, slot, (host, port))``,
+    or None for any other error.
+    """
+    message = str(error.args[0]) if error.args else ''
+    parts = message.split(' ')
+    if len(parts) != 3 or parts[0] not in ('MOVED', 'ASK'):
+        return None
+    host, _, port = parts[2].rpartition(':')
+    return parts[0], int(parts[1]), (host, int(port))
+
+
+class ClusterError(RedisError):
+    pass
+
+
+class ClusterClient(Client):
+    """
+    Tair cluster client. Every ``exh*`` command is sent to the primary owning the slot of its key, which is always
+    the first argument after the command name. The slot map is read with CLUSTER SLOTS and cached; MOVED replies
+    update it and ASK replies are followed once with ASKING. ``pipeline()`` groups the queued commands per node,
+    so each node gets one pipelined round trip.
+    """
+
+    # commands without a key that must reach every primary
+    BROADCAST_COMMANDS = {'FLUSHALL', 'FLUSHDB', 'SCRIPT LOAD', 'SCRIPT FLUSH'}
+    # commands whose first argument is not a key
+    KEYLESS_COMMANDS = {
+        'PING', 'ECHO', 'INFO', 'TIME', 'DBSIZE', 'CLUSTER', 'CLIENT', 'CONFIG', 'COMMAND', 'SCRIPT', 'SCRIPT EXISTS',
+        'READONLY', 'READWRITE', 'SELECT', 'KEYS', 'SCAN', 'RANDOMKEY',
+    }
+
+    def __init__(self, startup_nodes=None, host='localhost', port=6379, max_redirects=5, raw_replies=False,
+                 fast_encoder=False, **connection_kwargs):
+        """
+        Creates a new tairHash cluster client.
+        :param startup_nodes: list of (host, port) pairs used to discover the cluster, defaults to [(host, port)]
+        :param max_redirects: how many MOVED/ASK redirections a single command may follow
+        :param raw_replies: skip the tairHash decoders, like ``Client(raw_replies=True)``
+        :param fast_encoder: pack commands with a CommandPacker on every node, like ``Client(fast_encoder=True)``
+        :param connection_kwargs: passed to the connection pool of every node, e.g. password or socket_timeout
+        """
+        self.startup_nodes = [(h, int(p)) for h, p in (startup_nodes or [(host, port)])]
+        self.max_redirects = max_redirects
+        self.fast_encoder = fast_encoder
+        self.connection_kwargs = connection_kwargs
+        self.encoder = Encoder(connection_kwargs.get('encoding', 'utf-8'),
+                               connection_kwargs.get('encoding_errors', 'strict'),
+                               connection_kwargs.get('decode_responses', False))
+        self.connection = None
+        self.response_callbacks = CaseInsensitiveDict(self.__class__.RESPONSE_CALLBACKS)
+        if raw_replies:
+            remove_tairhash_callbacks(self.response_callbacks)
+        self.nodes = {}
+        self.slots = [None] * CLUSTER_SLOTS
+        self._nodes_lock = threading.Lock()
+        self._refresh_needed = True
+        self.update_stats = UpdateStats()
+        self.script_registry = ScriptRegistry(self)
+
+    def __repr__(self):
+        return "%s<%s>" % (type(self).__name__, ','.join('%s:%s' % n for n in self.startup_nodes))
+
+    @property
+    def connection_pool(self):
+        # some redis-py helpers (register_script, pubsub) need a pool; they get the first startup node's pool
+        return self.get_node_pool(self.startup_nodes[0])
+
+    def close(self):
+        for pool in list(self.nodes.values()):
+            pool.disconnect()
+
+    def enable_near_cache(self, cache=None, tracking=False, prefixes=None):
+        raise ClusterError("ClusterClient does not support a near cache")
+
+    def enable_multiplexing(self, connections=1, batch_window=0.0, max_batch=128):
+        raise ClusterError("ClusterClient does not support multiplexing")
+
+    def enable_replica_reads(self, replicas, read_your_writes=False, max_lag=1.0, retry_interval=5.0):
+        raise ClusterError("ClusterClient does not support replica reads")
+
+    def get_node_pool(self, node):
+        """
+        Return the connection pool of ``node``, a (host, port) pair, creating it on first use.
+        """
+        pool = self.nodes.get(node)
+        if pool is None:
+            with self._nodes_lock:
+                pool = self.nodes.get(node)
+                if pool is None:
+                    pool = ConnectionPool(host=node[0], port=node[1], **self.connection_kwargs)
+                    if self.fast_encoder:
+                        install_packer(pool)
+                    self.nodes[node] = pool
+        return pool
+
+    def refresh_slots(self):
+        """
+        Reload the slot map from the first reachable known node.
+        """
+        candidates = list(self.startup_nodes) + [n for n in self.nodes if n not in self.startup_nodes]
+        last_error = None
+        for node in candidates:
+            pool = self.get_node_pool(node)
+            conn = pool.get_connection('CLUSTER')
+            try:
+                conn.send_command('CLUSTER', 'SLOTS')
+                reply = conn.read_response()
+            except (ConnectionError, TimeoutError) as e:
+                conn.disconnect()
+                last_error = e
+                continue
+            finally:
+                pool.release(conn)
+            slots = [None] * CLUSTER_SLOTS
+            for entry in reply:
+                start, end, primary = entry[0], entry[1], entry[2]
+                primary = (nativestr(primary[0]) or node[0], int(primary[1]))
+                slots[start:end + 1] = [primary] * (end - start + 1)
+            self.slots = slots
+            self._refresh_needed = False
+            return
+        raise ClusterError("Unable to read the slot map from any node: %s" % last_error)
+
+    def node_for_slot(self, slot):
+        if self._refresh_needed:
+            self.refresh_slots()
+        node = self.slots[slot]
+        if node is None:
+            raise ClusterError("Slot %d is not covered by the cluster" % slot)
+        return node
+
+    def command_key(self, args):
+        """
+        Return the key an ``args`` tuple is routed by, or None for keyless commands.
+        """
+        command = nativestr(args[0]).upper()
+        if command in ('EVAL', 'EVALSHA'):
+            return args[3] if len(args) > 3 and int(args[2]) > 0 else None
+        if len(args) < 2 or command in self.KEYLESS_COMMANDS:
+            return None
+        return args[1]
+
+    def node_for_command(self, args):
+        key = self.command_key(args)
+        if key is None:
+            if self._refresh_needed:
+                self.refresh_slots()
+            return random.choice([n for n in set(self.slots) if n is not None])
+        return self.node_for_slot(key_slot(key, self.encoder))
+
+    def _stream_pool(self, args):
+        # streamed replies are read from the node owning the key, without following redirections
+        return self.get_node_pool(self.node_for_command(args))
+
+    def _send(self, *args, **options):
+        """
+        Execute a command on the node owning its key, following MOVED/ASK redirections.
+        """
+        command_name = args[0]
+        if nativestr(command_name).upper() in self.BROADCAST_COMMANDS:
+            return self._execute_broadcast(*args, **options)
+
+        node = self.node_for_command(args)
+        asking = False
+        for _ in range(self.max_redirects + 1):
+            pool = self.get_node_pool(node)
+            conn = pool.get_connection(command_name)
+            try:
+                if asking:
+                    conn.send_packed_command(conn.pack_commands([('ASKING',), args]))
+                    conn.read_response()
+                else:
+                    conn.send_command(*args)
+                return self.parse_response(conn, command_name, **options)
+            except ResponseError as e:
+                redirection = parse_redirection(e)
+                if redirection is None:
+                    raise
+                kind, slot, node = redirection
+                asking = kind == 'ASK'
+                if not asking:
+                    self.slots[slot] = node
+                    self._refresh_needed = True
+            except (ConnectionError, TimeoutError):
+                conn.disconnect()
+                self._refresh_needed = True
+                raise
+            finally:
+                pool.release(conn)
+        raise ClusterError("Too many cluster redirections for %s" % nativestr(command_name))
+
+    def _execute_broadcast(self, *args, **options):
+        if self._refresh_needed:
+            self.refresh_slots()
+        result = None
+        for node in set(n for n in self.slots if n is not None):
+            pool = self.get_node_pool(node)
+            conn = pool.get_connection(args[0])
+            try:
+                conn.send_command(*args)
+                result = self.parse_response(conn, args[0], **options)
+            finally:
+                pool.release(conn)
+        return result
+
+    def pipeline(self, transaction=False, shard_hint=None):
+        """
+        Return a new cluster pipeline. Commands are grouped per node; MULTI/EXEC transactions are not supported
+        because the keys may live on different nodes.
+        """
+        if transaction:
+            raise ClusterError("ClusterClient pipelines do not support transactions")
+        return ClusterPipeline(self)
+
+
+class ClusterPipeline(ClusterClient):
+    """
+    Queues commands and sends them to their nodes on ``execute``. All nodes are written to before any reply is
+    read, so a batch spanning several nodes costs about one round trip. Redirected commands are re-sent to their
+    new node, and the results come back in the order the commands were queued.
+    """
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.response_callbacks = cluster.response_callbacks
+        self.encoder = cluster.encoder
+        self.max_redirects = cluster.max_redirects
+        self.script_registry = cluster.script_registry
+        self.metrics = cluster.metrics
+        self.tracer = cluster.tracer
+        self.codec = cluster.codec
+        self.connection = None
+        self.command_stack = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    @property
+    def connection_pool(self):
+        return self.cluster.connection_pool
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def __bool__(self):
+        return True
+
+    def reset(self):
+        self.command_stack = []
+
+    def close(self):
+        # the node pools belong to the cluster client
+        pass
+
+    def execute_command(self, *args, **options):
+        self.command_stack.append((args, options))
+        return self
+
+    def execute(self, raise_on_error=True):
+        """
+        Execute all the queued commands, grouped per node.
+        """
+        stack = self.command_stack
+        if not stack:
+            return []
+        cluster = self.cluster
+        response = [None] * len(stack)
+        # index -> (node, asking)
+        pending = {i: (cluster.node_for_command(args), False) for i, (args, _) in enumerate(stack)}
+        metrics = self.metrics
+        start = perf_counter()
+        try:
+            for _ in range(self.max_redirects + 1):
+                if not pending:
+                    break
+                pending = self._execute_round(pending, response)
+            if pending:
+                raise ClusterError("Too many cluster redirections in pipeline")
+        finally:
+            self.reset()
+            elapsed = perf_counter() - start
+            if metrics is not None:
+                metrics.record_pipeline(len(stack), elapsed)
+                for (args, _), r in zip(stack, response):
+                    if isinstance(r, ResponseError):
+                        metrics.record_error(args[0])
+            if self.tracer is not None:
+                self.tracer.observe_pipeline(stack, response, elapsed)
+
+        if raise_on_error:
+            for i, r in enumerate(response):
+                if isinstance(r, ResponseError):
+                    cmd = ' '.join(map(nativestr, map(str, stack[i][0])))
+                    r.args = ('Command # %d (%s) of pipeline caused error: %s' % (i + 1, cmd, r.args[0]),)
+                    raise r
+        return response
+
+    def _execute_round(self, pending, response):
+        stack = self.command_stack
+        cluster = self.cluster
+        by_node = {}
+        for i, (node, asking) in sorted(pending.items()):
+            by_node.setdefault(node, []).append((i, asking))
+
+        # write to every node first, then collect the replies
+        sent = []
+        try:
+            for node, items in by_node.items():
+                pool = cluster.get_node_pool(node)
+                conn = pool.get_connection('MULTI')
+                sent.append((pool, conn, items))
+                commands = []
+                for i, asking in items:
+                    if asking:
+                        commands.append(('ASKING',))
+                    commands.append(stack[i][0])
+                conn.send_packed_command(conn.pack_commands(commands))
+
+            retry = {}
+            for pool, conn, items in sent:
+                for i, asking in items:
+                    args, options = stack[i]
+                    if asking:
+                        try:
+                            conn.read_response()
+                        except ResponseError:
+                            pass
+                    try:
+                        response[i] = self.parse_response(conn, args[0], **options)
+                    except ResponseError as e:
+                        redirection = parse_redirection(e)
+                        if redirection is None:
+                            response[i] = e
+                            continue
+                        kind, slot, node = redirection
+                        if kind == 'MOVED':
+                            cluster.slots[slot] = node
+                            cluster._refresh_needed = True
+                        retry[i] = (node, kind == 'ASK')
+            return retry
+        except (ConnectionError, TimeoutError):
+            for _, conn, _ in sent:
+                conn.disconnect()
+            cluster._refresh_needed = True
+            raise
+        finally:
+            for pool, conn, _ in sent:
+                pool.release(conn)
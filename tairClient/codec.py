@@ -0,0 +1,213 @@
+import threading
+import zlib
+
+# the first byte of an encoded value: 0b11111ccs, c the compressor id (0 for none), s set when serialized. Bytes
+# 0xF8 to 0xFF never start valid UTF-8, so text and JSON values written without a codec decode unchanged
+HEADER = 0xF8
+SERIALIZED = 0x01
+COMPRESSOR_SHIFT = 1
+
+# raw reply shape of each decoded command: a value, a list of values, flat field-value pairs, an EXHSCAN reply,
+# a [value, version] pair or a list of them
+DECODED_COMMANDS = {
+    'EXHGET': 'value',
+    'EXHMGET': 'values',
+    'EXHVALS': 'values',
+    'EXHGETALL': 'pairs',
+    'EXHSCAN': 'scan',
+    'EXHGETWITHVER': 'withver',
+    'EXHMGETWITHVER': 'withvers',
+}
+
+
+class Compressor(object):
+    """
+    A compression algorithm the codec can use. ``id`` (1 to 3) is stored in the header of every value it compressed,
+    so it must not change once values are written.
+    """
+    id = None
+
+    def compress(self, data):
+        raise NotImplementedError
+
+    def decompress(self, data):
+        raise NotImplementedError
+
+
+class ZlibCompressor(Compressor):
+    id = 1
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class LZ4Compressor(Compressor):
+    """
+    LZ4 frames, several times faster than zlib at a lower ratio. Needs the ``lz4`` package.
+    """
+    id = 2
+
+    def __init__(self, level=0):
+        import lz4.frame
+        self.frame = lz4.frame
+        self.level = level
+
+    def compress(self, data):
+        return self.frame.compress(data, compression_level=self.level)
+
+    def decompress(self, data):
+        return self.frame.decompress(data)
+
+
+class ZstdCompressor(Compressor):
+    """
+    Zstandard, about as fast as LZ4 to decompress with ratios above zlib's. Needs the ``zstandard`` package.
+    """
+    id = 3
+
+    def __init__(self, level=3):
+        import zstandard
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+
+
+class ValueCodec(object):
+    """
+    Encodes the values written by exhset and exhmset, and decodes those read by exhget, exhmget, exhgetall, exhvals,
+    exhscan and the withver commands.
+
+    Values of ``threshold`` bytes or more are compressed when that saves space, and get a one byte header naming
+    the compressor. Smaller values, ints and floats are written as they are, so exhincrby counters and values
+    written without a codec keep working; only a raw value starting with a byte from 0xF8 to 0xFF gets a header, to
+    tell it from an encoded one.
+
+    With a ``serializer`` (an object with ``dumps`` and ``loads``, such as ``json`` or ``pickle``), values other than
+    bytes, str, int and float are serialized and flagged, and come back deserialized.
+
+    Values compressed by ``decompressors`` (other Compressor instances) can be read too, e.g. while switching
+    compressors. The Lua composite operations (exhget_or_set, exhmove, ...) read and write values as stored.
+    """
+
+    def __init__(self, threshold=1024, compressor=None, serializer=None, decompressors=()):
+        self.threshold = threshold
+        self.compressor = compressor if compressor is not None else ZlibCompressor()
+        self.serializer = serializer
+        self.encoder = None
+        self._compressors = {c.id: c for c in (ZlibCompressor(),) + tuple(decompressors) + (self.compressor,)}
+        self._lock = threading.Lock()
+        self.encoded = 0
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.decoded = 0
+        self.decompressed = 0
+
+    def encode(self, value):
+        """
+        Return what is sent for ``value``: ints and floats unchanged, else bytes, compressed and with a header when
+        needed.
+        """
+        if isinstance(value, (int, float)):
+            return value
+        flags = 0
+        if not isinstance(value, (bytes, str)) and self.serializer is not None:
+            value = self.serializer.dumps(value)
+            flags = SERIALIZED
+        data = self.encoder.encode(value)
+        size = len(data)
+        if size >= self.threshold:
+            packed = self.compressor.compress(data)
+            if len(packed) + 1 < size:
+                data = bytes((HEADER | self.compressor.id << COMPRESSOR_SHIFT | flags,)) + packed
+                with self._lock:
+                    self.encoded += 1
+                    self.compressed += 1
+                    self.bytes_in += size
+                    self.bytes_out += len(data)
+                return data
+        if flags or (data and data[0] >= HEADER):
+            data = bytes((HEADER | flags,)) + data
+        with self._lock:
+            self.encoded += 1
+            self.bytes_in += size
+            self.bytes_out += len(data)
+        return data
+
+    def decode(self, data):
+        """
+        Return the value ``data`` was encoded from; None and values without a header are returned unchanged.
+        """
+        if not isinstance(data, bytes) or not data or data[0] < HEADER:
+            return data
+        header = data[0]
+        data = data[1:]
+        compressor_id = (header >> COMPRESSOR_SHIFT) & 0x03
+        if compressor_id:
+            data = self._compressors[compressor_id].decompress(data)
+        if header & SERIALIZED:
+            data = self.serializer.loads(data)
+        with self._lock:
+            self.decoded += 1
+            if compressor_id:
+                self.decompressed += 1
+        return data
+
+    def decode_reply(self, shape, response):
+        """
+        Decode the values in a raw reply of the given shape, see DECODED_COMMANDS.
+        """
+        if response is None or isinstance(response, Exception):
+            return response
+        decode = self.decode
+        if shape == 'value':
+            return decode(response)
+        if shape == 'values':
+            return [decode(value) for value in response]
+        if shape == 'pairs':
+            return [decode(item) if i & 1 else item for i, item in enumerate(response)]
+        if shape == 'scan':
+            return [response[0], self.decode_reply('pairs', response[1])]
+        if shape == 'withver':
+            return [decode(response[0]), response[1]]
+        return [self.decode_reply('withver', item) for item in response]
+
+    def wrap_callbacks(self, response_callbacks):
+        """
+        Put a decoding step in front of the response callbacks of the decoded commands, in place.
+        """
+        for command, shape in DECODED_COMMANDS.items():
+            response_callbacks[command] = _decoding_callback(self, shape, response_callbacks.get(command))
+
+    def stats(self):
+        """
+        :return: dict with values encoded and compressed, bytes before and after encoding, their ratio (below 1.0
+                 when compression saves space), and values decoded and decompressed
+        """
+        with self._lock:
+            return {
+                'encoded': self.encoded,
+                'compressed': self.compressed,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': self.bytes_out / self.bytes_in if self.bytes_in else 1.0,
+                'decoded': self.decoded,
+                'decompressed': self.decompressed,
+            }
+
+
+def _decoding_callback(codec, shape, callback):
+    if callback is None:
+        return lambda response, **options: codec.decode_reply(shape, response)
+    return lambda response, **options: callback(codec.decode_reply(shape, response), **options)
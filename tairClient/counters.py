@@ -0,0 +1,191 @@
+import atexit
+import threading
+from time import monotonic
+
+from redis.exceptions import ConnectionError, TimeoutError
+
+# exhincrby options that can be kept while coalescing; nx, xx, ver and abs depend on the state at each call
+COUNTER_OPTIONS = ('ex', 'exat', 'px', 'pxat', 'minval', 'maxval')
+# options under which a total can be rejected where some of its increments would not be
+BOUND_OPTIONS = ('minval', 'maxval')
+
+
+class CounterBuffer(object):
+    """
+    Sums exhincrby and exhincrbyfloat calls per (key, field, options) in memory and sends the totals as one
+    non-transactional pipeline every ``interval`` seconds, or as soon as ``max_pending`` distinct counters are
+    waiting. A background thread does the sending, so ``incrby`` never waits for the server.
+
+    Increments reach Tair up to ``interval`` seconds late. Those not sent yet are lost if the process dies; ``close``
+    sends them, and so does interpreter exit unless ``flush_at_exit`` is False. A flush that fails to reach the server
+    puts its totals back for the next one when ``requeue`` is True, and drops them otherwise. Dropped totals are
+    passed to ``on_error``.
+
+    A total can break ``minval`` or ``maxval`` where the first of its increments would not, so the increments of
+    bounded counters are also kept one by one until the flush. When the server rejects such a total, they are sent
+    separately in a second pipeline, and only those the bounds reject are dropped, as with direct calls.
+    """
+
+    def __init__(self, client, interval=1.0, max_pending=10000, requeue=True, flush_at_exit=True, on_error=None):
+        self.client = client
+        self.interval = interval
+        self.max_pending = max_pending
+        self.requeue = requeue
+        self.on_error = on_error
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._parts = {}
+        self._wake = threading.Event()
+        self._closed = False
+        self.increments = 0
+        self.flushes = 0
+        self.commands = 0
+        self.dropped = 0
+        self.last_flush_latency = 0.0
+        self._flush_at_exit = flush_at_exit
+        if flush_at_exit:
+            atexit.register(self.close)
+        self._thread = threading.Thread(target=self._run, name='tair-counter-buffer', daemon=True)
+        self._thread.start()
+
+    def incrby(self, name, field, amount=1, **options):
+        """
+        Add ``amount`` to the field with EXHINCRBY at the next flush. Options are those of exhincrby that do not
+        depend on the field's state at the time of the call: ex, exat, px, pxat, minval and maxval.
+        """
+        self._add('exhincrby', name, field, amount, options)
+
+    def incrbyfloat(self, name, field, amount, **options):
+        """
+        Like incrby, with EXHINCRBYFLOAT.
+        """
+        self._add('exhincrbyfloat', name, field, amount, options)
+
+    def _add(self, command, name, field, amount, options):
+        if options:
+            unknown = set(options).difference(COUNTER_OPTIONS)
+            if unknown:
+                raise ValueError('options %s cannot be coalesced' % ', '.join(sorted(unknown)))
+        key = (command, name, field, tuple(sorted(options.items())))
+        bounded = any(option in options for option in BOUND_OPTIONS)
+        with self._lock:
+            if self._closed:
+                raise ValueError('CounterBuffer is closed')
+            self._pending[key] = self._pending.get(key, 0) + amount
+            if bounded:
+                self._parts.setdefault(key, []).append(amount)
+            self.increments += 1
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._closed:
+                return
+            try:
+                self.flush()
+            except Exception:
+                # flush already requeued or reported the totals; the next interval tries again
+                pass
+
+    def flush(self):
+        """
+        Send every pending total now. Returns the number of commands sent.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                parts, self._parts = self._parts, {}
+            if not batch:
+                return 0
+            start = monotonic()
+            try:
+                replies = self._send(list(batch.items()), batch, parts)
+                failures = [(item, reply) for item, reply in zip(batch.items(), replies)
+                            if isinstance(reply, Exception)]
+                # rejected totals of bounded counters get their increments sent one by one
+                retry = [key for (key, _), _ in failures if key in parts]
+                self._drop([failure for failure in failures if failure[0][0] not in parts])
+                sent = len(batch)
+                if retry:
+                    items = [(key, amount) for key in retry for amount in parts[key]]
+                    replies = self._send(items, {key: batch[key] for key in retry}, {key: parts[key] for key in retry})
+                    sent += len(items)
+                    self._drop([(item, reply) for item, reply in zip(items, replies)
+                                if isinstance(reply, Exception)])
+            finally:
+                self.last_flush_latency = monotonic() - start
+            self.flushes += 1
+            self.commands += sent
+            return sent
+
+    def _send(self, items, batch, parts):
+        # items are (key, amount) pairs; batch and parts are what goes back to pending when the server is unreachable
+        pipe = self.client.pipeline(transaction=False)
+        for (command, name, field, options), amount in items:
+            getattr(pipe, command)(name, field, amount, **dict(options))
+        try:
+            return pipe.execute(raise_on_error=False)
+        except (ConnectionError, TimeoutError) as e:
+            if self.requeue:
+                self._merge(batch, parts)
+            else:
+                self._drop([(item, e) for item in items])
+            raise
+
+    def _merge(self, batch, parts):
+        with self._lock:
+            pending = self._pending
+            for key, amount in batch.items():
+                pending[key] = pending.get(key, 0) + amount
+            for key, amounts in parts.items():
+                # requeued increments go before those added since the flush started
+                self._parts[key] = amounts + self._parts.get(key, [])
+
+    def _drop(self, failures):
+        with self._lock:
+            self.dropped += len(failures)
+        for ((command, name, field, options), amount), error in failures:
+            if self.on_error is not None:
+                self.on_error(name, field, amount, error)
+
+    def stats(self):
+        """
+        :return: dict with increments accepted, counters pending, flushes, commands sent, coalescing ratio
+                 (increments per command), totals dropped and the latency of the last flush in seconds
+        """
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'increments': self.increments,
+            'pending': pending,
+            'flushes': self.flushes,
+            'commands': self.commands,
+            'coalescing': self.increments / (self.commands + pending) if self.commands + pending else 0.0,
+            'dropped': self.dropped,
+            'last_flush_latency': self.last_flush_latency,
+        }
+
+    def close(self):
+        """
+        Stop the background thread and send what is pending.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._flush_at_exit:
+            atexit.unregister(self.close)
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
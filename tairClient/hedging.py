@@ -0,0 +1,168 @@
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import perf_counter
+
+# idempotent reads that may be sent twice
+HEDGED_COMMANDS = {'EXHGET', 'EXHMGET', 'EXHGETWITHVER', 'EXHMGETWITHVER'}
+
+
+class HedgePolicy(object):
+    """
+    Hedged reads: when a read has not been answered after a threshold, the same read is sent again over another
+    connection, or to another replica with replica reads enabled, and the first answer wins. The other one is left
+    to finish in the background and its connection goes back to the pool when it does.
+
+    The threshold is ``threshold`` seconds when given, else the ``percentile`` of the last ``window`` attempt
+    latencies, but at least ``min_threshold``; nothing is hedged before ``min_samples`` latencies are known.
+    Each read earns ``budget`` hedges, up to ``burst``, so hedges stay near ``budget`` of the reads when a node
+    slows down for good.
+
+    Reads run on a pool of ``max_workers`` threads while the caller waits, which costs a thread handoff per read.
+    A read never queues for a thread: when every worker is busy it runs on the calling thread and is not hedged,
+    and no hedge is sent while there is no idle worker for it.
+
+    Used by :meth:`tairClient.client.Client.enable_hedging`.
+    """
+
+    def __init__(self, threshold=None, percentile=95, min_threshold=0.001, window=1000, min_samples=100,
+                 budget=0.05, burst=10, commands=None, max_workers=64):
+        self.threshold = threshold
+        self.percentile = percentile
+        self.min_threshold = min_threshold
+        self.min_samples = min_samples
+        self.budget = budget
+        self.burst = burst
+        self.commands = set(commands or HEDGED_COMMANDS)
+        self.max_workers = max_workers
+        self._busy = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tair-hedge')
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._refresh = max(1, window // 10)
+        self._since_update = 0
+        self._adaptive = None
+        self._tokens = float(burst)
+        self.reads = 0
+        self.hedges = 0
+        self.wins = 0
+        self.denied = 0
+        self.inline = 0
+
+    def current_threshold(self):
+        """
+        :return: seconds after which a read is hedged, None while too few latencies are known
+        """
+        if self.threshold is not None:
+            return self.threshold
+        return self._adaptive
+
+    def _observe(self, elapsed):
+        with self._lock:
+            latencies = self._latencies
+            latencies.append(elapsed)
+            self._since_update += 1
+            # the percentile is refreshed every tenth of a window, sorting the window on every read would cost more
+            # than the read
+            if len(latencies) < self.min_samples or self._since_update < self._refresh:
+                return
+            self._since_update = 0
+            ordered = sorted(latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100.0))
+        self._adaptive = max(self.min_threshold, ordered[index])
+
+    def _attempt(self, send, args, options):
+        start = perf_counter()
+        response = send(*args, **options)
+        self._observe(perf_counter() - start)
+        return response
+
+    def _reserve_worker(self):
+        # a worker is reserved before submitting, so the attempt starts at once and the threshold is not spent queued
+        with self._lock:
+            if self._busy >= self.max_workers:
+                return False
+            self._busy += 1
+            return True
+
+    def _release_worker(self):
+        with self._lock:
+            self._busy -= 1
+
+    def _pooled_attempt(self, send, args, options):
+        try:
+            return self._attempt(send, args, options)
+        finally:
+            self._release_worker()
+
+    def _take_token(self):
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.hedges += 1
+                return True
+            self.denied += 1
+            return False
+
+    def run(self, send, args, options):
+        """
+        Run ``send(*args, **options)``, sending it a second time when the first has not returned within the
+        threshold, and return the first successful reply. When both fail the first error is raised.
+        """
+        with self._lock:
+            self.reads += 1
+            self._tokens = min(self.burst, self._tokens + self.budget)
+        threshold = self.current_threshold()
+        if threshold is None:
+            return self._attempt(send, args, options)
+        if not self._reserve_worker():
+            with self._lock:
+                self.inline += 1
+            return self._attempt(send, args, options)
+        first = self._executor.submit(self._pooled_attempt, send, args, options)
+        done, _ = wait((first,), timeout=threshold)
+        if done or not self._reserve_worker():
+            return first.result()
+        if not self._take_token():
+            self._release_worker()
+            return first.result()
+        hedge = self._executor.submit(self._pooled_attempt, send, args, options)
+        pending = {first, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in (first, hedge):
+                if future not in done:
+                    continue
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.wins += 1
+                    return future.result()
+                if error is None:
+                    error = future.exception()
+        raise error
+
+    def stats(self):
+        """
+        :return: dict with reads, hedges sent, hedge_rate, wins (hedges answered first), win_rate, hedges the budget
+                 denied, reads run on the calling thread because every worker was busy and the current threshold in
+                 seconds
+        """
+        with self._lock:
+            return {
+                'reads': self.reads,
+                'hedges': self.hedges,
+                'hedge_rate': self.hedges / self.reads if self.reads else 0.0,
+                'wins': self.wins,
+                'win_rate': self.wins / self.hedges if self.hedges else 0.0,
+                'denied': self.denied,
+                'inline': self.inline,
+                'threshold': self.current_threshold(),
+            }
+
+    def close(self):
+        """
+        Wait for the reads still in flight, including hedges that lost, and stop the threads.
+        """
+        self._executor.shutdown(wait=True)
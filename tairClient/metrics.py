@@ -0,0 +1,147 @@
+import threading
+
+from redis._compat import nativestr
+
+# bucket i counts latencies below 2 ** i microseconds (bucket 0: below 1 us), the last one everything above
+LATENCY_BUCKETS = 32
+# bucket i counts pipelines of fewer than 2 ** i commands
+SIZE_BUCKETS = 20
+
+
+class Histogram(object):
+    """
+    Fixed-size histogram with power of two buckets. ``add`` is a ``bit_length`` and two additions.
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'scale')
+
+    def __init__(self, buckets, scale=1.0):
+        self.counts = [0] * buckets
+        self.count = 0
+        self.total = 0
+        self.scale = scale
+
+    def add(self, value):
+        index = int(value * self.scale).bit_length()
+        counts = self.counts
+        counts[index if index < len(counts) else -1] += 1
+        self.count += 1
+        self.total += value
+
+    def upper_bound(self, index):
+        return (1 << index) / self.scale
+
+    def quantile(self, fraction):
+        """
+        Upper bound of the bucket holding the ``fraction`` quantile, 0.0 when empty.
+        """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.upper_bound(i)
+        return self.upper_bound(len(self.counts) - 1)
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': [(self.upper_bound(i), n) for i, n in enumerate(self.counts) if n],
+        }
+
+
+class CommandMetrics(object):
+    """
+    Latency histograms per command name, error and timeout counters, and pipeline size and latency histograms,
+    filled by :meth:`tairClient.client.Client.enable_metrics`. Memory grows only with the number of distinct
+    command names.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}
+            self.errors = {}
+            self.timeouts = {}
+            self.pipeline_size = Histogram(SIZE_BUCKETS)
+            self.pipeline_latency = Histogram(LATENCY_BUCKETS, 1e6)
+
+    def record(self, command, elapsed):
+        with self._lock:
+            histogram = self.latency.get(command)
+            if histogram is None:
+                histogram = self.latency[command] = Histogram(LATENCY_BUCKETS, 1e6)
+            histogram.add(elapsed)
+
+    def record_error(self, command, timeout=False):
+        with self._lock:
+            counters = self.timeouts if timeout else self.errors
+            counters[command] = counters.get(command, 0) + 1
+
+    def record_pipeline(self, size, elapsed):
+        with self._lock:
+            self.pipeline_size.add(size)
+            self.pipeline_latency.add(elapsed)
+
+    def snapshot(self):
+        """
+        :return: dict with, per command name, a latency summary in seconds (count, sum, approximate p50, p90 and
+                 p99, non-empty buckets as (upper bound, count) pairs), errors and timeouts, and the pipeline size
+                 and latency summaries
+        """
+        with self._lock:
+            return {
+                'commands': {nativestr(c): h.snapshot() for c, h in self.latency.items()},
+                'errors': {nativestr(c): n for c, n in self.errors.items()},
+                'timeouts': {nativestr(c): n for c, n in self.timeouts.items()},
+                'pipeline_size': self.pipeline_size.snapshot(),
+                'pipeline_latency': self.pipeline_latency.snapshot(),
+            }
+
+    def prometheus(self, prefix='tair_client'):
+        """
+        Render the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            name = prefix + '_command_duration_seconds'
+            lines.append('# HELP %s Latency of commands sent outside pipelines.' % name)
+            lines.append('# TYPE %s histogram' % name)
+            for command, histogram in sorted(self.latency.items(), key=lambda item: nativestr(item[0])):
+                _histogram_lines(lines, name, histogram, 'command="%s",' % nativestr(command))
+            for suffix, counters, text in (('errors', self.errors, 'Commands that failed, timeouts excluded.'),
+                                           ('timeouts', self.timeouts, 'Commands that timed out.')):
+                name = '%s_command_%s_total' % (prefix, suffix)
+                lines.append('# HELP %s %s' % (name, text))
+                lines.append('# TYPE %s counter' % name)
+                for command, n in sorted(counters.items(), key=lambda item: nativestr(item[0])):
+                    lines.append('%s{command="%s"} %d' % (name, nativestr(command), n))
+            name = prefix + '_pipeline_size'
+            lines.append('# HELP %s Commands per pipeline.' % name)
+            lines.append('# TYPE %s histogram' % name)
+            _histogram_lines(lines, name, self.pipeline_size, '')
+            name = prefix + '_pipeline_duration_seconds'
+            lines.append('# HELP %s Latency of pipeline executions.' % name)
+            lines.append('# TYPE %s histogram' % name)
+            _histogram_lines(lines, name, self.pipeline_latency, '')
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(lines, name, histogram, labels):
+    cumulative = 0
+    for i, n in enumerate(histogram.counts[:-1]):
+        cumulative += n
+        lines.append('%s_bucket{%sle="%.9g"} %d' % (name, labels, histogram.upper_bound(i), cumulative))
+    lines.append('%s_bucket{%sle="+Inf"} %d' % (name, labels, histogram.count))
+    labels = '{%s}' % labels.rstrip(',') if labels else ''
+    lines.append('%s_sum%s %.9g' % (name, labels, histogram.total))
+    lines.append('%s_count%s %d' % (name, labels, histogram.count))
@@ -0,0 +1,187 @@
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+from time import monotonic
+
+from redis.exceptions import ConnectionError, ResponseError
+
+# commands that change or block their connection, which is shared here; they use the client's pool instead
+EXCLUSIVE_COMMANDS = {
+    'MULTI', 'EXEC', 'DISCARD', 'WATCH', 'UNWATCH', 'SELECT', 'AUTH', 'QUIT', 'MONITOR', 'SUBSCRIBE', 'PSUBSCRIBE',
+    'CLIENT SETNAME', 'CLIENT TRACKING', 'CLIENT REPLY', 'BLPOP', 'BRPOP', 'BRPOPLPUSH', 'BZPOPMIN', 'BZPOPMAX',
+    'XREAD', 'XREADGROUP', 'WAIT',
+}
+
+
+class MultiplexedConnection(object):
+    """
+    One connection shared by any number of threads. Commands submitted while the previous write is in progress,
+    or within ``batch_window`` seconds of the first one, are packed into a single write of at most ``max_batch``
+    commands. A reader thread resolves the callers' futures in the order the commands were written, which is the
+    order Tair replies in.
+    """
+
+    def __init__(self, connection, batch_window=0.0, max_batch=128):
+        self.connection = connection
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.commands = 0
+        self._lock = threading.Lock()
+        self._has_pending = threading.Condition(self._lock)
+        self._has_inflight = threading.Condition(self._lock)
+        self._pending = deque()
+        self._inflight = deque()
+        # bumped on every (re)connect, so a reader failing on an old socket does not fail the new one
+        self._generation = 0
+        self._closed = False
+        self._reader_idle = True
+        self._writer = threading.Thread(target=self._write_loop, name='tair-multiplex-writer', daemon=True)
+        self._reader = threading.Thread(target=self._read_loop, name='tair-multiplex-reader', daemon=True)
+        self._writer.start()
+        self._reader.start()
+
+    def submit(self, args):
+        """
+        Queue a command and return a Future of its raw reply.
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise ConnectionError('Multiplexed connection is closed')
+            self._pending.append((args, future))
+            self._has_pending.notify()
+        return future
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._has_pending.notify()
+            self._has_inflight.notify_all()
+            self._fail_locked(ConnectionError('Multiplexed connection is closed'), self._generation)
+            for _, future in self._pending:
+                future.set_exception(ConnectionError('Multiplexed connection is closed'))
+            self._pending.clear()
+
+    def _next_batch(self):
+        with self._lock:
+            while not self._pending and not self._closed:
+                self._has_pending.wait()
+            if self.batch_window:
+                deadline = monotonic() + self.batch_window
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self._has_pending.wait(remaining)
+            if self._closed:
+                return None
+            count = min(len(self._pending), self.max_batch)
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _write_loop(self):
+        connection = self.connection
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            with self._lock:
+                try:
+                    if connection._sock is None:
+                        # the handshake reads replies, so it waits until the reader is not reading
+                        while not self._reader_idle and not self._closed:
+                            self._has_inflight.wait()
+                        connection.connect()
+                        self._generation += 1
+                    sock = connection._sock
+                    generation = self._generation
+                    packed = connection.pack_commands([args for args, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                    self._fail_locked(e, self._generation)
+                    continue
+                self._inflight.extend(future for _, future in batch)
+                self._has_inflight.notify_all()
+            # sent outside the lock so the reader keeps draining replies; the socket is not reopened behind
+            # the reader's back, a failure here only fails this generation
+            try:
+                for chunk in packed:
+                    sock.sendall(chunk)
+                self.batches += 1
+                self.commands += len(batch)
+            except Exception as e:
+                with self._lock:
+                    self._fail_locked(ConnectionError('Error while writing to socket: %s' % (e,)), generation)
+
+    def _read_loop(self):
+        connection = self.connection
+        while True:
+            with self._lock:
+                self._reader_idle = True
+                self._has_inflight.notify_all()
+                while not self._inflight and not self._closed:
+                    self._has_inflight.wait()
+                if self._closed:
+                    return
+                self._reader_idle = False
+                generation = self._generation
+            try:
+                response = connection.read_response()
+            except ResponseError as e:
+                response = e
+            except Exception as e:
+                with self._lock:
+                    self._fail_locked(e, generation)
+                continue
+            with self._lock:
+                if generation != self._generation or not self._inflight:
+                    continue
+                future = self._inflight.popleft()
+            if isinstance(response, ResponseError):
+                future.set_exception(response)
+            else:
+                future.set_result(response)
+
+    def _fail_locked(self, error, generation):
+        if generation != self._generation:
+            return
+        self._generation += 1
+        self.connection.disconnect()
+        inflight, self._inflight = self._inflight, deque()
+        for future in inflight:
+            if not future.done():
+                future.set_exception(error)
+
+
+class Multiplexer(object):
+    """
+    Spreads the commands of many threads over a few ``MultiplexedConnection``, round robin. Used by
+    :meth:`tairClient.client.Client.enable_multiplexing`.
+    """
+
+    def __init__(self, connection_pool, connections=1, batch_window=0.0, max_batch=128):
+        pool = connection_pool
+        self.connections = [
+            MultiplexedConnection(pool.connection_class(**pool.connection_kwargs), batch_window, max_batch)
+            for _ in range(connections)
+        ]
+        self._next = itertools.cycle(self.connections)
+
+    def submit(self, args):
+        return next(self._next).submit(args)
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+    def stats(self):
+        batches = sum(c.batches for c in self.connections)
+        commands = sum(c.commands for c in self.connections)
+        return {
+            'connections': len(self.connections),
+            'batches': batches,
+            'commands': commands,
+            'average_batch': commands / batches if batches else 0.0,
+        }
@@ -0,0 +1,183 @@
+import threading
+import weakref
+from queue import Empty
+from time import monotonic, perf_counter
+
+from redis.connection import BlockingConnectionPool
+from redis.exceptions import ConnectionError
+
+
+class TairConnectionPool(BlockingConnectionPool):
+    """
+    Blocking connection pool: at most ``max_connections`` connections, and a checkout waits up to ``timeout``
+    seconds for one to be released instead of opening more. On top of redis-py's ``BlockingConnectionPool``:
+
+    * ``warm_up`` connections are opened and PINGed at construction, so the first requests do not pay the connect
+    * every ``idle_check_interval`` seconds a background thread PINGs the connections that have been idle that
+      long, one at a time, and reconnects the broken ones, so checkouts do not find dead sockets
+    * ``stats()`` reports connections in use and idle, checkouts, wait times, timeouts and health checks
+    """
+
+    def __init__(self, max_connections=50, timeout=20, warm_up=0, idle_check_interval=None, **kwargs):
+        BlockingConnectionPool.__init__(self, max_connections=max_connections, timeout=timeout, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.health_checks = 0
+        self.health_failures = 0
+        self._idle_since = {}
+        self._stop = threading.Event()
+        self._checker = None
+        if warm_up:
+            self.warm_up(warm_up)
+        if idle_check_interval:
+            self.start_health_checks(idle_check_interval)
+
+    def get_connection(self, command_name, *keys, **options):
+        self._checkpid()
+        start = perf_counter()
+        try:
+            connection = self.pool.get(block=True, timeout=self.timeout)
+        except Empty:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise ConnectionError("No connection available.")
+        waited = perf_counter() - start
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            if waited > self.wait_max:
+                self.wait_max = waited
+
+        if connection is None:
+            connection = self.make_connection()
+        try:
+            connection.connect()
+            try:
+                if connection.can_read():
+                    raise ConnectionError('Connection has data')
+            except ConnectionError:
+                connection.disconnect()
+                connection.connect()
+                if connection.can_read():
+                    raise ConnectionError('Connection not ready')
+        except BaseException:
+            self.release(connection)
+            raise
+        return connection
+
+    def release(self, connection):
+        self._idle_since[id(connection)] = monotonic()
+        BlockingConnectionPool.release(self, connection)
+
+    def warm_up(self, count):
+        """
+        Open and PING up to ``count`` connections, then return them to the pool.
+        """
+        connections = []
+        try:
+            for _ in range(min(count, self.max_connections)):
+                connection = self.get_connection('PING')
+                connections.append(connection)
+                connection.send_command('PING')
+                connection.read_response()
+        finally:
+            for connection in connections:
+                self.release(connection)
+
+    def start_health_checks(self, interval):
+        """
+        Start the background thread that PINGs connections idle for ``interval`` seconds or more.
+        """
+        self.stop_health_checks()
+        self._stop = threading.Event()
+        self._checker = threading.Thread(target=_health_check_loop, args=(weakref.ref(self), interval, self._stop),
+                                         name='tair-pool-health', daemon=True)
+        self._checker.start()
+
+    def stop_health_checks(self):
+        if self._checker is not None:
+            self._stop.set()
+            self._checker.join()
+            self._checker = None
+
+    def _take_idle(self, idle_for):
+        # remove one connection idle for ``idle_for`` seconds from the queue, so no caller can check it out
+        queue = self.pool
+        now = monotonic()
+        with queue.mutex:
+            for connection in queue.queue:
+                if connection is not None and now - self._idle_since.get(id(connection), now) >= idle_for:
+                    queue.queue.remove(connection)
+                    return connection
+        return None
+
+    def check_idle(self, idle_for):
+        """
+        PING every connection idle for ``idle_for`` seconds, reconnecting those that fail. Returns the number checked.
+        """
+        checked = 0
+        seen = set()
+        while True:
+            connection = self._take_idle(idle_for)
+            if connection is None:
+                return checked
+            if id(connection) in seen:
+                # a connection this pass already checked went back to the end of the queue
+                self.release(connection)
+                return checked
+            seen.add(id(connection))
+            checked += 1
+            healthy = True
+            try:
+                connection.send_command('PING', check_health=False)
+                connection.read_response()
+            except Exception:
+                healthy = False
+                connection.disconnect()
+                try:
+                    connection.connect()
+                except Exception:
+                    pass
+            with self._stats_lock:
+                self.health_checks += 1
+                if not healthy:
+                    self.health_failures += 1
+            self.release(connection)
+
+    def stats(self):
+        """
+        :return: dict with max_connections, connections created, in_use and idle, checkouts, average and maximum wait
+                 for a connection in seconds, checkouts that timed out, and health checks run and failed
+        """
+        with self.pool.mutex:
+            idle = sum(1 for connection in self.pool.queue if connection is not None)
+        created = len(self._connections)
+        with self._stats_lock:
+            return {
+                'max_connections': self.max_connections,
+                'created': created,
+                'in_use': created - idle,
+                'idle': idle,
+                'checkouts': self.checkouts,
+                'average_wait': self.wait_total / self.checkouts if self.checkouts else 0.0,
+                'max_wait': self.wait_max,
+                'timeouts': self.timeouts,
+                'health_checks': self.health_checks,
+                'health_failures': self.health_failures,
+            }
+
+
+def _health_check_loop(pool_ref, interval, stop):
+    # holds the pool weakly, so an unused pool can be collected and its thread ends
+    while not stop.wait(interval):
+        pool = pool_ref()
+        if pool is None:
+            return
+        try:
+            pool.check_idle(interval)
+        except Exception:
+            pass
+        del pool
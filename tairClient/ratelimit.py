@@ -0,0 +1,141 @@
+import math
+import threading
+from time import time
+
+from redis.exceptions import ResponseError
+
+
+class Lease(object):
+    __slots__ = ('window', 'tokens', 'blocked_until')
+
+    def __init__(self, window):
+        self.window = window
+        self.tokens = 0
+        self.blocked_until = 0.0
+
+
+class RateLimiter(object):
+    """
+    Admits at most ``limit`` tokens per ``window`` seconds for every tenant, counted with EXHINCRBY on the fields
+    ``<tenant>:<window number>`` of the TairHash ``name``. Each field expires two windows after its last update.
+
+    Tokens are taken from the server ``lease`` at a time and handed out locally, so a process makes about one call
+    per ``lease`` admissions. Leased tokens are only good for the window they were taken in.
+
+    With ``sliding=False`` (fixed windows) EXHINCRBY runs with MAX, so the tokens leased in a window never exceed
+    ``limit`` whatever the number of processes. Admissions are never more than ``limit`` per window; tokens a
+    process leased but did not use are lost, at most ``lease - 1`` per process and window.
+
+    With ``sliding=True`` the count of the previous window is weighted by the share of it still inside the sliding
+    window, and a lease is cut down (the excess given back) so that the weighted count stays within ``limit``. The
+    estimate assumes the previous window's requests were spread evenly over it, so bursts at the end of a window can
+    pass up to ``limit`` more tokens in the sliding window. Leases and the remaining allowance are checked when
+    taken, so concurrent processes are still bounded by ``limit`` at that moment.
+
+    Windows are numbered from the local clock, so the processes sharing a limiter need synchronized clocks. After a
+    denial the tenant is answered locally until its counter may have room again. Local state is only kept for the
+    tenants seen in the current window.
+    """
+
+    def __init__(self, client, name, limit, window, sliding=False, lease=None):
+        if limit < 1 or window <= 0:
+            raise ValueError('limit and window must be positive')
+        self.client = client
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.sliding = sliding
+        self.lease = lease if lease is not None else max(1, limit // 20)
+        self._ttl = int(math.ceil(window * 2000))
+        self._lock = threading.Lock()
+        self._leases = {}
+        self._leases_window = None
+        self.allowed = 0
+        self.denied = 0
+        self.server_calls = 0
+
+    def acquire(self, tenant, tokens=1):
+        """
+        Take ``tokens`` for ``tenant`` and return True, or return False when its window is full.
+        """
+        now = time()
+        window = int(now // self.window)
+        with self._lock:
+            if window != self._leases_window:
+                # leases and blocks never outlive their window, drop those of past windows once per window
+                self._leases = {t: l for t, l in self._leases.items() if l.window >= window}
+                self._leases_window = window
+            lease = self._leases.get(tenant)
+            if lease is None or lease.window != window:
+                lease = self._leases[tenant] = Lease(window)
+            if lease.tokens >= tokens:
+                lease.tokens -= tokens
+                self.allowed += 1
+                return True
+            if now < lease.blocked_until:
+                self.denied += 1
+                return False
+        granted, blocked_until = self._take(tenant, window, now, tokens, max(tokens, self.lease))
+        with self._lock:
+            self.server_calls += 1
+            if lease.window == window:
+                lease.tokens += granted
+                lease.blocked_until = max(lease.blocked_until, blocked_until)
+                if lease.tokens >= tokens:
+                    lease.tokens -= tokens
+                    self.allowed += 1
+                    return True
+            self.denied += 1
+            return False
+
+    def _field(self, tenant, window):
+        return '%s:%d' % (tenant, window)
+
+    def _take(self, tenant, window, now, tokens, amount):
+        """
+        Lease up to ``amount`` tokens from the server, or at least ``tokens``. Return the number granted and until
+        when to stop asking.
+        """
+        window_end = (window + 1) * self.window
+        if not self.sliding:
+            field = self._field(tenant, window)
+            for size in (amount, tokens) if amount > tokens else (amount,):
+                try:
+                    self.client.exhincrby(self.name, field, size, px=self._ttl, maxval=self.limit)
+                    return size, 0.0
+                except ResponseError as e:
+                    if 'overflow' not in str(e):
+                        raise
+            return 0, window_end
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.exhget(self.name, self._field(tenant, window - 1))
+        pipe.exhincrby(self.name, self._field(tenant, window), amount, px=self._ttl)
+        previous, count = pipe.execute()
+        previous = int(previous or 0)
+        weight = 1.0 - (now - window * self.window) / self.window
+        room = self.limit - previous * weight - (count - amount)
+        granted = min(amount, int(room))
+        if granted < tokens:
+            granted = 0
+        if granted < amount:
+            self.client.exhincrby(self.name, self._field(tenant, window), granted - amount)
+        if granted:
+            return granted, 0.0
+        # the previous window's weight falls by previous / window per second
+        excess = tokens - room
+        wait = excess * self.window / previous if previous else window_end - now
+        return 0, min(now + wait, window_end)
+
+    def stats(self):
+        """
+        :return: dict with requests allowed and denied, server calls, and the share of requests answered locally
+        """
+        with self._lock:
+            requests = self.allowed + self.denied
+            return {
+                'allowed': self.allowed,
+                'denied': self.denied,
+                'server_calls': self.server_calls,
+                'local_ratio': 1 - self.server_calls / requests if requests else 0.0,
+            }
@@ -0,0 +1,383 @@
+from array import array
+
+from redis.connection import Connection, SocketBuffer, SSLConnection, UnixDomainSocketConnection
+from redis.exceptions import DataError, InvalidResponse, ResponseError
+
+SYM_CRLF = b'\r\n'
+NULL_BULK = b'$-1'
+
+# command options asking for a reply of numbers decoded into an array, see read_numeric_array
+NUMERIC_ARRAY = 'numeric_array'
+NUMERIC_NUMPY = 'as_numpy'
+
+# option tokens of the exh* commands, cached from the start
+CONSTANT_TOKENS = (
+    'EX', 'EXAT', 'PX', 'PXAT', 'NX', 'XX', 'VER', 'Abs', 'NOACTIVE', 'Min', 'Max', 'FLAGS', 'WITHVERSION',
+    'WITHFLAGS', 'NONEGATIVE', 'MATCH', 'COUNT', 'NOEXP',
+)
+
+
+def bulk_string(value):
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+class CommandPacker(object):
+    """
+    Packs commands into RESP without re-encoding what was seen before. The header of a command, the array length
+    plus the encoded command name, is cached per (command, number of arguments), which is what a command's option
+    set changes. Bulk strings of the option tokens are cached from the start, and str, bytes and int arguments of up
+    to ``max_length`` bytes, typically keys and field names, are cached the second time they are packed, until
+    ``max_entries`` are cached.
+
+    Caches are shared by every connection of a pool; each connection packs into its own reusable buffer.
+    """
+
+    def __init__(self, encoder, max_entries=10000, max_length=64):
+        self.encoder = encoder
+        self.max_entries = max_entries
+        self.max_length = max_length
+        self._headers = {}
+        self._bulks = {}
+        self._seen = set()
+        for token in CONSTANT_TOKENS:
+            self._bulks[token] = bulk_string(token.encode())
+
+    def header(self, command, argc):
+        header = self._headers.get((command, argc))
+        if header is None:
+            # like redis-py, 'CLIENT TRACKING' style names are sent as separate arguments
+            words = self.encoder.encode(command).split()
+            header = b'*%d\r\n' % (argc + len(words) - 1) + b''.join(bulk_string(w) for w in words)
+            if len(self._headers) < self.max_entries:
+                self._headers[(command, argc)] = header
+        return header
+
+    def pack(self, commands, buffer, buffer_cutoff):
+        """
+        Pack a sequence of argument tuples into ``buffer`` and return the chunks to send. Values longer than
+        ``buffer_cutoff`` are returned as chunks of their own instead of being copied.
+        """
+        encode = self.encoder.encode
+        bulks = self._bulks
+        seen = self._seen
+        max_length = self.max_length
+        output = []
+        del buffer[:]
+        for args in commands:
+            buffer += self.header(args[0], len(args))
+            for i in range(1, len(args)):
+                arg = args[i]
+                kind = type(arg)
+                cacheable = kind is str or kind is bytes or kind is int
+                if cacheable:
+                    chunk = bulks.get(arg)
+                    if chunk is not None:
+                        buffer += chunk
+                        continue
+                value = encode(arg)
+                length = len(value)
+                if length > buffer_cutoff or isinstance(value, memoryview):
+                    buffer += b'$%d\r\n' % length
+                    output.append(bytes(buffer))
+                    output.append(value)
+                    del buffer[:]
+                    buffer += SYM_CRLF
+                    continue
+                buffer += b'$%d\r\n' % length
+                buffer += value
+                buffer += SYM_CRLF
+                if cacheable and length <= max_length:
+                    if arg in seen:
+                        if len(bulks) < self.max_entries:
+                            bulks[arg] = bulk_string(value)
+                    elif len(seen) < self.max_entries:
+                        seen.add(arg)
+                    else:
+                        seen.clear()
+            if len(buffer) > buffer_cutoff:
+                output.append(bytes(buffer))
+                del buffer[:]
+        if buffer:
+            output.append(bytes(buffer))
+        return output
+
+
+class PackerConnectionMixin(object):
+    """
+    Replaces redis-py's ``pack_command`` and ``pack_commands`` with a shared ``CommandPacker``.
+    """
+
+    packer = None
+    _pack_buffer = None
+
+    def pack_command(self, *args):
+        return self.pack_commands((args,))
+
+    def pack_commands(self, commands):
+        buffer = self._pack_buffer
+        if buffer is None:
+            buffer = self._pack_buffer = bytearray()
+        return self.packer.pack(commands, buffer, self._buffer_cutoff)
+
+
+class PackerConnection(PackerConnectionMixin, Connection):
+    pass
+
+
+class PackerSSLConnection(PackerConnectionMixin, SSLConnection):
+    pass
+
+
+class PackerUnixDomainSocketConnection(PackerConnectionMixin, UnixDomainSocketConnection):
+    pass
+
+
+PACKER_CONNECTION_CLASSES = {
+    Connection: PackerConnection,
+    SSLConnection: PackerSSLConnection,
+    UnixDomainSocketConnection: PackerUnixDomainSocketConnection,
+}
+
+
+def install_packer(connection_pool, **packer_options):
+    """
+    Make every connection of ``connection_pool`` pack commands with one shared ``CommandPacker``. Must be called
+    before the pool creates its first connection.
+    :return: the CommandPacker
+    """
+    cls = connection_pool.connection_class
+    if issubclass(cls, PackerConnectionMixin):
+        return cls.packer
+    packer = CommandPacker(connection_pool.get_encoder(), **packer_options)
+    base = PACKER_CONNECTION_CLASSES.get(cls)
+    base = base if base is not None else type('Packer' + cls.__name__, (PackerConnectionMixin, cls), {})
+    connection_pool.connection_class = type(base.__name__, (base,), {'packer': packer})
+    return packer
+
+
+# ###################################### numeric replies ######################################################
+
+def numeric_array(values, typecode='d', as_numpy=False, missing=None):
+    """
+    Convert a list of bulk strings, None for missing ones, into ``(values, mask)``: an ``array(typecode)``, or a
+    NumPy array of that dtype with ``as_numpy``, and a mask that is 1 (True) where the value was missing. Missing
+    values are NaN in float arrays and 0 in integer ones.
+    :param missing: indexes of the None values when the caller knows them, found by scanning ``values`` otherwise
+    """
+    if missing is None:
+        missing = [i for i, value in enumerate(values) if value is None] if None in values else ()
+    is_float = typecode in ('f', 'd')
+    if missing:
+        filler = b'nan' if is_float else b'0'
+        for i in missing:
+            values[i] = filler
+    if as_numpy:
+        import numpy
+        # numpy parses the bytes in C once they are in one fixed width array
+        result = numpy.array(values, dtype=bytes).astype(numpy.dtype(typecode)) if values else \
+            numpy.zeros(0, dtype=numpy.dtype(typecode))
+        mask = numpy.zeros(len(values), dtype=bool)
+        mask[list(missing)] = True
+        return result, mask
+    result = array(typecode, map(float if is_float else int, values))
+    mask = bytearray(len(values))
+    for i in missing:
+        mask[i] = 1
+    return result, mask
+
+
+def _buffered(buffer):
+    # the bytes received but not yet consumed, without consuming them
+    with buffer._buffer.getbuffer() as view:
+        return bytes(view[buffer.bytes_read:buffer.bytes_written])
+
+
+def _split_array(data, count):
+    """
+    Split the array of ``count`` bulk strings at the start of ``data`` into its values, None for nulls. Returns
+    (values, missing indexes, bytes used), None when ``data`` does not hold the whole array yet, or False when a
+    value holds a line break and the reply must go through the regular parser.
+    """
+    tokens = data.split(SYM_CRLF, 2 * count + 1)
+    lines = tokens[:-1]
+    if len(lines) >= 2 * count + 1:
+        lengths = lines[1:2 * count + 1:2]
+        if NULL_BULK not in lengths:
+            # no null, so every value is the line after its length: check the declared lengths add up
+            values = lines[2:2 * count + 1:2]
+            declared = b''.join(lengths).split(b'$')
+            if declared[0] or len(declared) != count + 1 or sum(map(int, declared[1:])) != sum(map(len, values)):
+                return False
+            return values, (), len(data) - len(tokens[-1])
+    values = []
+    missing = []
+    j = 1
+    available = len(lines)
+    for i in range(count):
+        if j >= available:
+            return None
+        line = lines[j]
+        if line == NULL_BULK:
+            missing.append(i)
+            values.append(None)
+            j += 1
+            continue
+        if j + 1 >= available:
+            return None
+        value = lines[j + 1]
+        if line[:1] != b'$' or int(line[1:]) != len(value):
+            return False
+        values.append(value)
+        j += 2
+    return values, missing, sum(map(len, lines[:j])) + 2 * j
+
+
+def read_numeric_reply(parser, typecode='d', as_numpy=False):
+    """
+    Read the next reply, an array of numbers as bulk strings, as ``(values, mask)`` (see numeric_array). With
+    redis-py's Python parser the array is split with a few bytes operations on the received data instead of one
+    parser call and bytes object per line. Other replies go through the parser: a null array is returned as None and
+    an error reply as the ResponseError, like ``parser.read_response()`` does.
+    """
+    buffer = getattr(parser, '_buffer', None)
+    if not isinstance(buffer, SocketBuffer):
+        return _parse_numeric_reply(parser, typecode, as_numpy)
+    data = _buffered(buffer)
+    while True:
+        header_end = data.find(SYM_CRLF)
+        if header_end != -1:
+            if data[:1] != b'*' or data[1:2] == b'-':
+                break
+            count = int(data[1:header_end])
+            # a null takes one line instead of two; counting the nulls of whatever follows only means trying early
+            if data.count(SYM_CRLF) >= 2 * count + 1 - data.count(NULL_BULK + SYM_CRLF):
+                split = _split_array(data, count)
+                if split is False:
+                    break
+                if split is not None:
+                    values, missing, used = split
+                    buffer.bytes_read += used
+                    if buffer.bytes_read == buffer.bytes_written:
+                        buffer.purge()
+                    return numeric_array(values, typecode, as_numpy, missing)
+        buffer._read_from_socket()
+        data = _buffered(buffer)
+    return _parse_numeric_reply(parser, typecode, as_numpy)
+
+
+def _parse_numeric_reply(parser, typecode, as_numpy):
+    response = parser.read_response()
+    if response is None or isinstance(response, ResponseError):
+        return response
+    return numeric_array(response, typecode, as_numpy)
+
+
+def read_numeric_array(connection, typecode='d', as_numpy=False):
+    """
+    Like ``connection.read_response()`` for a reply of numbers, returning ``(values, mask)``, see read_numeric_reply.
+    """
+    try:
+        response = read_numeric_reply(connection._parser, typecode, as_numpy)
+    except BaseException:
+        connection.disconnect()
+        raise
+    if isinstance(response, ResponseError):
+        raise response
+    return response
+
+
+# ###################################### streamed replies ######################################################
+
+def _read_array_header(parser, buffer):
+    # return (element count, bytes used by the header) of the array reply at the start of the buffer
+    data = _buffered(buffer)
+    while True:
+        end = data.find(SYM_CRLF)
+        if end != -1:
+            break
+        buffer._read_from_socket()
+        data = _buffered(buffer)
+    if data[:1] != b'*':
+        response = parser.read_response()
+        if isinstance(response, ResponseError):
+            raise response
+        raise DataError('expected an array reply, got %r' % (response,))
+    return int(data[1:end]), end + 2
+
+
+def iter_array_reply(parser, compact_at=1 << 20):
+    """
+    Yield the elements of the next reply, an array of bulk strings, nulls or integers, while it is being received.
+    Each batch of elements is parsed from what the socket returned so far, so at most about ``compact_at`` bytes
+    of consumed reply plus one element are held, instead of the whole reply as one list. An error reply raises the
+    ResponseError.
+
+    The connection must not be used for anything else until the generator is exhausted. When it is closed early,
+    the rest of the reply is still unread: disconnect the connection before it goes back to a pool.
+
+    Parsers without redis-py's socket buffer (hiredis) read the whole reply first and yield from it.
+    """
+    buffer = getattr(parser, '_buffer', None)
+    if not isinstance(buffer, SocketBuffer):
+        response = parser.read_response()
+        if isinstance(response, ResponseError):
+            raise response
+        for item in response or ():
+            yield item
+        return
+    encoder = parser.encoder
+    decode = encoder.decode if encoder.decode_responses else None
+    count, pos = _read_array_header(parser, buffer)
+    if count <= 0:
+        buffer.bytes_read += pos
+        if buffer.bytes_read == buffer.bytes_written:
+            buffer.purge()
+        return
+    data = _buffered(buffer)
+    while True:
+        items = []
+        needed = None
+        size = len(data)
+        while count:
+            end = data.find(SYM_CRLF, pos)
+            if end == -1:
+                break
+            kind = data[pos:pos + 1]
+            if kind == b'$':
+                length = int(data[pos + 1:end])
+                if length < 0:
+                    items.append(None)
+                    pos = end + 2
+                else:
+                    stop = end + 2 + length
+                    if stop + 2 > size:
+                        # read the rest of a large value at once instead of one chunk at a time
+                        needed = stop + 2 - size
+                        break
+                    items.append(data[end + 2:stop])
+                    pos = stop + 2
+            elif kind == b':':
+                items.append(int(data[pos + 1:end]))
+                pos = end + 2
+            else:
+                raise InvalidResponse('Protocol Error: %r' % data[pos:end])
+            count -= 1
+
+        buffer.bytes_read += pos
+        if buffer.bytes_read == buffer.bytes_written:
+            buffer.purge()
+        elif buffer.bytes_read >= compact_at:
+            # the socket buffer only shrinks when it is fully consumed, which a long reply may never be
+            rest = data[pos:]
+            buffer.purge()
+            buffer._buffer.write(rest)
+            buffer.bytes_written = len(rest)
+        if decode is not None:
+            items = [decode(item) if isinstance(item, bytes) else item for item in items]
+        for item in items:
+            yield item
+        if not count:
+            return
+        buffer._read_from_socket(needed)
+        data = _buffered(buffer)
+        pos = 0
@@ -0,0 +1,266 @@
+import random
+import threading
+from time import monotonic
+
+from redis._compat import nativestr
+from redis.connection import ConnectionPool
+from redis.exceptions import ConnectionError, TimeoutError
+
+from .cache import WRITE_COMMAND_FIELDS
+
+# read-only TairHash commands, by what they read: one field (args[2]), the fields args[2:], or the whole key
+READ_COMMAND_FIELDS = {
+    'EXHGET': 'one',
+    'EXHGETWITHVER': 'one',
+    'EXHTTL': 'one',
+    'EXHPTTL': 'one',
+    'EXHVER': 'one',
+    'EXHEXISTS': 'one',
+    'EXHSTRLEN': 'one',
+    'EXHMGET': 'rest',
+    'EXHMGETWITHVER': 'rest',
+    'EXHGETALL': 'all',
+    'EXHSCAN': 'all',
+    'EXHLEN': 'all',
+    'EXHKEYS': 'all',
+    'EXHVALS': 'all',
+}
+
+# writes whose field version afterwards can be told from their arguments: VER v gives v + 1, ABS a gives a
+VERSIONED_WRITES = {'EXHSET', 'EXHINCRBY', 'EXHINCRBYFLOAT', 'EXHEXPIRE', 'EXHPEXPIRE', 'EXHEXPIREAT',
+                    'EXHPEXPIREAT'}
+
+
+def written_version(command, args):
+    """
+    Return the version a successful write leaves the field with, None when the arguments do not tell.
+    """
+    if command == 'EXHSETVER':
+        return int(args[3])
+    if command not in VERSIONED_WRITES:
+        return None
+    for i in range(4, len(args) - 1):
+        token = nativestr(args[i]).upper() if isinstance(args[i], (str, bytes)) else None
+        if token == 'ABS':
+            return int(args[i + 1])
+        if token == 'VER':
+            return int(args[i + 1]) + 1
+    return None
+
+
+class Replica(object):
+    __slots__ = ('node', 'pool', 'outstanding', 'reads', 'errors', 'down_until')
+
+    def __init__(self, node, pool):
+        self.node = node
+        self.pool = pool
+        self.outstanding = 0
+        self.reads = 0
+        self.errors = 0
+        self.down_until = 0.0
+
+
+class ReplicaRouter(object):
+    """
+    Sends the read-only exh* commands of a client to replicas and leaves everything else on the primary. Each read
+    goes to the replica with the fewest requests in flight; a replica that fails is skipped for ``retry_interval``
+    seconds and the read is retried on the primary.
+
+    With ``read_your_writes``, the fields written through the client are pinned to the primary for at most
+    ``max_lag`` seconds, and so are the key-level reads (exhgetall, exhscan, exhlen, ...) of their keys. When the
+    write set a known version (VER, ABS or EXHSETVER), an exhget or exhgetwithver of the pinned field asks a replica
+    with EXHGETWITHVER instead: a replica that has the version answers and ends the pin, an older one is skipped
+    for the primary. Writes made by other clients are not seen, replicas may lag behind them.
+
+    Used by :meth:`tairClient.client.Client.enable_replica_reads`.
+    """
+
+    def __init__(self, client, replicas, read_your_writes=False, max_lag=1.0, retry_interval=5.0, max_pins=100000):
+        primary = client.connection_pool
+        self.client = client
+        self.encoder = primary.get_encoder()
+        self.replicas = []
+        for node in replicas:
+            kwargs = dict(primary.connection_kwargs)
+            kwargs['host'], kwargs['port'] = node[0], int(node[1])
+            pool = ConnectionPool(connection_class=primary.connection_class, **kwargs)
+            self.replicas.append(Replica((node[0], int(node[1])), pool))
+        if not self.replicas:
+            raise ValueError('at least one replica is needed')
+        self.read_your_writes = read_your_writes
+        self.max_lag = max_lag
+        self.retry_interval = retry_interval
+        self.max_pins = max_pins
+        self._lock = threading.Lock()
+        # (name, field) -> [version or None, deadline]; name -> deadline of any write to the key, and of the writes
+        # that may have changed every field of it (DEL, EXPIRE, scripts)
+        self._pinned_fields = {}
+        self._pinned_keys = {}
+        self._pinned_whole = {}
+        self._all_pinned_until = 0.0
+        self.primary_reads = 0
+        self.caught_up = 0
+
+    # ----- writes -----
+
+    def note_write(self, args):
+        """
+        Pin what a write touched to the primary, when read-your-writes is on.
+        """
+        if not self.read_your_writes:
+            return
+        command = nativestr(args[0]).upper()
+        kind = WRITE_COMMAND_FIELDS.get(command)
+        if kind is None or len(args) < 2:
+            return
+        encode = self.encoder.encode
+        deadline = monotonic() + self.max_lag
+        if kind == 'keys':
+            names = args[3:3 + int(args[2])]
+        elif command in ('DEL', 'UNLINK'):
+            names = args[1:]
+        else:
+            names = [args[1]]
+        with self._lock:
+            if len(self._pinned_fields) + len(self._pinned_keys) >= self.max_pins:
+                self._prune()
+            for name in names:
+                self._pinned_keys[encode(name)] = deadline
+                if kind in ('all', 'keys'):
+                    self._pinned_whole[encode(name)] = deadline
+            name = encode(args[1])
+            if kind == 'one':
+                self._pinned_fields[name, encode(args[2])] = [written_version(command, args), deadline]
+            elif kind == 'rest':
+                for field in args[2:]:
+                    self._pinned_fields[name, encode(field)] = [None, deadline]
+            elif kind == 'pairs':
+                for field in args[2::2]:
+                    self._pinned_fields[name, encode(field)] = [None, deadline]
+
+    def _prune(self):
+        now = monotonic()
+        self._pinned_fields = {k: v for k, v in self._pinned_fields.items() if v[1] > now}
+        self._pinned_keys = {k: v for k, v in self._pinned_keys.items() if v > now}
+        self._pinned_whole = {k: v for k, v in self._pinned_whole.items() if v > now}
+        if len(self._pinned_fields) + len(self._pinned_keys) >= self.max_pins:
+            # every pin is recent: rather than grow, send all reads to the primary until they would have expired
+            self._pinned_fields.clear()
+            self._pinned_keys.clear()
+            self._pinned_whole.clear()
+            self._all_pinned_until = now + self.max_lag
+
+    def _pin(self, kind, args):
+        """
+        Return None when the read may go to a replica, else (version, pin key); version is None when only the
+        primary is known to be up to date.
+        """
+        now = monotonic()
+        name = self.encoder.encode(args[1])
+        with self._lock:
+            if now < self._all_pinned_until:
+                return None, None
+            deadline = self._pinned_keys.get(name)
+            if deadline is None or deadline <= now:
+                return None
+            deadline = self._pinned_whole.get(name)
+            if kind == 'all' or (deadline is not None and deadline > now):
+                return None, None
+            fields = [args[2]] if kind == 'one' else args[2:]
+            pins = []
+            for field in fields:
+                key = (name, self.encoder.encode(field))
+                pin = self._pinned_fields.get(key)
+                if pin is not None and pin[1] > now:
+                    pins.append((pin[0], key))
+            if not pins:
+                return None
+            return pins[0] if kind == 'one' else (None, None)
+
+    # ----- reads -----
+
+    def read(self, send_primary, args, options):
+        """
+        Run a read-only command on a replica, or through ``send_primary`` when its data is pinned to the primary
+        or no replica answers.
+        """
+        command = nativestr(args[0]).upper()
+        pin = self._pin(READ_COMMAND_FIELDS[command], args) if self.read_your_writes else None
+        if pin is not None:
+            version, key = pin
+            if version is not None and command in ('EXHGET', 'EXHGETWITHVER'):
+                reply = self._read_replica(('EXHGETWITHVER', args[1], args[2]), {})
+                if reply is not None and reply is not False and int(reply[1]) >= version:
+                    with self._lock:
+                        if self._pinned_fields.get(key, [None])[0] == version:
+                            del self._pinned_fields[key]
+                        self.caught_up += 1
+                    return reply if command == 'EXHGETWITHVER' else reply[0]
+            with self._lock:
+                self.primary_reads += 1
+            return send_primary(*args, **options)
+        reply = self._read_replica(args, options)
+        if reply is False:
+            with self._lock:
+                self.primary_reads += 1
+            return send_primary(*args, **options)
+        return reply
+
+    def _choose(self):
+        now = monotonic()
+        with self._lock:
+            candidates = [r for r in self.replicas if r.down_until <= now]
+            if not candidates:
+                return None
+            fewest = min(r.outstanding for r in candidates)
+            replica = random.choice([r for r in candidates if r.outstanding == fewest])
+            replica.outstanding += 1
+            return replica
+
+    def _read_replica(self, args, options):
+        # returns False when no replica could answer
+        replica = self._choose()
+        if replica is None:
+            return False
+        pool = replica.pool
+        try:
+            try:
+                connection = pool.get_connection(args[0])
+                try:
+                    connection.send_command(*args)
+                    reply = self.client.parse_response(connection, args[0], **options)
+                except (ConnectionError, TimeoutError):
+                    connection.disconnect()
+                    raise
+                finally:
+                    pool.release(connection)
+            except (ConnectionError, TimeoutError):
+                with self._lock:
+                    replica.errors += 1
+                    replica.down_until = monotonic() + self.retry_interval
+                return False
+            with self._lock:
+                replica.reads += 1
+            return reply
+        finally:
+            # error replies too, or they would skew the least outstanding choice for good
+            with self._lock:
+                replica.outstanding -= 1
+
+    def stats(self):
+        """
+        :return: dict with the reads served by each replica, its requests in flight and failures, the reads sent to
+                 the primary, and the pinned reads a caught-up replica answered
+        """
+        with self._lock:
+            return {
+                'replicas': {'%s:%s' % r.node: {'reads': r.reads, 'outstanding': r.outstanding, 'errors': r.errors}
+                             for r in self.replicas},
+                'primary_reads': self.primary_reads,
+                'caught_up': self.caught_up,
+                'pinned_fields': len(self._pinned_fields),
+            }
+
+    def close(self):
+        for replica in self.replicas:
+            replica.pool.disconnect()
@@ -0,0 +1,221 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+
+def page_items(page):
+    """
+    Return the (field, value) pairs of an exhscan page, decoded (dict) or raw (flat list).
+    """
+    if isinstance(page, dict):
+        return list(page.items())
+    it = iter(page)
+    return list(zip(it, it))
+
+
+def page_bytes(items):
+    size = 0
+    for field, value in items:
+        size += len(field) if isinstance(field, (bytes, str)) else 8
+        size += len(value) if isinstance(value, (bytes, str)) else 8
+    return size
+
+
+class AdaptiveCount(object):
+    """
+    Tunes the COUNT hint of successive scan calls so that a page takes about ``target_latency`` seconds and
+    carries about ``target_bytes`` bytes, whichever limit is hit first. COUNT grows or shrinks by at most a
+    factor of two per page and stays within [minimum, maximum].
+    """
+
+    def __init__(self, initial=100, minimum=10, maximum=10000, target_latency=0.005, target_bytes=256 * 1024):
+        self.count = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.target_bytes = target_bytes
+
+    def update(self, elapsed, nbytes):
+        """
+        Record how long the last page took and how large it was, and return the next COUNT.
+        """
+        factor = 2.0
+        if elapsed > 0:
+            factor = min(factor, self.target_latency / elapsed)
+        if nbytes > 0:
+            factor = min(factor, float(self.target_bytes) / nbytes)
+        factor = max(factor, 0.5)
+        self.count = int(min(self.maximum, max(self.minimum, self.count * factor)))
+        return self.count
+
+
+def exhscan_iter(client, name, match=None, count=None, prefetch=True, **adaptive_options):
+    """
+    Yield the (field, value) pairs of a TairHash with repeated EXHSCAN calls. See ``Client.exhscan_iter``.
+    """
+    tuner = None if count is not None else AdaptiveCount(**adaptive_options)
+
+    def fetch(cursor, page_count):
+        start = monotonic()
+        cursor, page = client.exhscan(name, cursor, match=match, count=page_count)
+        return int(cursor), page_items(page), monotonic() - start
+
+    def next_count(items, elapsed):
+        return count if tuner is None else tuner.update(elapsed, page_bytes(items))
+
+    if not prefetch:
+        cursor, items, elapsed = fetch(0, count if tuner is None else tuner.count)
+        while True:
+            for item in items:
+                yield item
+            if cursor == 0:
+                return
+            cursor, items, elapsed = fetch(cursor, next_count(items, elapsed))
+
+    # one worker fetches page n + 1 on its own pooled connection while page n is consumed
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(fetch, 0, count if tuner is None else tuner.count)
+    try:
+        while True:
+            cursor, items, elapsed = future.result()
+            if cursor != 0:
+                future = executor.submit(fetch, cursor, next_count(items, elapsed))
+            for item in items:
+                yield item
+            if cursor == 0:
+                return
+    finally:
+        # an abandoned iterator lets the in-flight page finish in the background and drops it
+        future.cancel()
+        executor.shutdown(wait=False)
+
+
+# EXHSCAN key op subkey positions of the enterprise scan
+OP_FIRST = '^'
+OP_GE = '>='
+
+
+def partition_ranges(boundaries):
+    """
+    Turn sorted split points [b1, ..., bn] into the ranges (None, b1), (b1, b2), ..., (bn, None), where each
+    range holds the fields ``start <= field < end`` and None is an open end.
+    """
+    points = [None] + list(boundaries) + [None]
+    return list(zip(points[:-1], points[1:]))
+
+
+def sample_split_points(client, name, partitions, samples=1000):
+    """
+    Pick ``partitions - 1`` split points that divide the fields of a TairHash into ranges of similar size.
+    EXHSCAN walks the hash in bucket order, which is unrelated to field order, so the first ``samples`` fields
+    it returns are a random sample; their quantiles are the split points.
+    :return: sorted list of split points as bytes, shorter when the hash has few fields
+    """
+    encode = client.connection_pool.get_encoder().encode
+    fields = set()
+    cursor = 0
+    while len(fields) < samples:
+        cursor, page = client.exhscan(name, cursor, count=samples - len(fields))
+        fields.update(encode(field) for field, _ in page_items(page))
+        if int(cursor) == 0:
+            break
+    fields = sorted(fields)
+    points = set(fields[len(fields) * i // partitions] for i in range(1, partitions)) if fields else set()
+    return sorted(points)
+
+
+def range_pages(client, name, start=None, end=None, match=None, count=None):
+    """
+    Yield the pages of fields ``start <= field < end`` with EXHSCAN key op subkey, as lists of (field, value) pairs
+    in field order.
+    """
+    encode = client.connection_pool.get_encoder().encode
+    if end is not None:
+        end = encode(end)
+    op, subkey = (OP_GE, start) if start is not None else (OP_FIRST, '')
+    while True:
+        cursor, page = client.exhscan_ee(name, op, subkey, match=match, count=count)
+        items = page_items(page)
+        if end is not None and items and encode(items[-1][0]) >= end:
+            items = [item for item in items if encode(item[0]) < end]
+            if items:
+                yield items
+            return
+        if items:
+            yield items
+        if not cursor:
+            return
+        # the cursor is the next field; with a selective MATCH the pages may never show a field past the end
+        if end is not None and encode(cursor) >= end:
+            return
+        op, subkey = OP_GE, cursor
+
+
+def exhscan_partitioned(client, name, partitions=None, boundaries=None, callback=None, match=None, count=1000,
+                        samples=1000, max_workers=None):
+    """
+    Scan a TairHash as independent field ranges in a thread pool. See ``Client.exhscan_partitioned``.
+    """
+    if boundaries is None:
+        partitions = partitions or os.cpu_count() or 1
+        boundaries = sample_split_points(client, name, partitions, samples) if partitions > 1 else []
+    ranges = partition_ranges(boundaries)
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(ranges))
+
+    if callback is not None:
+        def scan_partition(index, start, end):
+            scanned = 0
+            for items in range_pages(client, name, start, end, match, count):
+                callback(index, items)
+                scanned += len(items)
+            return scanned
+
+        try:
+            futures = [executor.submit(scan_partition, i, start, end) for i, (start, end) in enumerate(ranges)]
+            return [future.result() for future in futures]
+        finally:
+            executor.shutdown(wait=False)
+
+    return _merged_pages(executor, client, name, ranges, match, count)
+
+
+def _merged_pages(executor, client, name, ranges, match, count):
+    pages = queue.Queue(maxsize=2 * len(ranges))
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def scan_partition(start, end):
+        try:
+            for items in range_pages(client, name, start, end, match, count):
+                if not put(items):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    for start, end in ranges:
+        executor.submit(scan_partition, start, end)
+    remaining = len(ranges)
+    try:
+        while remaining:
+            items = pages.get()
+            if items is None:
+                remaining -= 1
+            elif isinstance(items, Exception):
+                raise items
+            else:
+                for item in items:
+                    yield item
+    finally:
+        stopped.set()
+        executor.shutdown(wait=False)
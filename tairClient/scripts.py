@@ -0,0 +1,70 @@
+from redis.client import Script
+
+# KEYS[1] hash, ARGV field, value, EXHSET options...
+EXHGET_OR_SET = """
+local value = redis.call('EXHGET', KEYS[1], ARGV[1])
+if value then
+    return value
+end
+redis.call('EXHSET', KEYS[1], ARGV[1], ARGV[2], unpack(ARGV, 3))
+return ARGV[2]
+"""
+
+# KEYS[1] hash, ARGV field, version
+EXHDEL_IF_VERSION = """
+if redis.call('EXHVER', KEYS[1], ARGV[1]) ~= tonumber(ARGV[2]) then
+    return 0
+end
+return redis.call('EXHDEL', KEYS[1], ARGV[1])
+"""
+
+# KEYS[1] hash, ARGV field, increment, EXHINCRBY options...
+EXHINCRBY_PTTL = """
+local value = redis.call('EXHINCRBY', KEYS[1], ARGV[1], ARGV[2], unpack(ARGV, 3))
+return {value, redis.call('EXHPTTL', KEYS[1], ARGV[1])}
+"""
+
+# KEYS[1] source hash, KEYS[2] destination hash, ARGV field
+EXHMOVE = """
+local value = redis.call('EXHGET', KEYS[1], ARGV[1])
+if not value then
+    return 0
+end
+local pttl = redis.call('EXHPTTL', KEYS[1], ARGV[1])
+if pttl > 0 then
+    redis.call('EXHSET', KEYS[2], ARGV[1], value, 'PX', pttl)
+else
+    redis.call('EXHSET', KEYS[2], ARGV[1], value)
+end
+redis.call('EXHDEL', KEYS[1], ARGV[1])
+return 1
+"""
+
+SCRIPTS = {
+    'exhget_or_set': EXHGET_OR_SET,
+    'exhdel_if_version': EXHDEL_IF_VERSION,
+    'exhincrby_pttl': EXHINCRBY_PTTL,
+    'exhmove': EXHMOVE,
+}
+
+
+class ScriptRegistry(object):
+    """
+    The Lua scripts behind the composite exh* operations of :class:`tairClient.client.Client`, as redis-py
+    ``Script`` objects. A script runs with EVALSHA; on NOSCRIPT it is loaded and run again. In a pipeline the
+    scripts used are loaded with SCRIPT LOAD before the pipeline is sent, so every operation is one command of
+    the pipeline. Cluster pipelines do not do that, call :meth:`load` first.
+    """
+
+    def __init__(self, client):
+        self.scripts = {name: Script(client, source) for name, source in SCRIPTS.items()}
+
+    def run(self, client, name, keys, args):
+        return self.scripts[name](keys, args, client=client)
+
+    def load(self, client):
+        """
+        SCRIPT LOAD every script, on every primary for a ClusterClient.
+        """
+        for script in self.scripts.values():
+            client.script_load(script.script)
@@ -0,0 +1,965 @@
+"""
+In-process stand-in for a Tair server with the TairHash module, for tests and benchmarks without a real Tair.
+
+    python -m tairClient.server --port 6379 --rtt 0.0005 --jitter 0.0002
+
+TairHash semantics follow Tair: per-field TTLs with lazy and active expiration (NOACTIVE fields only expire
+lazily), versions with VER and ABS, NX/XX, Min/Max on increments, EXHSCAN cursors and the enterprise
+``EXHSCAN key op subkey`` form, and EXHLEN with NOEXP. Fields are returned newest first like Tair. Besides the
+exh* commands only a few key and connection commands are implemented (DEL, EXISTS, TYPE, KEYS, DBSIZE, FLUSHALL,
+MULTI/EXEC, PING, ...). There is no Lua: EVAL, EVALSHA and SCRIPT LOAD accept only the scripts of
+``tairClient.scripts``, run by Python equivalents. ``set_cluster`` makes a server one primary of a cluster of
+stand-ins: CLUSTER SLOTS, MOVED for slots other nodes own, and ASK/ASKING for slots being migrated.
+
+Latency injection, to measure pipelining, pooling and caching against realistic round trips:
+
+* ``rtt``: seconds added once per batch of commands read together, so a pipeline pays it once; batches written
+  back to back on one connection overlap their round trips
+* ``latency``: seconds of service time per command, a number or a dict of command name -> seconds, served one
+  batch after another on each connection
+* ``jitter``: up to this many extra seconds, uniformly drawn, per batch
+* ``bandwidth``: bytes per second shared by all replies
+
+Connections are served concurrently, so ``latency`` does not model a single-threaded server's queueing across
+connections.
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from fnmatch import fnmatchcase
+
+from . import scripts
+from .cluster import CLUSTER_SLOTS, key_slot
+
+SCAN_OPS = (b'^', b'>', b'>=', b'==')
+# commands routed by cluster nodes without a key; the others have theirs first, EVAL and EVALSHA after numkeys
+KEYLESS_COMMANDS = {b'PING', b'ECHO', b'SELECT', b'INFO', b'FLUSHALL', b'FLUSHDB', b'DBSIZE', b'KEYS', b'SCRIPT',
+                    b'CLUSTER', b'CLIENT'}
+
+
+class CommandError(Exception):
+    pass
+
+
+STALE_VERSION = CommandError('ERR update version is stale')
+NOT_INTEGER = CommandError('ERR value is not an integer')
+NOT_FLOAT = CommandError('ERR value is not an float')
+OVERFLOW = CommandError('ERR increment or decrement would overflow')
+SYNTAX = CommandError('ERR syntax error')
+NOSCRIPT = CommandError('NOSCRIPT No matching script. Please use EVAL.')
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def to_int(value, error=None):
+    try:
+        return int(value)
+    except ValueError:
+        raise error or CommandError('ERR value is not an integer or out of range')
+
+
+def to_float(value, error=None):
+    try:
+        return float(value)
+    except ValueError:
+        raise error or CommandError('ERR value is not a valid float')
+
+
+def format_float(value):
+    text = repr(value)
+    return (text[:-2] if text.endswith('.0') else text).encode()
+
+
+# ###################################### RESP ######################################################
+
+def parse_commands(buffer):
+    """
+    Parse the complete RESP arrays at the start of ``buffer``. Returns (commands, bytes consumed).
+    """
+    commands = []
+    pos = 0
+    size = len(buffer)
+    while pos < size:
+        if buffer[pos:pos + 1] != b'*':
+            raise CommandError('ERR Protocol error: expected array')
+        end = buffer.find(b'\r\n', pos)
+        if end < 0:
+            break
+        count = int(buffer[pos + 1:end])
+        cursor = end + 2
+        args = []
+        for _ in range(count):
+            end = buffer.find(b'\r\n', cursor)
+            if end < 0:
+                break
+            length = int(buffer[cursor + 1:end])
+            start = end + 2
+            if start + length + 2 > size:
+                break
+            args.append(bytes(buffer[start:start + length]))
+            cursor = start + length + 2
+        if len(args) < count:
+            break
+        commands.append(args)
+        pos = cursor
+    return commands, pos
+
+
+def encode_reply(reply, out):
+    if reply is None:
+        out += b'$-1\r\n'
+    elif isinstance(reply, bytes):
+        out += b'$%d\r\n%s\r\n' % (len(reply), reply)
+    elif isinstance(reply, bool):
+        out += b':%d\r\n' % int(reply)
+    elif isinstance(reply, int):
+        out += b':%d\r\n' % reply
+    elif isinstance(reply, str):
+        out += b'+%s\r\n' % reply.encode()
+    elif isinstance(reply, Exception):
+        out += b'-%s\r\n' % str(reply).encode()
+    else:
+        out += b'*%d\r\n' % len(reply)
+        for item in reply:
+            encode_reply(item, out)
+
+
+# ###################################### TairHash data ######################################################
+
+class Field(object):
+    __slots__ = ('value', 'version', 'expire', 'noactive', 'seq')
+
+    def __init__(self, value, seq):
+        self.value = value
+        self.version = 1
+        self.expire = None
+        self.noactive = False
+        self.seq = seq
+
+
+class TairHash(object):
+    """
+    Fields in insertion order. ``seqs``/``names`` index the fields by insertion sequence for EXHSCAN cursors,
+    with deleted fields removed lazily.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.seqs = []
+        self.names = []
+        self.next_seq = 1
+        self.sorted = None
+
+    def add(self, name, value):
+        field = Field(value, self.next_seq)
+        self.next_seq += 1
+        self.fields[name] = field
+        self.seqs.append(field.seq)
+        self.names.append(name)
+        self.sorted = None
+        return field
+
+    def remove(self, name):
+        del self.fields[name]
+        self.sorted = None
+        if len(self.seqs) > 2 * len(self.fields) + 64:
+            live = [(s, n) for s, n in zip(self.seqs, self.names) if n in self.fields and self.fields[n].seq == s]
+            self.seqs = [s for s, _ in live]
+            self.names = [n for _, n in live]
+
+    def sorted_names(self):
+        if self.sorted is None:
+            self.sorted = sorted(self.fields)
+        return self.sorted
+
+
+class Options(object):
+    """
+    Parsed EX/EXAT/PX/PXAT, NX/XX, VER/ABS, NOACTIVE, MIN/MAX, NONEGATIVE and the like.
+    """
+
+    def __init__(self, args, allowed, parse_bound=to_int):
+        self.expire = None
+        self.nx = self.xx = self.noactive = self.nonegative = self.noexp = False
+        self.ver = self.abs = self.min = self.max = None
+        self.match = None
+        self.count = 10
+        i = 0
+        while i < len(args):
+            token = args[i].upper()
+            if token not in allowed:
+                raise SYNTAX
+            if token in (b'EX', b'EXAT', b'PX', b'PXAT', b'VER', b'ABS', b'MIN', b'MAX', b'MATCH', b'COUNT'):
+                if i + 1 >= len(args):
+                    raise SYNTAX
+                value = args[i + 1]
+                i += 2
+                if token == b'EX':
+                    self.expire = now_ms() + to_int(value) * 1000
+                elif token == b'EXAT':
+                    self.expire = to_int(value) * 1000
+                elif token == b'PX':
+                    self.expire = now_ms() + to_int(value)
+                elif token == b'PXAT':
+                    self.expire = to_int(value)
+                elif token == b'VER':
+                    self.ver = to_int(value)
+                elif token == b'ABS':
+                    self.abs = to_int(value)
+                    if self.abs <= 0:
+                        raise CommandError('ERR invalid version')
+                elif token == b'MIN':
+                    self.min = parse_bound(value)
+                elif token == b'MAX':
+                    self.max = parse_bound(value)
+                elif token == b'MATCH':
+                    self.match = value
+                else:
+                    self.count = max(1, to_int(value))
+                continue
+            setattr(self, token.decode().lower(), True)
+            i += 1
+        if self.nx and self.xx:
+            raise SYNTAX
+
+
+SET_OPTIONS = {b'EX', b'EXAT', b'PX', b'PXAT', b'NX', b'XX', b'VER', b'ABS', b'NOACTIVE'}
+INCR_OPTIONS = SET_OPTIONS | {b'MIN', b'MAX', b'NONEGATIVE'}
+EXPIRE_OPTIONS = {b'VER', b'ABS', b'NOACTIVE'}
+
+
+class Keyspace(object):
+    """
+    The data and the command implementations. Every method named ``cmd_<name>`` takes the arguments after the
+    command name as bytes and returns the reply.
+    """
+
+    def __init__(self):
+        self.db = {}
+        # keys that may hold fields with a TTL, for active expiration
+        self.volatile = set()
+        # sha -> Python equivalent of a loaded script
+        self.scripts = {}
+
+    # ----- helpers -----
+
+    def get_hash(self, key, create=False):
+        h = self.db.get(key)
+        if h is None and create:
+            h = self.db[key] = TairHash()
+        return h
+
+    def get_field(self, key, name, now=None):
+        """
+        Return the live field, deleting it first when it expired.
+        """
+        h = self.db.get(key)
+        if h is None:
+            return None
+        field = h.fields.get(name)
+        if field is not None and field.expire is not None and field.expire <= (now or now_ms()):
+            self.delete_field(key, h, name)
+            return None
+        return field
+
+    def delete_field(self, key, h, name):
+        h.remove(name)
+        if not h.fields:
+            del self.db[key]
+            self.volatile.discard(key)
+
+    def live_items(self, key):
+        h = self.db.get(key)
+        if h is None:
+            return []
+        now = now_ms()
+        items = [(n, f) for n, f in h.fields.items() if f.expire is None or f.expire > now]
+        items.reverse()
+        return items
+
+    def set_expire(self, key, field, expire, noactive):
+        field.expire = expire
+        field.noactive = noactive
+        if expire is not None:
+            self.volatile.add(key)
+
+    @staticmethod
+    def check_version(field, options):
+        if field is not None and options.ver and options.ver != field.version:
+            raise STALE_VERSION
+
+    @staticmethod
+    def next_version(field, options, existed):
+        if options.abs is not None:
+            field.version = options.abs
+        elif existed:
+            field.version += 1
+
+    def active_expire(self, budget=1000):
+        """
+        Delete expired fields that are not NOACTIVE, looking at about ``budget`` fields.
+        """
+        now = now_ms()
+        for key in list(self.volatile):
+            h = self.db.get(key)
+            if h is None:
+                self.volatile.discard(key)
+                continue
+            has_ttl = False
+            for name, field in list(h.fields.items()):
+                budget -= 1
+                if field.expire is None:
+                    continue
+                if field.expire <= now and not field.noactive:
+                    self.delete_field(key, h, name)
+                else:
+                    has_ttl = True
+            if not has_ttl:
+                self.volatile.discard(key)
+            if budget <= 0:
+                return
+
+    # ----- connection and key commands -----
+
+    def cmd_ping(self, args):
+        return args[0] if args else 'PONG'
+
+    def cmd_echo(self, args):
+        return args[0]
+
+    def cmd_select(self, args):
+        return 'OK'
+
+    def cmd_info(self, args):
+        return b'# Server\r\nredis_version:6.0.0\r\ntair_stand_in:1\r\n'
+
+    def cmd_flushall(self, args):
+        self.db.clear()
+        self.volatile.clear()
+        return 'OK'
+
+    cmd_flushdb = cmd_flushall
+
+    def cmd_dbsize(self, args):
+        return len(self.db)
+
+    def cmd_del(self, args):
+        removed = 0
+        for key in args:
+            if self.db.pop(key, None) is not None:
+                removed += 1
+                self.volatile.discard(key)
+        return removed
+
+    cmd_unlink = cmd_del
+
+    def cmd_exists(self, args):
+        return sum(1 for key in args if key in self.db)
+
+    def cmd_type(self, args):
+        return 'exhash' if args[0] in self.db else 'none'
+
+    def cmd_keys(self, args):
+        return [key for key in self.db if fnmatchcase(key, args[0])]
+
+    # ----- TairHash writes -----
+
+    def cmd_exhset(self, args):
+        if len(args) < 3:
+            raise CommandError("ERR wrong number of arguments for 'exhset' command")
+        key, name, value = args[0], args[1], args[2]
+        options = Options(args[3:], SET_OPTIONS)
+        field = self.get_field(key, name)
+        if (options.nx and field is not None) or (options.xx and field is None):
+            return -1
+        self.check_version(field, options)
+        existed = field is not None
+        if field is None:
+            field = self.get_hash(key, create=True).add(name, value)
+        field.value = value
+        self.next_version(field, options, existed)
+        self.set_expire(key, field, options.expire, options.noactive)
+        return 0 if existed else 1
+
+    def cmd_exhmset(self, args):
+        if len(args) < 3 or len(args) % 2 == 0:
+            raise CommandError("ERR wrong number of arguments for 'exhmset' command")
+        key = args[0]
+        for name, value in zip(args[1::2], args[2::2]):
+            field = self.get_field(key, name)
+            if field is None:
+                self.get_hash(key, create=True).add(name, value)
+            else:
+                field.value = value
+                field.version += 1
+                field.expire = None
+        return 'OK'
+
+    def _expire(self, key, name, expire, options):
+        field = self.get_field(key, name)
+        if field is None:
+            return 0
+        self.check_version(field, options)
+        if options.abs is not None:
+            field.version = options.abs
+        self.set_expire(key, field, expire, options.noactive)
+        if expire <= now_ms() and not options.noactive:
+            self.delete_field(key, self.db[key], name)
+        return 1
+
+    def cmd_exhpexpireat(self, args):
+        return self._expire(args[0], args[1], to_int(args[2]), Options(args[3:], EXPIRE_OPTIONS))
+
+    def cmd_exhpexpire(self, args):
+        return self._expire(args[0], args[1], now_ms() + to_int(args[2]), Options(args[3:], EXPIRE_OPTIONS))
+
+    def cmd_exhexpireat(self, args):
+        return self._expire(args[0], args[1], to_int(args[2]) * 1000, Options(args[3:], EXPIRE_OPTIONS))
+
+    def cmd_exhexpire(self, args):
+        return self._expire(args[0], args[1], now_ms() + to_int(args[2]) * 1000, Options(args[3:], EXPIRE_OPTIONS))
+
+    def cmd_exhpersist(self, args):
+        field = self.get_field(args[0], args[1])
+        if field is None or field.expire is None:
+            return 0
+        field.expire = None
+        return 1
+
+    def cmd_exhsetver(self, args):
+        field = self.get_field(args[0], args[1])
+        version = to_int(args[2])
+        if version <= 0:
+            raise CommandError('ERR invalid version')
+        if field is None:
+            return 0
+        field.version = version
+        return 1
+
+    def _incr(self, args, parse, error, fmt):
+        key, name, delta = args[0], args[1], parse(args[2], error)
+        options = Options(args[3:], INCR_OPTIONS, lambda v: parse(v, error))
+        field = self.get_field(key, name)
+        if (options.nx and field is not None) or (options.xx and field is None):
+            return -1
+        self.check_version(field, options)
+        current = parse(field.value, error) if field is not None else 0
+        result = current + delta
+        if (options.min is not None and result < options.min) or (options.max is not None and result > options.max):
+            raise OVERFLOW
+        if options.nonegative and result < 0:
+            result = 0
+        existed = field is not None
+        if field is None:
+            field = self.get_hash(key, create=True).add(name, b'')
+        field.value = fmt(result)
+        self.next_version(field, options, existed)
+        if options.expire is not None:
+            self.set_expire(key, field, options.expire, options.noactive)
+        return result
+
+    def cmd_exhincrby(self, args):
+        return self._incr(args, to_int, NOT_INTEGER, lambda v: b'%d' % v)
+
+    def cmd_exhincrbyfloat(self, args):
+        return format_float(self._incr(args, to_float, NOT_FLOAT, format_float))
+
+    def cmd_exhdel(self, args):
+        key = args[0]
+        removed = 0
+        for name in args[1:]:
+            if self.get_field(key, name) is not None:
+                self.delete_field(key, self.db[key], name)
+                removed += 1
+        return removed
+
+    # ----- TairHash reads -----
+
+    def cmd_exhget(self, args):
+        field = self.get_field(args[0], args[1])
+        return field.value if field is not None else None
+
+    def cmd_exhgetwithver(self, args):
+        field = self.get_field(args[0], args[1])
+        return [field.value, field.version] if field is not None else None
+
+    def cmd_exhmget(self, args):
+        now = now_ms()
+        fields = [self.get_field(args[0], name, now) for name in args[1:]]
+        return [f.value if f is not None else None for f in fields]
+
+    def cmd_exhmgetwithver(self, args):
+        now = now_ms()
+        fields = [self.get_field(args[0], name, now) for name in args[1:]]
+        return [[f.value, f.version] if f is not None else None for f in fields]
+
+    def cmd_exhpttl(self, args):
+        field = self.get_field(args[0], args[1])
+        if field is None:
+            return -2
+        if field.expire is None:
+            return -1
+        return max(0, field.expire - now_ms())
+
+    def cmd_exhttl(self, args):
+        pttl = self.cmd_exhpttl(args)
+        return pttl if pttl < 0 else (pttl + 500) // 1000
+
+    def cmd_exhver(self, args):
+        field = self.get_field(args[0], args[1])
+        return field.version if field is not None else -1
+
+    def cmd_exhlen(self, args):
+        h = self.db.get(args[0])
+        if h is None:
+            return 0
+        if len(args) > 1 and args[1].upper() == b'NOEXP':
+            return len(self.live_items(args[0]))
+        # like Tair, expired fields that were not deleted yet are counted
+        return len(h.fields)
+
+    def cmd_exhexists(self, args):
+        return int(self.get_field(args[0], args[1]) is not None)
+
+    def cmd_exhstrlen(self, args):
+        field = self.get_field(args[0], args[1])
+        return len(field.value) if field is not None else 0
+
+    def cmd_exhkeys(self, args):
+        return [name for name, _ in self.live_items(args[0])]
+
+    def cmd_exhvals(self, args):
+        return [field.value for _, field in self.live_items(args[0])]
+
+    def cmd_exhgetall(self, args):
+        reply = []
+        for name, field in self.live_items(args[0]):
+            reply.append(name)
+            reply.append(field.value)
+        return reply
+
+    def cmd_exhscan(self, args):
+        if len(args) < 2:
+            raise CommandError("ERR wrong number of arguments for 'exhscan' command")
+        if len(args) >= 3 and args[1] in SCAN_OPS:
+            return self._scan_ordered(args[0], args[1], args[2], Options(args[3:], {b'MATCH', b'COUNT'}))
+        key, cursor = args[0], to_int(args[1], CommandError('ERR invalid cursor'))
+        options = Options(args[2:], {b'MATCH', b'COUNT'})
+        h = self.db.get(key)
+        if h is None:
+            return [b'0', []]
+        now = now_ms()
+        start = bisect_left(h.seqs, cursor)
+        reply = []
+        visited = 0
+        i = start
+        while i < len(h.seqs) and visited < options.count:
+            seq, name = h.seqs[i], h.names[i]
+            i += 1
+            field = h.fields.get(name)
+            if field is None or field.seq != seq:
+                continue
+            visited += 1
+            if field.expire is not None and field.expire <= now:
+                continue
+            if options.match is None or fnmatchcase(name, options.match):
+                reply.append(name)
+                reply.append(field.value)
+        next_cursor = h.seqs[i] if i < len(h.seqs) else 0
+        return [b'%d' % next_cursor, reply]
+
+    def _scan_ordered(self, key, op, subkey, options):
+        # enterprise form: fields in byte order from a position; the reply's cursor is the next field, or empty
+        h = self.db.get(key)
+        if h is None:
+            return [b'', []]
+        names = h.sorted_names()
+        if op == b'^':
+            start = 0
+        elif op == b'>=' or op == b'==':
+            start = bisect_left(names, subkey)
+        else:
+            start = bisect_right(names, subkey)
+        end = min(len(names), start + options.count)
+        if op == b'==':
+            end = start + 1 if start < len(names) and names[start] == subkey else start
+        now = now_ms()
+        reply = []
+        for name in names[start:end]:
+            field = h.fields[name]
+            if field.expire is not None and field.expire <= now:
+                continue
+            if options.match is None or fnmatchcase(name, options.match):
+                reply.append(name)
+                reply.append(field.value)
+        next_subkey = names[end] if op != b'==' and end < len(names) else b''
+        return [next_subkey, reply]
+
+    # ----- scripting -----
+
+    def load_script(self, source):
+        run = SCRIPT_EQUIVALENTS.get(source.decode('utf-8', 'replace'))
+        if run is None:
+            raise CommandError('ERR the stand-in only runs the scripts of tairClient.scripts')
+        sha = hashlib.sha1(source).hexdigest()
+        self.scripts[sha] = run
+        return sha
+
+    def run_script(self, run, args):
+        numkeys = to_int(args[0])
+        return run(self, args[1:1 + numkeys], args[1 + numkeys:])
+
+    def cmd_script(self, args):
+        subcommand = args[0].upper()
+        if subcommand == b'LOAD':
+            return self.load_script(args[1])
+        if subcommand == b'EXISTS':
+            return [1 if sha.decode('latin-1').lower() in self.scripts else 0 for sha in args[1:]]
+        if subcommand == b'FLUSH':
+            self.scripts.clear()
+            return 'OK'
+        raise SYNTAX
+
+    def cmd_eval(self, args):
+        sha = self.load_script(args[0])
+        return self.run_script(self.scripts[sha], args[1:])
+
+    def cmd_evalsha(self, args):
+        run = self.scripts.get(args[0].decode('latin-1').lower())
+        if run is None:
+            raise NOSCRIPT
+        return self.run_script(run, args[1:])
+
+
+def exhget_or_set(keyspace, keys, argv):
+    value = keyspace.cmd_exhget([keys[0], argv[0]])
+    if value is not None:
+        return value
+    keyspace.cmd_exhset([keys[0]] + list(argv))
+    return argv[1]
+
+
+def exhdel_if_version(keyspace, keys, argv):
+    if keyspace.cmd_exhver([keys[0], argv[0]]) != to_int(argv[1]):
+        return 0
+    return keyspace.cmd_exhdel([keys[0], argv[0]])
+
+
+def exhincrby_pttl(keyspace, keys, argv):
+    value = keyspace.cmd_exhincrby([keys[0]] + list(argv))
+    return [value, keyspace.cmd_exhpttl([keys[0], argv[0]])]
+
+
+def exhmove(keyspace, keys, argv):
+    value = keyspace.cmd_exhget([keys[0], argv[0]])
+    if value is None:
+        return 0
+    pttl = keyspace.cmd_exhpttl([keys[0], argv[0]])
+    if pttl > 0:
+        keyspace.cmd_exhset([keys[1], argv[0], value, b'PX', b'%d' % pttl])
+    else:
+        keyspace.cmd_exhset([keys[1], argv[0], value])
+    keyspace.cmd_exhdel([keys[0], argv[0]])
+    return 1
+
+
+# Lua source -> Python equivalent
+SCRIPT_EQUIVALENTS = {
+    scripts.EXHGET_OR_SET: exhget_or_set,
+    scripts.EXHDEL_IF_VERSION: exhdel_if_version,
+    scripts.EXHINCRBY_PTTL: exhincrby_pttl,
+    scripts.EXHMOVE: exhmove,
+}
+
+
+# ###################################### server ######################################################
+
+class TairHashServer(object):
+    """
+    Serves a ``Keyspace`` over RESP on an asyncio loop in a background thread.
+
+        with TairHashServer(port=0, rtt=0.001) as server:
+            client = Client(port=server.port)
+    """
+
+    def __init__(self, host='127.0.0.1', port=6379, rtt=0.0, latency=None, jitter=0.0, bandwidth=None,
+                 active_expire_interval=0.1):
+        """
+        :param port: port to listen on, 0 to pick a free one (see ``port`` after ``start``)
+        :param rtt: seconds added once per batch of commands read together
+        :param latency: seconds per command, or dict of command name (any case) -> seconds
+        :param jitter: maximum extra seconds per batch, drawn uniformly
+        :param bandwidth: reply bytes per second over all connections, None for no limit
+        :param active_expire_interval: seconds between active expiration cycles
+        """
+        self.host = host
+        self.port = port
+        self.rtt = rtt
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.active_expire_interval = active_expire_interval
+        self.default_latency = 0.0
+        self.latency = {}
+        if isinstance(latency, dict):
+            self.latency = {k.upper().encode() if isinstance(k, str) else k.upper(): v for k, v in latency.items()}
+        elif latency:
+            self.default_latency = latency
+        self.keyspace = Keyspace()
+        self.commands_processed = 0
+        self.slot_map = None
+        self.migrating = {}
+        self.importing = set()
+        self._owners = None
+        self._wire_free_at = 0.0
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        ready = threading.Event()
+        errors = []
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._server = self._loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.port))
+            except Exception as e:
+                errors.append(e)
+                ready.set()
+                return
+            self.port = self._server.sockets[0].getsockname()[1]
+            self._loop.create_task(self._expire_cycle())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='tair-stand-in', daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def stop(self):
+        loop = self._loop
+        if loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            # connection handlers are cancelled first, newer Pythons wait for open connections in wait_closed
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._server.wait_closed()
+            loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop)
+        self._thread.join()
+        loop.close()
+        self._loop = None
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self._thread.join()
+        except KeyboardInterrupt:
+            self.stop()
+
+    async def _expire_cycle(self):
+        while True:
+            await asyncio.sleep(self.active_expire_interval)
+            self.keyspace.active_expire()
+
+    def set_cluster(self, slot_map, migrating=None, importing=()):
+        """
+        Act as one primary of a cluster. ``slot_map`` lists ``(start, end, (host, port))`` for every node and is what
+        CLUSTER SLOTS returns; keyed commands for slots of other nodes get MOVED. ``migrating`` maps slots this node
+        is moving out to their target node, which gets ASK for keys that are not here any more, and slots in
+        ``importing`` are served to commands preceded by ASKING.
+        """
+        owners = [None] * CLUSTER_SLOTS
+        for start, end, node in slot_map:
+            owners[start:end + 1] = [node] * (end - start + 1)
+        self.slot_map = list(slot_map)
+        self.migrating = dict(migrating or {})
+        self.importing = set(importing)
+        self._owners = owners
+
+    def cluster_command(self, args):
+        if self.slot_map is None or not args or args[0].upper() != b'SLOTS':
+            return CommandError('ERR This instance has cluster support disabled')
+        return [[start, end, [host.encode(), port, b'%s:%d' % (host.encode(), port)]]
+                for start, end, (host, port) in self.slot_map]
+
+    def redirection(self, args, asking=False):
+        """
+        Return the MOVED or ASK error for a command this cluster node does not serve, None when it serves it.
+        """
+        name = args[0].upper()
+        if name in (b'EVAL', b'EVALSHA'):
+            key = args[3] if len(args) > 3 and to_int(args[2]) > 0 else None
+        else:
+            key = args[1] if len(args) > 1 and name not in KEYLESS_COMMANDS else None
+        if key is None:
+            return None
+        slot = key_slot(key)
+        owner = self._owners[slot]
+        if owner == (self.host, self.port):
+            target = self.migrating.get(slot)
+            if target is not None and key not in self.keyspace.db:
+                return CommandError('ASK %d %s:%d' % (slot, target[0], target[1]))
+            return None
+        if asking and slot in self.importing:
+            return None
+        return CommandError('MOVED %d %s:%d' % (slot, owner[0], owner[1]))
+
+    def execute(self, args, asking=False):
+        """
+        Run one command and return its reply, an exception instance for errors.
+        """
+        self.commands_processed += 1
+        if args[0].upper() == b'CLUSTER':
+            return self.cluster_command(args[1:])
+        if self._owners is not None:
+            redirection = self.redirection(args, asking)
+            if redirection is not None:
+                return redirection
+        method = getattr(self.keyspace, 'cmd_' + args[0].decode('latin-1').lower(), None)
+        if method is None:
+            return CommandError("ERR unknown command '%s'" % args[0].decode('latin-1'))
+        try:
+            return method(args[1:])
+        except CommandError as e:
+            return e
+        except IndexError:
+            return CommandError("ERR wrong number of arguments for '%s' command" % args[0].decode('latin-1').lower())
+
+    def service_time(self, commands):
+        latency = self.latency
+        return sum(latency.get(args[0].upper(), self.default_latency) for args in commands)
+
+    async def _handle(self, reader, writer):
+        # replies are written by a separate task at their due time, so pipelined batches overlap their round
+        # trips like on a real network while the per-command service time stays serialized per connection
+        replies = asyncio.Queue()
+        sender = asyncio.ensure_future(self._send_replies(writer, replies))
+        buffer = bytearray()
+        transaction = None
+        asking = False
+        busy_until = last_due = 0.0
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+                try:
+                    commands, consumed = parse_commands(buffer)
+                except (CommandError, ValueError):
+                    replies.put_nowait((0.0, b'-ERR Protocol error\r\n'))
+                    break
+                del buffer[:consumed]
+                if not commands:
+                    continue
+
+                out = bytearray()
+                quit = False
+                for args in commands:
+                    name = args[0].upper()
+                    if name == b'MULTI':
+                        transaction = []
+                        reply = 'OK'
+                    elif name == b'EXEC':
+                        reply = [self.execute(a) for a in transaction] if transaction is not None else \
+                            CommandError('ERR EXEC without MULTI')
+                        transaction = None
+                    elif name == b'DISCARD':
+                        transaction = None
+                        reply = 'OK'
+                    elif name in (b'WATCH', b'UNWATCH'):
+                        reply = 'OK'
+                    elif name == b'QUIT':
+                        reply = 'OK'
+                        quit = True
+                    elif name == b'ASKING':
+                        reply = 'OK'
+                    elif transaction is not None:
+                        transaction.append(args)
+                        reply = 'QUEUED'
+                    else:
+                        reply = self.execute(args, asking)
+                    # ASKING only applies to the command right after it
+                    asking = name == b'ASKING'
+                    encode_reply(reply, out)
+                    if quit:
+                        break
+
+                now = time.monotonic()
+                busy_until = max(busy_until, now) + self.service_time(commands)
+                due = busy_until + self.rtt
+                if self.jitter:
+                    due += random.uniform(0, self.jitter)
+                if self.bandwidth:
+                    self._wire_free_at = max(self._wire_free_at, now) + len(out) / float(self.bandwidth)
+                    due = max(due, self._wire_free_at)
+                last_due = max(due, last_due)
+                replies.put_nowait((last_due, bytes(out)))
+                if quit:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            replies.put_nowait(None)
+            try:
+                await sender
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+            writer.close()
+
+    async def _send_replies(self, writer, replies):
+        while True:
+            item = await replies.get()
+            if item is None:
+                return
+            due, out = item
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            writer.write(out)
+            await writer.drain()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tairClient.server', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--rtt', type=float, default=0.0, help='seconds per batch of commands')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per command')
+    parser.add_argument('--jitter', type=float, default=0.0, help='maximum extra seconds per batch')
+    parser.add_argument('--bandwidth', type=float, default=None, help='reply bytes per second')
+    options = parser.parse_args(argv)
+    server = TairHashServer(options.host, options.port, rtt=options.rtt, latency=options.latency,
+                            jitter=options.jitter, bandwidth=options.bandwidth)
+    print('tair stand-in listening on %s:%d' % (options.host, options.port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
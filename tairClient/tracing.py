@@ -0,0 +1,143 @@
+import heapq
+import itertools
+import random
+import threading
+from time import time
+
+from redis._compat import nativestr
+from redis.connection import Encoder
+
+
+def request_size(encoder, args):
+    """
+    Size in bytes of ``args`` packed as a RESP command.
+    """
+    size = len(b'*%d\r\n' % len(args))
+    for arg in args:
+        n = len(encoder.encode(arg))
+        size += len(b'$%d\r\n' % n) + n + 2
+    return size
+
+
+def reply_size(reply):
+    """
+    Return (payload bytes, elements) of a parsed reply. Framing is not counted; dict replies count keys and values.
+    """
+    if reply is None:
+        return 0, 0
+    if isinstance(reply, (bytes, str)):
+        return len(reply), 1
+    if isinstance(reply, dict):
+        reply = itertools.chain.from_iterable(reply.items())
+    elif not isinstance(reply, (list, tuple)):
+        return 8, 1
+    size = elements = 0
+    for item in reply:
+        item_size, item_elements = reply_size(item)
+        size += item_size
+        elements += item_elements
+    return size, elements
+
+
+class CommandTracer(object):
+    """
+    Records a sample of the commands a client sends: the command, key, argument count, RESP request size, reply
+    payload size and element count, duration and error. Every call is timed; ``sample_rate`` of them, and all
+    calls slower than ``slow_threshold`` seconds, are recorded. Pipelines are recorded as one ``PIPELINE`` call.
+
+    The ``top_n`` largest (request plus reply bytes) and slowest records are kept; ``callback(record)`` is called
+    for every record, on the calling thread.
+    """
+
+    def __init__(self, sample_rate=0.01, top_n=20, slow_threshold=None, callback=None):
+        self.sample_rate = sample_rate
+        self.top_n = top_n
+        self.slow_threshold = slow_threshold
+        self.callback = callback
+        self.encoder = Encoder('utf-8', 'strict', False)
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._largest = []
+        self._slowest = []
+        self.recorded = 0
+
+    def wants(self, elapsed):
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+            return True
+        return random.random() < self.sample_rate
+
+    def observe(self, args, reply, elapsed, error=None):
+        """
+        Record one command if it is sampled or slow.
+        """
+        if not self.wants(elapsed):
+            return None
+        reply_bytes, reply_elements = reply_size(reply)
+        record = {
+            'time': time(),
+            'command': nativestr(args[0]),
+            'key': args[1] if len(args) > 1 else None,
+            'args': len(args) - 1,
+            'request_bytes': request_size(self.encoder, args),
+            'reply_bytes': reply_bytes,
+            'reply_elements': reply_elements,
+            'duration': elapsed,
+            'error': error,
+        }
+        self._add(record)
+        return record
+
+    def observe_pipeline(self, stack, replies, elapsed, error=None):
+        """
+        Record a pipeline's commands as one call if it is sampled or slow.
+        """
+        if not self.wants(elapsed):
+            return None
+        reply_bytes, reply_elements = reply_size(replies)
+        record = {
+            'time': time(),
+            'command': 'PIPELINE',
+            'key': None,
+            'args': len(stack),
+            'request_bytes': sum(request_size(self.encoder, args) for args, _ in stack),
+            'reply_bytes': reply_bytes,
+            'reply_elements': reply_elements,
+            'duration': elapsed,
+            'error': error,
+        }
+        self._add(record)
+        return record
+
+    def _add(self, record):
+        sequence = next(self._sequence)
+        size = record['request_bytes'] + record['reply_bytes']
+        with self._lock:
+            self.recorded += 1
+            for heap, score in ((self._largest, size), (self._slowest, record['duration'])):
+                item = (score, sequence, record)
+                if len(heap) < self.top_n:
+                    heapq.heappush(heap, item)
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, item)
+        if self.callback is not None:
+            self.callback(record)
+
+    def largest(self):
+        """
+        :return: the largest records, largest first
+        """
+        with self._lock:
+            return [record for _, _, record in sorted(self._largest, reverse=True)]
+
+    def slowest(self):
+        """
+        :return: the slowest records, slowest first
+        """
+        with self._lock:
+            return [record for _, _, record in sorted(self._slowest, reverse=True)]
+
+    def reset(self):
+        with self._lock:
+            self._largest = []
+            self._slowest = []
+            self.recorded = 0
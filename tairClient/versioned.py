@@ -0,0 +1,118 @@
+import random
+import threading
+from time import sleep
+
+from redis.exceptions import RedisError, ResponseError
+
+
+class VersionConflictError(RedisError):
+    """
+    Raised by exhupdate when some fields still had version conflicts after the last attempt.
+    ``fields`` lists them, ``results`` holds the fields that were written.
+    """
+
+    def __init__(self, message, fields, results):
+        RedisError.__init__(self, message)
+        self.fields = fields
+        self.results = results
+
+
+class UpdateStats(object):
+    """
+    Counters of exhupdate calls, shared by all threads of a client.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.rounds = 0
+            self.writes = 0
+            self.conflicts = 0
+            self.failed = 0
+
+    def record(self, rounds, writes, conflicts, failed):
+        with self._lock:
+            self.calls += 1
+            self.rounds += rounds
+            self.writes += writes
+            self.conflicts += conflicts
+            self.failed += failed
+
+    def stats(self):
+        """
+        :return: dict with calls, rounds (read and write round trip pairs), writes (guarded writes sent),
+                 conflicts (writes rejected for a changed version), failed (fields given up on) and conflict_rate,
+                 the share of writes that conflicted
+        """
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'rounds': self.rounds,
+                'writes': self.writes,
+                'conflicts': self.conflicts,
+                'failed': self.failed,
+                'conflict_rate': self.conflicts / self.writes if self.writes else 0.0,
+            }
+
+
+def is_conflict(reply):
+    # EXHSET answers -1 when NX finds the field, and a stale version error when VER does not match
+    if isinstance(reply, ResponseError):
+        return 'version is stale' in str(reply)
+    return reply == -1
+
+
+def exhupdate(client, name, fields, func, max_attempts=10, backoff=0.001, max_backoff=0.1, stats=None):
+    """
+    Read-modify-write fields of one TairHash without locks. Each round reads the pending fields with one
+    EXHMGETWITHVER and writes the new values in one pipeline, every EXHSET guarded by the version it read (NX for a
+    missing field). Only the fields whose guard failed are read again, after a random sleep of up to
+    ``backoff * 2 ** round`` seconds, capped at ``max_backoff``.
+    """
+    pending = list(fields)
+    results = {}
+    if not pending:
+        return results
+    rounds = writes = conflicts = 0
+    try:
+        for attempt in range(max_attempts):
+            if attempt:
+                sleep(random.uniform(0, min(max_backoff, backoff * 2 ** attempt)))
+            rounds += 1
+            current = client.exhmgetwithver(name, pending)
+            pipe = client.pipeline(transaction=False)
+            updates = []
+            for field, reply in zip(pending, current):
+                value, version = (reply[0], reply[1]) if reply is not None else (None, None)
+                new = func(field, value)
+                if new is None:
+                    continue
+                if version is None:
+                    pipe.exhset(name, field, new, nx=True)
+                else:
+                    pipe.exhset(name, field, new, ver=version)
+                updates.append((field, new))
+            if not updates:
+                pending = []
+                return results
+            writes += len(updates)
+            pending = []
+            for (field, new), reply in zip(updates, pipe.execute(raise_on_error=False)):
+                if is_conflict(reply):
+                    pending.append(field)
+                elif isinstance(reply, Exception):
+                    raise reply
+                else:
+                    results[field] = new
+            conflicts += len(pending)
+            if not pending:
+                return results
+        raise VersionConflictError('%d fields of %r kept conflicting after %d attempts'
+                                   % (len(pending), name, max_attempts), pending, results)
+    finally:
+        if stats is not None:
+            stats.record(rounds, writes, conflicts, len(pending))
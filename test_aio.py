@@ -0,0 +1,56 @@
+import asyncio
+from unittest import TestCase, main
+
+import redis
+
+from tairClient.aio import AsyncClient
+
+REDIS_HOST = "127.0.0.1"
+REDIS_PORT = 6379
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+class TestAsyncClient(TestCase):
+    def setUp(self):
+        self.client = AsyncClient(host=REDIS_HOST, port=REDIS_PORT, max_connections=8)
+        run(self.client.flushall())
+
+    def tearDown(self):
+        run(self.client.close())
+
+    def test_exhset_and_exhget(self):
+        self.assertEqual(1, run(self.client.exhset('key', 'a', '1', nx=True)))
+        self.assertEqual(-1, run(self.client.exhset('key', 'a', '1', nx=True)))
+        self.assertEqual(b'1', run(self.client.exhget('key', 'a')))
+
+    def test_exhset_ver(self):
+        self.assertEqual(1, run(self.client.exhset('key', 'a', 1)))
+        self.assertEqual(0, run(self.client.exhset('key', 'a', 2, ver=1)))
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, "update version is stale"):
+            run(self.client.exhset('key', 'a', 2, ver=1))
+
+    def test_concurrent_commands(self):
+        async def fill():
+            await asyncio.gather(*[self.client.exhset('key', 'f%d' % i, i) for i in range(200)])
+            return await self.client.exhlen('key')
+
+        self.assertEqual(200, run(fill()))
+
+    def test_pipeline(self):
+        pipe = self.client.pipeline()
+        pipe.exhset('key', 'a', 1).exhincrby('key', 'a', 2).exhget('key', 'a')
+        self.assertEqual([1, 3, b'3'], run(pipe.execute()))
+
+    def test_pipeline_no_transaction(self):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.exhset('key', 'k', 'v').exhincrby('key', 'k', 1)
+        result = run(pipe.execute(raise_on_error=False))
+        self.assertEqual(1, result[0])
+        self.assertIsInstance(result[1], redis.exceptions.ResponseError)
+
+
+if __name__ == "__main__":
+    main()
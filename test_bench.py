@@ -0,0 +1,47 @@
+import json
+import os
+import tempfile
+from unittest import TestCase, main
+
+from tairClient.bench import SERVER_COMMANDS, compare, main as bench_main, make_result, percentile
+from tairClient.server import TairHashServer
+
+
+class TestBench(TestCase):
+    def test_percentile(self):
+        samples = list(range(100))
+        self.assertEqual(50, percentile(samples, 0.5))
+        self.assertEqual(99, percentile(samples, 0.99))
+        self.assertEqual(0.0, percentile([], 0.5))
+
+    def test_compare(self):
+        base = {'results': [make_result('exhset', {'depth': 1}, 1000, 1.0, [0.001] * 10),
+                            make_result('exhget', {'depth': 1}, 1000, 1.0, [0.001] * 10)]}
+        new = {'results': [make_result('exhset', {'depth': 1}, 800, 1.0, [0.001] * 10),
+                           make_result('exhget', {'depth': 1}, 1050, 1.0, [0.001] * 10),
+                           make_result('exhdel', {'depth': 1}, 10, 1.0, [0.001] * 10)]}
+        self.assertEqual(['exhset depth=1'], compare(base, new, 0.1))
+
+    def test_micro_report(self):
+        path = os.path.join(tempfile.mkdtemp(), 'micro.json')
+        self.assertEqual(0, bench_main(['micro', '--rounds', '2', '--fields', '10', '--output', path]))
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual('micro', report['meta']['mode'])
+        self.assertTrue(all(r['ops_per_sec'] > 0 for r in report['results']))
+        self.assertEqual(0, bench_main(['compare', path, path]))
+
+    def test_server_report(self):
+        path = os.path.join(tempfile.mkdtemp(), 'server.json')
+        with TairHashServer(port=0) as server:
+            self.assertEqual(0, bench_main(['server', '--port', str(server.port), '--value-sizes', '16',
+                                            '--fields', '10', '--depths', '1,4', '--connections', '1',
+                                            '--duration', '0.01', '--output', path]))
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(set(SERVER_COMMANDS), {r['name'] for r in report['results']})
+        self.assertTrue(all(r['ops_per_sec'] > 0 for r in report['results']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+from unittest import TestCase, main
+
+from tairClient.bulk import entry_parts, plan_commands
+
+
+class TestPlanCommands(TestCase):
+    def test_plain_entries_merge_per_key(self):
+        commands = plan_commands([('k', 'a', 1), ('j', 'a', 2), ('k', 'b', 3)])
+        self.assertEqual([('exhmset', ('k', {'a': 1, 'b': 3})), ('exhmset', ('j', {'a': 2}))],
+                         [(method, args) for method, args, _, _ in commands])
+        self.assertEqual(2, len(commands[0][3]))
+
+    def test_options_end_the_key_mapping(self):
+        commands = plan_commands([('k', 'a', 1), ('k', 'a', 2, {'ex': 10}), ('k', 'a', 3), ('k', 'b', 4, {})])
+        self.assertEqual([
+            ('exhmset', ('k', {'a': 1}), {}),
+            ('exhset', ('k', 'a', 2), {'ex': 10}),
+            ('exhmset', ('k', {'a': 3, 'b': 4}), {}),
+        ], [command[:3] for command in commands])
+
+    def test_unknown_option(self):
+        with self.assertRaises(ValueError):
+            entry_parts(('k', 'a', 1, {'ttl': 10}))
+
+
+if __name__ == '__main__':
+    main()
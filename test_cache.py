@@ -0,0 +1,238 @@
+from time import monotonic, sleep
+from unittest import TestCase, main
+
+from redis.exceptions import ConnectionError, ResponseError
+
+from tairClient.cache import InvalidationListener, NearCache
+
+SUBSCRIBED = [b'subscribe', b'__redis__:invalidate', 1]
+
+
+class StubConnection(object):
+    """
+    Answers each read with the next of ``replies``, raising it when it is an exception. Replies left after the
+    listener's handshake are readable pushes.
+    """
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.sent = []
+        self.disconnected = False
+
+    def send_command(self, *args):
+        self.sent.append(args)
+
+    def read_response(self):
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def can_read(self, timeout=0):
+        if not self.replies:
+            sleep(0.005)
+        return bool(self.replies)
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+class StubListener(InvalidationListener):
+    def __init__(self, cache, connections, **kwargs):
+        self.connections = list(connections)
+        InvalidationListener.__init__(self, None, cache, **kwargs)
+
+    def _new_connection(self):
+        if not self.connections:
+            raise ConnectionError('no server')
+        return self.connections.pop(0)
+
+
+def wait_for(condition, timeout=2):
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            raise AssertionError('timed out')
+        sleep(0.005)
+
+
+class TestNearCache(TestCase):
+    def test_hit_and_miss(self):
+        cache = NearCache()
+        self.assertEqual((False, None), cache.get('key', 'a'))
+        self.assertTrue(cache.put('key', 'a', b'1', -1, cache.token()))
+        self.assertEqual((True, b'1'), cache.get('key', 'a'))
+        self.assertEqual((True, b'1'), cache.get(b'key', b'a'))
+        self.assertEqual(2, cache.stats()['hits'])
+        self.assertEqual(1, cache.stats()['misses'])
+
+    def test_missing_field(self):
+        cache = NearCache()
+        self.assertTrue(cache.put('key', 'a', None, -2, cache.token()))
+        self.assertEqual((True, None), cache.get('key', 'a'))
+        # a value with a "missing" TTL means the two replies raced, nothing is cached
+        self.assertFalse(cache.put('key', 'b', b'1', -2, cache.token()))
+
+    def test_server_ttl(self):
+        cache = NearCache()
+        self.assertTrue(cache.put('key', 'a', b'1', 50, cache.token()))
+        self.assertEqual((True, b'1'), cache.get('key', 'a'))
+        sleep(0.06)
+        self.assertEqual((False, None), cache.get('key', 'a'))
+        self.assertEqual(0, len(cache))
+
+    def test_max_ttl(self):
+        cache = NearCache(max_ttl=0.05)
+        self.assertTrue(cache.put('key', 'a', b'1', -1, cache.token()))
+        sleep(0.06)
+        self.assertEqual((False, None), cache.get('key', 'a'))
+
+    def test_lru_eviction(self):
+        cache = NearCache(max_entries=2)
+        cache.put('key', 'a', b'1', -1, cache.token())
+        cache.put('key', 'b', b'2', -1, cache.token())
+        cache.get('key', 'a')
+        cache.put('key', 'c', b'3', -1, cache.token())
+        self.assertEqual((True, b'1'), cache.get('key', 'a'))
+        self.assertEqual((False, None), cache.get('key', 'b'))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_lfu_eviction(self):
+        cache = NearCache(max_entries=2, policy='lfu')
+        cache.put('key', 'a', b'1', -1, cache.token())
+        cache.put('key', 'b', b'2', -1, cache.token())
+        for _ in range(3):
+            cache.get('key', 'a')
+        cache.get('key', 'b')
+        cache.put('key', 'c', b'3', -1, cache.token())
+        self.assertEqual((True, b'1'), cache.get('key', 'a'))
+        self.assertEqual((False, None), cache.get('key', 'b'))
+
+    def test_memory_cap(self):
+        cache = NearCache(max_bytes=1000)
+        cache.put('key', 'a', b'x' * 600, -1, cache.token())
+        cache.put('key', 'b', b'y' * 600, -1, cache.token())
+        self.assertEqual((False, None), cache.get('key', 'a'))
+        self.assertLessEqual(cache.bytes, 1000)
+
+    def test_invalidate_during_fill(self):
+        cache = NearCache()
+        token = cache.token()
+        cache.invalidate('key', 'a')
+        self.assertFalse(cache.put('key', 'a', b'old', -1, token))
+        self.assertTrue(cache.put('key', 'a', b'new', -1, cache.token()))
+        token = cache.token()
+        cache.invalidate('key')
+        self.assertEqual((False, None), cache.get('key', 'a'))
+        self.assertFalse(cache.put('key', 'a', b'old', -1, token))
+
+    def test_invalidate_command(self):
+        cache = NearCache()
+        for field in ('a', 'b', 'c', 'd'):
+            cache.put('key', field, b'1', -1, cache.token())
+        cache.invalidate_command(('EXHDEL', 'key', 'a', 'b'))
+        cache.invalidate_command(('EXHMSET', 'key', 'c', '2'))
+        cache.invalidate_command(('EXHGET', 'key', 'd'))
+        self.assertEqual(['d'], [f for f in 'abcd' if cache.get('key', f)[0]])
+        cache.invalidate_command(('DEL', 'key'))
+        self.assertEqual(0, len(cache))
+        cache.put('key', 'a', b'1', -1, cache.token())
+        cache.put('other', 'a', b'1', -1, cache.token())
+        cache.invalidate_command(('EVALSHA', 'sha', 1, 'key', 'a'))
+        self.assertEqual([False, True], [cache.get(name, 'a')[0] for name in ('key', 'other')])
+
+    def test_put_written(self):
+        cache = NearCache()
+        self.assertTrue(cache.put_written(('EXHSET', 'key', 'a', 1, 'PX', 50), cache.invalidate('key', 'a')))
+        self.assertEqual((True, b'1'), cache.get('key', 'a'))
+        sleep(0.06)
+        self.assertEqual((False, None), cache.get('key', 'a'))
+        cache.put('key', 'a', b'0', -1, cache.token())
+        self.assertFalse(cache.put_written(('EXHSET', 'key', 'a', 1, 'NX'), cache.invalidate('key', 'a')))
+        self.assertEqual((False, None), cache.get('key', 'a'))
+
+    def test_put_written_out_of_order(self):
+        cache = NearCache()
+        # two writes in flight, the reply of the later one comes first and is cached until the other reply drops it
+        first, second = cache.invalidate('key', 'a'), cache.invalidate('key', 'a')
+        self.assertTrue(cache.put_written(('EXHSET', 'key', 'a', 'v2', 'EX', 60), second))
+        self.assertFalse(cache.put_written(('EXHSET', 'key', 'a', 'v1', 'EX', 60), first))
+        self.assertEqual((False, None), cache.get('key', 'a'))
+        # nothing is cached when the reply of the earlier one comes first
+        first, second = cache.invalidate('key', 'a'), cache.invalidate('key', 'a')
+        self.assertFalse(cache.put_written(('EXHSET', 'key', 'a', 'v1', 'EX', 60), first))
+        self.assertFalse(cache.put_written(('EXHSET', 'key', 'a', 'v2', 'EX', 60), second))
+        self.assertEqual((False, None), cache.get('key', 'a'))
+        # a read sent before the write was applied cannot fill the old value over the written one
+        written = cache.invalidate('key', 'a')
+        token = cache.token()
+        self.assertTrue(cache.put_written(('EXHSET', 'key', 'a', 'new', 'EX', 60), written))
+        self.assertFalse(cache.put('key', 'a', b'old', -1, token))
+        self.assertEqual((True, b'new'), cache.get('key', 'a'))
+        # a key-level invalidation in between also stops it
+        written = cache.invalidate('key', 'b')
+        cache.invalidate('key')
+        self.assertFalse(cache.put_written(('EXHSET', 'key', 'b', 'v', 'EX', 60), written))
+        self.assertFalse(cache.put_written(('EXHSET', 'key', 'c', {'a': 1}, 'EX', 60), cache.invalidate('key', 'c')))
+
+
+class TestInvalidationListener(TestCase):
+    def setUp(self):
+        self.cache = NearCache()
+        self.fill()
+
+    def fill(self):
+        for key, field in (('key', 'a'), ('key', 'b'), ('other', 'a')):
+            self.cache.put(key, field, b'1', -1, self.cache.token())
+
+    def cached(self):
+        return sorted((key, field) for key, field in (('key', 'a'), ('key', 'b'), ('other', 'a'))
+                      if self.cache.get(key, field)[0])
+
+    def test_connect(self):
+        subscriber, control = StubConnection(7, SUBSCRIBED), StubConnection(b'OK')
+        StubListener(self.cache, [subscriber, control], prefixes=['user:', 'item:'])
+        self.assertEqual([('CLIENT', 'ID'), ('SUBSCRIBE', '__redis__:invalidate')], subscriber.sent)
+        self.assertEqual([('CLIENT', 'TRACKING', 'ON', 'REDIRECT', 7, 'BCAST', 'PREFIX', 'user:', 'PREFIX', 'item:')],
+                         control.sent)
+
+    def test_handle(self):
+        listener = StubListener(self.cache, [StubConnection(7, SUBSCRIBED), StubConnection(b'OK')])
+        listener.handle([b'subscribe', b'__redis__:invalidate', 1])
+        listener.handle([b'message', b'other-channel'])
+        self.assertEqual(3, len(self.cache))
+        listener.handle([b'message', b'__redis__:invalidate', [b'key']])
+        self.assertEqual([('other', 'a')], self.cached())
+        # keys are None after FLUSHALL/FLUSHDB
+        listener.handle([b'message', b'__redis__:invalidate', None])
+        self.assertEqual(0, len(self.cache))
+
+    def test_reconnect(self):
+        first = StubConnection(7, SUBSCRIBED, ConnectionError('lost'))
+        rejected = StubConnection(8, SUBSCRIBED)
+        last = StubConnection(9, SUBSCRIBED)
+        connections = [first, StubConnection(b'OK'), rejected, StubConnection(ResponseError('ERR tracking')),
+                       last, StubConnection(b'OK')]
+        listener = StubListener(self.cache, connections, retry_interval=0.01)
+        with self.assertLogs('tairClient.cache', 'WARNING') as logs:
+            listener.start()
+            try:
+                wait_for(lambda: not listener.connections and not last.replies)
+                # entries cached while messages could have been missed are gone
+                self.assertEqual(0, len(self.cache))
+                self.assertTrue(first.disconnected and rejected.disconnected)
+                self.assertTrue(listener.is_alive())
+
+                self.fill()
+                last.replies.append([b'message', b'__redis__:invalidate', [b'other']])
+                wait_for(lambda: not last.replies)
+                wait_for(lambda: self.cached() == [('key', 'a'), ('key', 'b')])
+            finally:
+                listener.stop()
+                listener.join()
+        self.assertEqual(1, len(logs.records))
+        self.assertTrue(last.disconnected)
+
+
+if __name__ == "__main__":
+    main()
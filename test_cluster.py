@@ -0,0 +1,169 @@
+from unittest import TestCase, main
+
+from redis.exceptions import ResponseError
+
+from tairClient.client import Client
+from tairClient.cluster import ClusterClient, key_slot, parse_redirection
+from tairClient.server import TairHashServer
+
+
+def key_in(start, end, prefix='key'):
+    """
+    Return the first of prefix0, prefix1, ... whose slot is in [start, end].
+    """
+    i = 0
+    while not start <= key_slot('%s%d' % (prefix, i)) <= end:
+        i += 1
+    return '%s%d' % (prefix, i)
+
+
+class TestClusterRouting(TestCase):
+    def test_key_slot(self):
+        self.assertEqual(12739, key_slot('123456789'))
+        self.assertEqual(12182, key_slot('foo'))
+        self.assertEqual(12182, key_slot(b'foo'))
+
+    def test_key_slot_hash_tag(self):
+        self.assertEqual(key_slot('{user1000}.following'), key_slot('{user1000}.followers'))
+        self.assertEqual(key_slot('user1000'), key_slot('{user1000}.followers'))
+        # an empty tag hashes the whole key, and only the first tag counts
+        self.assertEqual(key_slot('{}key'), key_slot(b'{}key'))
+        self.assertNotEqual(key_slot('{}key'), key_slot(''))
+        self.assertEqual(key_slot('bar'), key_slot('{bar}{foo}'))
+        self.assertEqual(key_slot('foo{}{bar}'), key_slot(b'foo{}{bar}'))
+
+    def test_parse_redirection(self):
+        self.assertEqual(('MOVED', 3999, ('127.0.0.1', 6381)),
+                         parse_redirection(ResponseError('MOVED 3999 127.0.0.1:6381')))
+        self.assertEqual(('ASK', 3999, ('::1', 6381)), parse_redirection(ResponseError('ASK 3999 ::1:6381')))
+        self.assertIsNone(parse_redirection(ResponseError('update version is stale')))
+
+    def test_command_key(self):
+        client = ClusterClient()
+        self.assertEqual('key', client.command_key(('EXHSET', 'key', 'field', 'value')))
+        self.assertEqual('key', client.command_key(('EVALSHA', 'sha', 1, 'key', 'arg')))
+        self.assertIsNone(client.command_key(('EVALSHA', 'sha', 0, 'arg')))
+        self.assertIsNone(client.command_key(('PING',)))
+        self.assertIsNone(client.command_key(('CLIENT', 'ID')))
+
+
+class TestClusterClient(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.a = TairHashServer(port=0).start()
+        cls.b = TairHashServer(port=0).start()
+        cls.node_a = ('127.0.0.1', cls.a.port)
+        cls.node_b = ('127.0.0.1', cls.b.port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.a.stop()
+        cls.b.stop()
+
+    def setUp(self):
+        self.slot_map = [(0, 8191, self.node_a), (8192, 16383, self.node_b)]
+        for server in (self.a, self.b):
+            server.set_cluster(self.slot_map)
+        self.client = ClusterClient(startup_nodes=[self.node_a])
+        self.client.flushall()
+
+    def tearDown(self):
+        self.client.close()
+
+    def move_slots(self, start, end, node, options=None):
+        # give [start, end] to node on every server, like a finished resharding; options are per server port
+        owners = [(start, end, node)]
+        for s, e, n in self.slot_map:
+            if s < start:
+                owners.append((s, min(e, start - 1), n))
+            if e > end:
+                owners.append((max(s, end + 1), e, n))
+        self.slot_map = sorted(owners)
+        for server in (self.a, self.b):
+            server.set_cluster(self.slot_map, **(options or {}).get(server.port, {}))
+
+    def test_keys_go_to_slot_owner(self):
+        on_a, on_b = key_in(0, 8191), key_in(8192, 16383)
+        self.assertEqual(1, self.client.exhset(on_a, 'f', 'a'))
+        self.assertEqual(1, self.client.exhset(on_b, 'f', 'b'))
+        self.assertEqual([on_a.encode()], list(self.a.keyspace.db))
+        self.assertEqual([on_b.encode()], list(self.b.keyspace.db))
+        self.assertEqual((b'a', b'b'), (self.client.exhget(on_a, 'f'), self.client.exhget(on_b, 'f')))
+        self.assertEqual((self.node_a, self.node_b), (self.client.slots[0], self.client.slots[16383]))
+        with self.assertRaises(ResponseError):
+            Client(port=self.a.port).exhget(on_b, 'f')
+
+    def test_close(self):
+        self.client.exhset(key_in(0, 8191), 'f', 'v')
+        self.client.exhset(key_in(8192, 16383), 'f', 'v')
+        connections = [c for pool in self.client.nodes.values() for c in pool._available_connections]
+        self.assertEqual(2, len(connections))
+        self.client.close()
+        self.assertEqual([None, None], [c._sock for c in connections])
+
+    def test_moved_updates_slot_map(self):
+        moved = key_in(1, 4095)
+        self.client.exhset(key_in(4096, 8191), 'f', 'v')
+        self.move_slots(0, 4095, self.node_b)
+        processed = self.a.commands_processed
+        # the stale map sends the write to a, which redirects it to b
+        self.assertEqual(1, self.client.exhset(moved, 'f', 'v'))
+        self.assertEqual(processed + 1, self.a.commands_processed)
+        self.assertIn(moved.encode(), self.b.keyspace.db)
+        self.assertEqual((self.node_b, self.node_a), (self.client.slots[key_slot(moved)], self.client.slots[0]))
+        # the next command reloads the whole map with CLUSTER SLOTS
+        self.assertEqual(b'v', self.client.exhget(moved, 'f'))
+        self.assertEqual((self.node_b, self.node_a), (self.client.slots[0], self.client.slots[4096]))
+
+    def test_ask_during_migration(self):
+        old, new = '{tag}old', '{tag}new'
+        slot = key_slot(old)
+        owner, target = (self.a, self.b) if slot <= 8191 else (self.b, self.a)
+        owner_node, target_node = ('127.0.0.1', owner.port), ('127.0.0.1', target.port)
+        self.client.exhset(old, 'f', 'old')
+        owner.set_cluster(self.slot_map, migrating={slot: target_node})
+        target.set_cluster(self.slot_map, importing={slot})
+        # keys still on the owner are served there, the others are asked for on the target with ASKING
+        self.assertEqual(b'old', self.client.exhget(old, 'f'))
+        self.assertEqual(1, self.client.exhset(new, 'f', 'new'))
+        self.assertIn(new.encode(), target.keyspace.db)
+        self.assertEqual(b'new', self.client.exhget(new, 'f'))
+        # ASK does not change the slot map, and the target only serves the slot after ASKING
+        self.assertEqual(owner_node, self.client.slots[slot])
+        with self.assertRaises(ResponseError) as cm:
+            Client(port=target.port).exhget(new, 'f')
+        self.assertEqual(('MOVED', slot, owner_node), parse_redirection(cm.exception))
+
+    def test_pipeline_groups_per_node(self):
+        keys = [key_in(0, 8191, 'a'), key_in(8192, 16383, 'b'), key_in(0, 8191, 'c'), key_in(8192, 16383, 'd')]
+        processed = self.a.commands_processed, self.b.commands_processed
+        pipe = self.client.pipeline()
+        for i, key in enumerate(keys):
+            pipe.exhset(key, 'f', i)
+        for key in reversed(keys):
+            pipe.exhget(key, 'f')
+        pipe.exhincrby(keys[1], 'f', 1, maxval=1)
+        replies = pipe.execute(raise_on_error=False)
+        self.assertEqual([1, 1, 1, 1, b'3', b'2', b'1', b'0'], replies[:8])
+        self.assertIsInstance(replies[8], ResponseError)
+        self.assertEqual((4, 5), (self.a.commands_processed - processed[0], self.b.commands_processed - processed[1]))
+
+    def test_pipeline_follows_redirections(self):
+        stays, moved = key_in(4096, 8191), key_in(1, 4095)
+        asked_old, asked_new = '{tag}old', '{tag}new'
+        slot = key_slot(asked_old)
+        self.client.exhset(asked_old, 'f', 'old')
+        self.client.exhset(stays, 'f', 'v')
+        owner, target = (self.a, self.b) if slot <= 8191 else (self.b, self.a)
+        options = {owner.port: {'migrating': {slot: ('127.0.0.1', target.port)}}, target.port: {'importing': {slot}}}
+        self.move_slots(0, 4095, self.node_b, options)
+        pipe = self.client.pipeline()
+        pipe.exhset(moved, 'f', 'moved').exhget(stays, 'f').exhset(asked_new, 'f', 'new').exhget(asked_old, 'f')
+        self.assertEqual([1, b'v', 1, b'old'], pipe.execute())
+        self.assertIn(moved.encode(), self.b.keyspace.db)
+        self.assertIn(asked_new.encode(), target.keyspace.db)
+        self.assertEqual(self.node_b, self.client.slots[key_slot(moved)])
+
+
+if __name__ == "__main__":
+    main()
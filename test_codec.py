@@ -0,0 +1,180 @@
+import json
+import os
+import zlib
+from unittest import TestCase, main, skipUnless
+
+import redis
+from redis.connection import Encoder
+
+from tairClient.client import Client
+from tairClient.codec import Compressor, ValueCodec
+from tairClient.server import TairHashServer
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+BLOB = json.dumps({'items': [{'id': i, 'name': 'item-%d' % i, 'tags': ['a', 'b']} for i in range(200)]})
+
+
+class ReversedCompressor(Compressor):
+    id = 3
+
+    def compress(self, data):
+        return zlib.compress(data)[::-1]
+
+    def decompress(self, data):
+        return zlib.decompress(data[::-1])
+
+
+class TestValueCodec(TestCase):
+    def setUp(self):
+        self.codec = ValueCodec(threshold=100, serializer=json)
+        self.codec.encoder = Encoder('utf-8', 'strict', False)
+
+    def test_small_values_unchanged(self):
+        self.assertEqual(b'value', self.codec.encode('value'))
+        self.assertEqual(42, self.codec.encode(42))
+        self.assertEqual(1.5, self.codec.encode(1.5))
+        self.assertEqual(b'value', self.codec.decode(b'value'))
+        self.assertIsNone(self.codec.decode(None))
+
+    def test_compressed(self):
+        data = self.codec.encode(BLOB)
+        self.assertEqual(0xFA, data[0])
+        self.assertLess(len(data), len(BLOB) / 4)
+        self.assertEqual(BLOB.encode(), self.codec.decode(data))
+        # incompressible data is stored raw
+        noise = b'\x00' + os.urandom(512)
+        self.assertEqual(noise, self.codec.encode(noise))
+        self.assertEqual(noise, self.codec.decode(noise))
+
+    def test_raw_values_with_header_byte_escaped(self):
+        value = b'\xf9binary'
+        data = self.codec.encode(value)
+        self.assertEqual(b'\xf8\xf9binary', data)
+        self.assertEqual(value, self.codec.decode(data))
+
+    def test_serialized(self):
+        value = {'a': [1, 2]}
+        data = self.codec.encode(value)
+        self.assertEqual(0xF9, data[0])
+        self.assertEqual(value, self.codec.decode(data))
+        big = {'blob': BLOB}
+        self.assertEqual(0xFB, self.codec.encode(big)[0])
+        self.assertEqual(big, self.codec.decode(self.codec.encode(big)))
+
+    def test_other_compressors(self):
+        codec = ValueCodec(threshold=100, compressor=ReversedCompressor())
+        codec.encoder = self.codec.encoder
+        data = codec.encode(BLOB)
+        self.assertEqual(0xFE, data[0])
+        self.assertEqual(BLOB.encode(), codec.decode(data))
+        # zlib values written before keep decoding, and values of another compressor need it registered
+        self.assertEqual(BLOB.encode(), codec.decode(self.codec.encode(BLOB)))
+        self.assertEqual(BLOB.encode(), ValueCodec(decompressors=[ReversedCompressor()]).decode(data))
+        with self.assertRaises(KeyError):
+            ValueCodec().decode(data)
+
+    @skipUnless(lz4, 'lz4 is not installed')
+    def test_lz4(self):
+        from tairClient.codec import LZ4Compressor
+        codec = ValueCodec(threshold=100, compressor=LZ4Compressor())
+        codec.encoder = self.codec.encoder
+        data = codec.encode(BLOB)
+        self.assertEqual(0xFC, data[0])
+        self.assertEqual(BLOB.encode(), codec.decode(data))
+
+    def test_stats(self):
+        self.codec.encode(BLOB)
+        self.codec.encode('x' * 10)
+        stats = self.codec.stats()
+        self.assertEqual((2, 1), (stats['encoded'], stats['compressed']))
+        self.assertEqual(len(BLOB) + 10, stats['bytes_in'])
+        self.assertLess(stats['ratio'], 0.3)
+
+
+class TestClientCodec(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = TairHashServer(port=0).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.client = Client(port=self.server.port)
+        self.plain = Client(port=self.server.port)
+        self.client.flushall()
+        self.codec = self.client.enable_codec(threshold=256)
+
+    def test_roundtrip(self):
+        client = self.client
+        self.assertEqual(1, client.exhset('key', 'blob', BLOB, ex=60))
+        client.exhmset('key', {'small': 'v', 'blob2': BLOB})
+        stored = self.plain.exhget('key', 'blob')
+        self.assertLess(len(stored), len(BLOB) / 4)
+        blob = BLOB.encode()
+        self.assertEqual(blob, client.exhget('key', 'blob'))
+        self.assertEqual([blob, b'v', None], client.exhmget('key', 'blob', 'small', 'missing'))
+        self.assertEqual({b'blob': blob, b'small': b'v', b'blob2': blob}, client.exhgetall('key'))
+        self.assertEqual(sorted([blob, b'v', blob]), sorted(client.exhvals('key')))
+        self.assertEqual({b'blob': blob, b'small': b'v', b'blob2': blob}, dict(client.exhscan_iter('key')))
+        self.assertEqual(blob, client.exhgetwithver('key', 'blob').value)
+        self.assertEqual([blob, None], [r and r.value for r in client.exhmgetwithver('key', 'blob2', 'missing')])
+        pipe = client.pipeline(transaction=False)
+        pipe.exhset('key', 'blob3', BLOB).exhget('key', 'blob3').exhget('key', 'small')
+        self.assertEqual([1, blob, b'v'], pipe.execute())
+        self.assertEqual(11, self.codec.stats()['decompressed'])
+
+        client.disable_codec()
+        self.assertEqual(stored, client.exhget('key', 'blob'))
+
+    def test_counters_untouched(self):
+        client = self.client
+        client.exhset('key', 'n', 5)
+        self.assertEqual(7, client.exhincrby('key', 'n', 2))
+        self.assertEqual(b'7', client.exhget('key', 'n'))
+        client.exhmset('key', {'f': 1.5})
+        self.assertEqual(2.5, float(client.exhincrbyfloat('key', 'f', 1)))
+
+    def test_plain_values_readable(self):
+        self.plain.exhset('key', 'old', 'written before')
+        self.assertEqual(b'written before', self.client.exhget('key', 'old'))
+
+    def test_near_cache(self):
+        cache = self.client.enable_near_cache()
+        self.client.exhset('key', 'blob', BLOB, ex=60)
+        self.assertEqual(BLOB.encode(), self.client.exhget('key', 'blob'))
+        self.assertEqual(1, cache.stats()['hits'])
+        self.client.exhset('key', 'other', BLOB)
+        self.assertEqual(BLOB.encode(), self.client.exhget('key', 'other'))
+        self.assertEqual(BLOB.encode(), self.client.exhget('key', 'other'))
+        self.assertEqual(2, cache.stats()['hits'])
+
+    def test_near_cache_serialized(self):
+        self.client.enable_codec(threshold=256, serializer=json)
+        cache = self.client.enable_near_cache()
+        self.assertEqual(1, self.client.exhset('key', 'doc', {'a': 1}, ex=10))
+        self.assertEqual({'a': 1}, self.client.exhget('key', 'doc'))
+        self.assertEqual(0, cache.stats()['hits'])
+        self.client.exhset('key', 'text', 'plain', ex=10)
+        self.assertEqual(b'plain', self.client.exhget('key', 'text'))
+        self.assertEqual(1, cache.stats()['hits'])
+
+    def test_raw_replies(self):
+        client = Client(port=self.server.port, raw_replies=True)
+        client.enable_codec(threshold=256)
+        client.exhset('key', 'blob', BLOB)
+        self.assertEqual([b'blob', BLOB.encode()], client.exhgetall('key'))
+        self.assertEqual([BLOB.encode(), 1], client.exhgetwithver('key', 'blob'))
+
+    def test_decode_responses_rejected(self):
+        with self.assertRaises(redis.exceptions.DataError):
+            Client(port=self.server.port, decode_responses=True).enable_codec()
+
+
+if __name__ == '__main__':
+    main()
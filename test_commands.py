@@ -1,8 +1,10 @@
+from array import array
 from unittest import TestCase, main
 
 import redis
 
 from tairClient.client import Client
+from tairClient.versioned import VersionConflictError
 from datetime import datetime, timedelta
 from time import time, sleep
 
@@ -403,6 +405,242 @@ class TestTairClient(TestCase):
         self.assertEqual(b'OK', client.exhmset('key', mapping={'a': 1, 'b': 2, 'c': 3}))
         self.assertEqual([[b'1', 1], [b'2', 1], [b'3', 1]], client.exhmgetwithver('key', 'a', 'b', 'c'))
 
+    def test_exhmget_batch(self):
+        self.assertEqual(b'OK', client.exhmset('key', mapping={'a': 1, 'b': 2}))
+        self.assertEqual(b'OK', client.exhmset('key1', mapping={'c': 3}))
+        self.assertEqual({'key': {'a': b'1', 'b': b'2', 'd': None}, 'key1': {'c': b'3'}, 'key2': {'a': None}},
+                         client.exhmget_batch({'key': ['a', 'b', 'd'], 'key1': 'c', 'key2': ['a']}, chunk_size=2))
+        self.assertEqual({'key': {'a': [b'1', 1]}}, client.exhmget_batch({'key': ['a']}, withver=True))
+
+    def test_exhset_bulk(self):
+        failed = []
+        entries = [('key', 'a', 1), ('key', 'b', 2, {'ex': 100}), ('key1', 'c', 3), ('key', 'a', 4, {'ver': 5})]
+        report = client.exhset_bulk(iter(entries), chunk_size=2, max_in_flight=1,
+                                    on_error=lambda entry, error: failed.append(entry))
+        self.assertEqual(4, report['items'])
+        self.assertEqual(3, report['written'])
+        self.assertEqual(1, report['failed'])
+        self.assertEqual(2, report['batches'])
+        self.assertEqual([entries[3]], failed)
+        self.assertEqual(entries[3], report['errors'][0][0])
+        self.assertEqual({b'a': b'1', b'b': b'2'}, client.exhgetall('key'))
+        self.assertTrue(0 < client.exhttl('key', 'b') <= 100)
+        self.assertEqual(b'3', client.exhget('key1', 'c'))
+
+        def on_error(entry, error):
+            raise KeyError(entry)
+
+        with self.assertRaises(KeyError):
+            client.exhset_bulk(iter(entries), chunk_size=2, max_in_flight=2, on_error=on_error)
+
+    def test_exhexpire_many(self):
+        self.assertEqual(b'OK', client.exhmset('key', mapping={'a': 1, 'b': 2}))
+        self.assertEqual(1, client.exhset('key1', 'c', 3))
+        self.assertEqual({'key': {'a': 1, 'b': 1, 'd': 0}, 'key1': {'c': 1}},
+                         client.exhexpire_many({'key': ['a', 'b', 'd'], 'key1': 'c'}, ex=100, chunk_size=2))
+        self.assertTrue(0 < client.exhttl('key1', 'c') <= 100)
+        self.assertEqual({'key': {'d': 0}},
+                         client.exhpexpire_many({'key': {'a': 5000, 'd': 5000}}, failures_only=True))
+        self.assertTrue(0 < client.exhpttl('key', 'a') <= 5000)
+        failures = client.exhexpire_many({'key': ['a']}, ex=100, ver=10, failures_only=True)
+        self.assertIsInstance(failures['key']['a'], redis.exceptions.ResponseError)
+        with self.assertRaises(redis.exceptions.DataError):
+            client.exhexpire_many({'key': ['a']})
+
+    def test_exhupdate(self):
+        self.assertEqual(b'OK', client.exhmset('key', mapping={'a': 1, 'b': 2}))
+        other = Client(host=REDIS_HOST, port=REDIS_PORT)
+        calls = []
+
+        def increment(field, value):
+            calls.append(field)
+            if len(calls) == 1:
+                # another writer changes 'a' between our read and our write
+                other.exhset('key', 'a', 10)
+            return int(value or 0) + 1
+
+        stats = client.update_stats.stats()
+        self.assertEqual({'a': 11, 'b': 3, 'c': 1}, client.exhupdate('key', ['a', 'b', 'c'], increment))
+        self.assertEqual(['a', 'b', 'c', 'a'], calls)
+        self.assertEqual([b'11', b'3', b'1'], client.exhmget('key', 'a', 'b', 'c'))
+        after = client.update_stats.stats()
+        self.assertEqual(1, after['conflicts'] - stats['conflicts'])
+        self.assertEqual(2, after['rounds'] - stats['rounds'])
+        self.assertEqual({}, client.exhupdate('key', ['a'], lambda field, value: None))
+
+        def always_stale(field, value):
+            other.exhset('key', field, 0)
+            return 1
+
+        with self.assertRaises(VersionConflictError) as raised:
+            client.exhupdate('key', ['a'], always_stale, max_attempts=3, backoff=0)
+        self.assertEqual(['a'], raised.exception.fields)
+
+    def test_counter_buffer(self):
+        dropped = []
+        counters = client.counter_buffer(interval=60, flush_at_exit=False,
+                                         on_error=lambda name, field, amount, error: dropped.append(field))
+        for _ in range(100):
+            counters.incrby('key', 'a')
+            counters.incrbyfloat('key', 'b', 0.5, ex=100)
+        counters.incrby('key', 'c', 5, maxval=3)
+        self.assertEqual(None, client.exhget('key', 'a'))
+        # the rejected total of c is sent again as its single increment, which is rejected too
+        self.assertEqual(4, counters.flush())
+        self.assertEqual([b'100', b'50'], client.exhmget('key', 'a', 'b'))
+        self.assertTrue(0 < client.exhttl('key', 'b') <= 100)
+        self.assertEqual(['c'], dropped)
+        counters.incrby('key', 'a', 2)
+        counters.close()
+        self.assertEqual(b'102', client.exhget('key', 'a'))
+        stats = counters.stats()
+        self.assertEqual(202, stats['increments'])
+        self.assertEqual(5, stats['commands'])
+        with self.assertRaises(ValueError):
+            counters.incrby('key', 'a')
+        with client.counter_buffer(interval=0.01, flush_at_exit=False) as counters:
+            with self.assertRaises(ValueError):
+                counters.incrby('key', 'a', ver=1)
+            counters.incrby('key', 'a')
+            sleep(0.1)
+            self.assertEqual(b'103', client.exhget('key', 'a'))
+
+    def test_counter_buffer_bounds(self):
+        dropped = []
+        counters = client.counter_buffer(interval=60, flush_at_exit=False,
+                                         on_error=lambda name, field, amount, error: dropped.append(amount))
+        # a +100 total breaks maxval, the separate increments stop at it like direct calls
+        for _ in range(100):
+            counters.incrby('key', 'a', 1, maxval=50)
+        counters.incrby('key', 'b', 3, minval=0)
+        counters.incrby('key', 'b', -5, minval=0)
+        counters.incrby('key', 'b', 1, minval=0)
+        self.assertEqual(105, counters.flush())
+        self.assertEqual([b'50', b'4'], client.exhmget('key', 'a', 'b'))
+        self.assertEqual([1] * 50 + [-5], dropped)
+        self.assertEqual(51, counters.stats()['dropped'])
+        counters.close()
+
+    def test_rate_limiter(self):
+        first = client.rate_limiter('limits', 5, 3600, lease=2)
+        second = client.rate_limiter('limits', 5, 3600, lease=2)
+        self.assertEqual([True, True, True, True], [first.acquire('t'), first.acquire('t'),
+                                                    second.acquire('t'), second.acquire('t')])
+        # one token is left on the server, the lease shrinks to it
+        self.assertTrue(first.acquire('t'))
+        self.assertFalse(second.acquire('t'))
+        self.assertFalse(first.acquire('t'))
+        self.assertTrue(first.acquire('other'))
+        self.assertAlmostEqual(1 / 3, second.stats()['local_ratio'])
+
+        # tenants of past windows are forgotten
+        short = client.rate_limiter('short', 5, 0.05)
+        for tenant in range(100):
+            short.acquire(tenant)
+        sleep(0.05)
+        self.assertTrue(short.acquire('t'))
+        self.assertEqual(['t'], list(short._leases))
+
+        sliding = client.rate_limiter('sliding', 4, 3600, sliding=True, lease=3)
+        self.assertTrue(sliding.acquire('t', 2))
+        self.assertTrue(sliding.acquire('t'))
+        self.assertTrue(sliding.acquire('t'))
+        self.assertFalse(sliding.acquire('t'))
+        self.assertFalse(sliding.acquire('t'))
+        self.assertEqual({'allowed': 3, 'denied': 2, 'server_calls': 3}, {
+            k: v for k, v in sliding.stats().items() if k != 'local_ratio'})
+
+    def test_scripts(self):
+        client.script_flush()
+        self.assertEqual(b'1', client.exhget_or_set('key', 'a', 1, ex=100))
+        self.assertEqual(b'1', client.exhget_or_set('key', 'a', 2))
+        self.assertTrue(0 < client.exhttl('key', 'a') <= 100)
+        self.assertEqual([3, -1], client.exhincrby_pttl('key', 'b', 3))
+        value, pttl = client.exhincrby_pttl('key', 'b', 1, px=5000, maxval=10)
+        self.assertEqual(4, value)
+        self.assertTrue(0 < pttl <= 5000)
+        self.assertEqual(0, client.exhdel_if_version('key', 'b', 1))
+        self.assertEqual(1, client.exhdel_if_version('key', 'b', 2))
+        self.assertEqual(1, client.exhmove('key', 'key1', 'a'))
+        self.assertEqual(0, client.exhmove('key', 'key1', 'a'))
+        self.assertEqual(b'1', client.exhget('key1', 'a'))
+        self.assertTrue(0 < client.exhttl('key1', 'a') <= 100)
+        self.assertEqual(0, client.exhlen('key'))
+
+        client.script_flush()
+        pipe = client.pipeline(transaction=False)
+        pipe.exhget_or_set('key', 'c', 5).exhincrby_pttl('key', 'c', 1).exhmove('key', 'key1', 'c')
+        self.assertEqual([b'5', [6, -1], 1], pipe.execute())
+        self.assertEqual(b'6', client.exhget('key1', 'c'))
+
+    def test_metrics(self):
+        measured = Client(host=REDIS_HOST, port=REDIS_PORT)
+        metrics = measured.enable_metrics()
+        measured.exhset('key', 'a', 1)
+        measured.exhget('key', 'a')
+        with self.assertRaises(redis.exceptions.ResponseError):
+            measured.exhincrby('key', 'a', 1, maxval=1)
+        measured.pipeline(transaction=False).exhget('key', 'a').exhincrby('key', 'a', 1, maxval=1).execute(
+            raise_on_error=False)
+        snapshot = metrics.snapshot()
+        self.assertEqual(1, snapshot['commands']['EXHSET']['count'])
+        self.assertEqual(1, snapshot['commands']['EXHGET']['count'])
+        self.assertEqual({'EXHINCRBY': 2}, snapshot['errors'])
+        self.assertEqual(1, snapshot['pipeline_size']['count'])
+        self.assertIn('command="EXHSET"', metrics.prometheus())
+        measured.disable_metrics()
+        measured.exhget('key', 'a')
+        self.assertEqual(1, metrics.snapshot()['commands']['EXHGET']['count'])
+
+    def test_tracing(self):
+        traced = Client(host=REDIS_HOST, port=REDIS_PORT)
+        tracer = traced.enable_tracing(sample_rate=1.0, top_n=2)
+        traced.exhmset('key', {'f%d' % i: 'v' * 100 for i in range(100)})
+        traced.exhgetall('key')
+        traced.exhget('key', 'f1')
+        traced.pipeline(transaction=False).exhget('key', 'f1').exhlen('key').execute()
+        largest = {r['command']: r for r in tracer.largest()}
+        self.assertEqual({'EXHGETALL', 'EXHMSET'}, set(largest))
+        self.assertEqual(200, largest['EXHGETALL']['reply_elements'])
+        self.assertEqual(201, largest['EXHMSET']['args'])
+        self.assertTrue(largest['EXHMSET']['request_bytes'] > 10000)
+        self.assertEqual(4, tracer.recorded)
+        traced.disable_tracing()
+        traced.exhget('key', 'f1')
+        self.assertEqual(4, tracer.recorded)
+
+    def test_near_cache(self):
+        cached = Client(host=REDIS_HOST, port=REDIS_PORT)
+        cache = cached.enable_near_cache()
+        self.assertEqual(1, cached.exhset('key', 'a', 1))
+        self.assertEqual(b'1', cached.exhget('key', 'a'))
+        self.assertEqual(b'1', cached.exhget('key', 'a'))
+        self.assertEqual([b'1', None], cached.exhmget('key', 'a', 'b'))
+        self.assertEqual(2, cache.stats()['hits'])
+        self.assertEqual(2, cached.exhincrby('key', 'a', 1))
+        self.assertEqual(b'2', cached.exhget('key', 'a'))
+        self.assertEqual(1, cached.exhdel('key', 'a'))
+        self.assertEqual(None, cached.exhget('key', 'a'))
+        cached.disable_near_cache()
+
+    def test_near_cache_metrics(self):
+        cached = Client(host=REDIS_HOST, port=REDIS_PORT)
+        cached.enable_near_cache()
+        metrics = cached.enable_metrics()
+        traced = []
+        cached.enable_tracing(sample_rate=1.0, callback=traced.append)
+        cached.exhset('key', 'a', 1)
+        cached.exhget('key', 'a')
+        cached.exhget('key', 'a')
+        cached.exhmget('key', 'a', 'b')
+        snapshot = metrics.snapshot()
+        # hits and misses count as the cached command, the miss's round trip is not a pipeline
+        self.assertEqual(2, snapshot['commands']['EXHGET']['count'])
+        self.assertEqual(1, snapshot['commands']['EXHMGET']['count'])
+        self.assertEqual(0, snapshot['pipeline_size']['count'])
+        self.assertEqual(['EXHSET', 'EXHGET', 'EXHGET', 'EXHMGET'], [r['command'] for r in traced])
+        cached.disable_near_cache()
+
     def test_exhdel(self):
         self.assertEqual(b'OK', client.exhmset('key', mapping={'a': 1, 'b': 2, 'c': 3}))
         self.assertEqual(2, client.exhdel('key', 'a', 'b'))
@@ -439,10 +677,93 @@ class TestTairClient(TestCase):
         self.assertEqual(b'OK', client.exhmset('key', mapping={'a': 1, 'b': 2, 'c': 3}))
         self.assertEqual([b'3', b'2', b'1'], client.exhvals('key'))
 
+    def test_exhvals_array(self):
+        self.assertEqual((array('d'), bytearray()), client.exhvals_array('key'))
+        client.exhmset('key', mapping={'a': 1, 'b': 2.5, 'c': -3})
+        values, mask = client.exhvals_array('key')
+        self.assertEqual([-3.0, 2.5, 1.0], values.tolist())
+        self.assertEqual(bytearray(3), mask)
+        client.exhset('key', 'b', 2)
+        self.assertEqual(array('q', [-3, 2, 1]), client.exhvals_array('key', typecode='q')[0])
+
+    def test_exhmget_array(self):
+        client.exhmset('key', mapping={'f%d' % i: i * 0.5 for i in range(1000)})
+        values, mask = client.exhmget_array('key', ['f1', 'missing', 'f999'])
+        self.assertEqual(0.5, values[0])
+        self.assertNotEqual(values[1], values[1])
+        self.assertEqual(499.5, values[2])
+        self.assertEqual(bytearray([0, 1, 0]), mask)
+        values, mask = client.exhmget_array('key', ['f%d' % i for i in range(1000)])
+        self.assertEqual([i * 0.5 for i in range(1000)], values.tolist())
+        client.exhset('key', 'n', 7)
+        pipe = client.pipeline()
+        pipe.exhmget_array('key', ['n', 'missing'], typecode='q').exhget('key', 'f2').exhvals_array('nokey')
+        self.assertEqual([(array('q', [7, 0]), bytearray([0, 1])), b'1.0', (array('d'), bytearray())],
+                         pipe.execute())
+        client.exhset('key', 'text', 'abc')
+        with self.assertRaises(ValueError):
+            client.exhmget_array('key', ['f2', 'text'])
+        # the reply was consumed before the values were converted
+        self.assertEqual(b'abc', client.exhget('key', 'text'))
+
+    def test_exhgetall_stream(self):
+        self.assertEqual([], list(client.exhgetall_stream('key')))
+        mapping = {b'f%d' % i: b'v%d' % i for i in range(5000)}
+        client.exhmset('key', mapping)
+        self.assertEqual(mapping, dict(client.exhgetall_stream('key')))
+        self.assertEqual(sorted(mapping), sorted(client.exhkeys_stream('key')))
+        self.assertEqual(sorted(mapping.values()), sorted(client.exhvals_stream('key')))
+        pool = client.connection_pool
+        created = pool._created_connections
+        stream = client.exhvals_stream('key')
+        next(stream)
+        stream.close()
+        # the connection with the unread rest of the reply was dropped, then reconnects cleanly
+        self.assertEqual(created, pool._created_connections)
+        self.assertEqual(b'v1', client.exhget('key', 'f1'))
+
     def test_exhgetall(self):
-        self.assertEqual([], client.exhgetall('key'))
+        self.assertEqual({}, client.exhgetall('key'))
+        self.assertEqual(b'OK', client.exhmset('key', mapping={'a': 1, 'b': 2, 'c': 3}))
+        self.assertEqual({b'c': b'3', b'b': b'2', b'a': b'1'}, client.exhgetall('key'))
+
+    def test_exhscan(self):
         self.assertEqual(b'OK', client.exhmset('key', mapping={'a': 1, 'b': 2, 'c': 3}))
-        self.assertEqual([b'c', b'3', b'b', b'2', b'a', b'1'], client.exhgetall('key'))
+        cursor, fields = client.exhscan('key', 0, count=10)
+        self.assertEqual(0, cursor)
+        self.assertEqual({b'a': b'1', b'b': b'2', b'c': b'3'}, fields)
+
+    def test_exhscan_iter(self):
+        mapping = {'f%d' % i: i for i in range(500)}
+        self.assertEqual(b'OK', client.exhmset('key', mapping=mapping))
+        expected = {k.encode(): str(v).encode() for k, v in mapping.items()}
+        self.assertEqual(expected, dict(client.exhscan_iter('key')))
+        self.assertEqual(expected, dict(client.exhscan_iter('key', count=7, prefetch=False)))
+        self.assertEqual({b'f1': b'1'}, dict(client.exhscan_iter('key', match='f1')))
+        self.assertEqual([], list(client.exhscan_iter('nokey')))
+
+    def test_fast_encoder(self):
+        fast = Client(host=REDIS_HOST, port=REDIS_PORT, fast_encoder=True)
+        for _ in range(3):
+            self.assertIn(fast.exhset('key', 'a', 'x' * 10000, ex=10), (0, 1))
+        self.assertEqual(b'x' * 10000, fast.exhget('key', 'a'))
+        pipe = fast.pipeline()
+        pipe.exhset('key', 'b', 1, px=10000).exhincrby('key', 'b', 2).exhget('key', 'b')
+        self.assertEqual([1, 3, b'3'], pipe.execute())
+
+    def test_exhgetwithver_record(self):
+        self.assertEqual(1, client.exhset('key', 'a', '1', abs=6))
+        value, version = client.exhgetwithver('key', 'a')
+        self.assertEqual((b'1', 6), (value, version))
+        self.assertEqual(6, client.exhmgetwithver('key', 'a', 'b')[0].version)
+        self.assertIsNone(client.exhmgetwithver('key', 'a', 'b')[1])
+
+    def test_raw_replies(self):
+        raw = Client(host=REDIS_HOST, port=REDIS_PORT, raw_replies=True)
+        self.assertEqual(b'OK', raw.exhmset('key', mapping={'a': 1}))
+        self.assertEqual([b'a', b'1'], raw.exhgetall('key'))
+        self.assertEqual([b'1', 1], raw.exhgetwithver('key', 'a'))
+        self.assertIsInstance(raw.exhgetwithver('key', 'a'), list)
 
     "----------------------------------"
 
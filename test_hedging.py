@@ -0,0 +1,161 @@
+import threading
+from time import perf_counter, sleep
+from unittest import TestCase, main
+
+import redis
+
+from tairClient.client import Client
+from tairClient.hedging import HedgePolicy
+from tairClient.server import TairHashServer
+
+
+class TestHedgePolicy(TestCase):
+    def setUp(self):
+        self.policy = HedgePolicy(threshold=0.01, budget=1.0, burst=2)
+
+    def tearDown(self):
+        self.policy.close()
+
+    def test_fast_read_not_hedged(self):
+        calls = []
+        self.assertEqual('v', self.policy.run(lambda *args: calls.append(args) or 'v', ('EXHGET', 'k', 'f'), {}))
+        self.assertEqual(1, len(calls))
+        self.assertEqual(0, self.policy.stats()['hedges'])
+
+    def test_slow_read_hedged(self):
+        calls = []
+
+        def send(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                sleep(0.5)
+                return 'slow'
+            return 'fast'
+
+        start = perf_counter()
+        self.assertEqual('fast', self.policy.run(send, ('EXHGET', 'k', 'f'), {}))
+        self.assertLess(perf_counter() - start, 0.3)
+        self.assertEqual([('EXHGET', 'k', 'f')] * 2, calls)
+        stats = self.policy.stats()
+        self.assertEqual((1, 1, 1, 1.0), (stats['reads'], stats['hedges'], stats['wins'], stats['hedge_rate']))
+
+    def test_first_error_waits_for_hedge(self):
+        calls = []
+
+        def send(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                sleep(0.05)
+                raise redis.exceptions.ConnectionError('down')
+            sleep(0.1)
+            return 'hedge'
+
+        self.assertEqual('hedge', self.policy.run(send, ('EXHGET', 'k', 'f'), {}))
+
+        def fail(*args):
+            sleep(0.02)
+            raise redis.exceptions.ConnectionError('down')
+
+        with self.assertRaises(redis.exceptions.ConnectionError):
+            self.policy.run(fail, ('EXHGET', 'k', 'f'), {})
+
+    def test_budget(self):
+        policy = HedgePolicy(threshold=0.001, budget=0.25, burst=1)
+        try:
+            slow = lambda *args: sleep(0.005) or 'v'
+            for _ in range(20):
+                policy.run(slow, ('EXHGET', 'k', 'f'), {})
+            stats = policy.stats()
+            # one hedge from the burst, then one per four reads
+            self.assertEqual(5, stats['hedges'])
+            self.assertEqual(15, stats['denied'])
+        finally:
+            policy.close()
+
+    def test_busy_workers_never_queue_reads(self):
+        policy = HedgePolicy(threshold=0.02, budget=1.0, max_workers=1)
+        threads = []
+
+        def send(*args):
+            threads.append(threading.current_thread())
+            sleep(0.1)
+            return 'v'
+
+        try:
+            callers = [threading.Thread(target=policy.run, args=(send, ('EXHGET', 'k', 'f'), {})) for _ in range(2)]
+            start = perf_counter()
+            for caller in callers:
+                caller.start()
+            for caller in callers:
+                caller.join()
+            # the second read ran on its caller's thread at once, and the first was not hedged for lack of a worker
+            self.assertLess(perf_counter() - start, 0.18)
+            self.assertEqual(2, len(threads))
+            self.assertEqual(1, len(set(threads) & set(callers)))
+            stats = policy.stats()
+            self.assertEqual((0, 1), (stats['hedges'], stats['inline']))
+        finally:
+            policy.close()
+
+    def test_adaptive_threshold(self):
+        policy = HedgePolicy(percentile=90, window=100, min_samples=10, min_threshold=0.0001)
+        try:
+            self.assertIsNone(policy.current_threshold())
+            for i in range(10):
+                policy.run(lambda *args: 'v', ('EXHGET', 'k', 'f'), {})
+            self.assertEqual(0, policy.stats()['hedges'])
+            self.assertIsNotNone(policy.current_threshold())
+            for elapsed in [0.001] * 90 + [0.05] * 10:
+                policy._observe(elapsed)
+            self.assertEqual(0.05, policy.current_threshold())
+            for elapsed in [0.001] * 100:
+                policy._observe(elapsed)
+            self.assertEqual(0.001, policy.current_threshold())
+        finally:
+            policy.close()
+
+
+class TestClientHedging(TestCase):
+    def test_hedge_to_other_replica(self):
+        with TairHashServer(port=0) as primary, TairHashServer(port=0, latency={'exhget': 0.3}) as slow, \
+                TairHashServer(port=0) as fast:
+            for server in (slow, fast):
+                Client(port=server.port).exhset('key', 'a', 'v')
+            client = Client(port=primary.port)
+            client.enable_replica_reads([('127.0.0.1', slow.port), ('127.0.0.1', fast.port)])
+            policy = client.enable_hedging(threshold=0.02, budget=1.0)
+            for _ in range(6):
+                start = perf_counter()
+                self.assertEqual(b'v', client.exhget('key', 'a'))
+                self.assertLess(perf_counter() - start, 0.2)
+            # a write is never hedged
+            client.exhset('key', 'b', 'v')
+            stats = policy.stats()
+            self.assertEqual(6, stats['reads'])
+            self.assertEqual(stats['hedges'], stats['wins'])
+            client.close()
+
+    def test_concurrent_reads(self):
+        with TairHashServer(port=0, jitter=0.002) as server:
+            client = Client(port=server.port)
+            client.exhset('key', 'a', 'v')
+            policy = client.enable_hedging(percentile=50, min_samples=20, budget=0.5)
+            results = []
+
+            def read():
+                for _ in range(50):
+                    results.append(client.exhget('key', 'a'))
+
+            threads = [threading.Thread(target=read) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual([b'v'] * 200, results)
+            self.assertEqual(200, policy.stats()['reads'])
+            self.assertGreater(policy.stats()['hedges'], 0)
+            client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+from unittest import TestCase, main
+
+from tairClient.metrics import CommandMetrics, Histogram
+
+
+class TestHistogram(TestCase):
+    def test_buckets(self):
+        histogram = Histogram(8, 1e6)
+        for latency in (0.0000005, 0.000003, 0.000003, 0.01):
+            histogram.add(latency)
+        self.assertEqual([1, 0, 2, 0, 0, 0, 0, 1], histogram.counts)
+        self.assertEqual(4, histogram.count)
+        self.assertEqual(0.000004, histogram.quantile(0.5))
+        self.assertEqual(0.000128, histogram.quantile(1.0))
+
+    def test_empty(self):
+        self.assertEqual(0.0, Histogram(4).quantile(0.99))
+
+
+class TestCommandMetrics(TestCase):
+    def test_snapshot(self):
+        metrics = CommandMetrics()
+        metrics.record('EXHSET', 0.0002)
+        metrics.record('EXHSET', 0.0003)
+        metrics.record_error('EXHSET')
+        metrics.record_error('EXHGET', timeout=True)
+        metrics.record_pipeline(10, 0.001)
+        snapshot = metrics.snapshot()
+        self.assertEqual(2, snapshot['commands']['EXHSET']['count'])
+        self.assertEqual({'EXHSET': 1}, snapshot['errors'])
+        self.assertEqual({'EXHGET': 1}, snapshot['timeouts'])
+        self.assertEqual([(16.0, 1)], snapshot['pipeline_size']['buckets'])
+        metrics.reset()
+        self.assertEqual({}, metrics.snapshot()['commands'])
+
+    def test_prometheus(self):
+        metrics = CommandMetrics()
+        metrics.record('EXHGET', 0.000003)
+        metrics.record_error('EXHGET')
+        text = metrics.prometheus()
+        self.assertIn('# TYPE tair_client_command_duration_seconds histogram\n', text)
+        self.assertIn('tair_client_command_duration_seconds_bucket{command="EXHGET",le="2e-06"} 0\n', text)
+        self.assertIn('tair_client_command_duration_seconds_bucket{command="EXHGET",le="4e-06"} 1\n', text)
+        self.assertIn('tair_client_command_duration_seconds_bucket{command="EXHGET",le="+Inf"} 1\n', text)
+        self.assertIn('tair_client_command_duration_seconds_count{command="EXHGET"} 1\n', text)
+        self.assertIn('tair_client_command_errors_total{command="EXHGET"} 1\n', text)
+        self.assertIn('tair_client_pipeline_size_count 0\n', text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import threading
+from unittest import TestCase, main
+
+import redis
+
+from tairClient.client import Client
+from tairClient.server import TairHashServer
+
+
+class TestMultiplexing(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = TairHashServer(port=0, rtt=0.002).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.client = Client(port=self.server.port)
+        self.client.flushall()
+        self.multiplexer = self.client.enable_multiplexing(connections=2, batch_window=0.001, max_batch=64)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_replies_match_callers(self):
+        client = self.client
+        created = client.connection_pool._created_connections
+        errors = []
+
+        def work(t):
+            for i in range(50):
+                client.exhset('key%d' % t, 'f%d' % i, i)
+                value = client.exhget('key%d' % t, 'f%d' % i)
+                if value != str(i).encode():
+                    errors.append((t, i, value))
+
+        threads = [threading.Thread(target=work, args=(t,)) for t in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual(50, len(client.exhgetall('key3')))
+        stats = self.multiplexer.stats()
+        self.assertGreater(stats['average_batch'], 1)
+        # only the shared connections were used
+        self.assertEqual(created, client.connection_pool._created_connections)
+
+    def test_errors_and_exclusive_commands(self):
+        client = self.client
+        self.assertEqual(1, client.exhset('key', 'k', 'v'))
+        with self.assertRaisesRegex(redis.exceptions.ResponseError, "value is not an integer"):
+            client.exhincrby('key', 'k', 1)
+        self.assertEqual(b'v', client.exhget('key', 'k'))
+        pipe = client.pipeline()
+        pipe.exhset('key', 'a', 1).exhget('key', 'a')
+        self.assertEqual([1, b'1'], pipe.execute())
+
+    def test_closed(self):
+        self.client.disable_multiplexing()
+        with self.assertRaises(redis.exceptions.ConnectionError):
+            self.multiplexer.submit(('PING',))
+        self.assertTrue(self.client.ping())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import threading
+from time import sleep
+from unittest import TestCase, main
+
+import redis
+
+from tairClient.client import Client
+from tairClient.pool import TairConnectionPool
+from tairClient.server import TairHashServer
+
+
+class TestTairConnectionPool(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = TairHashServer(port=0).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_warm_up(self):
+        client = Client(port=self.server.port, max_connections=4, warm_up=3, fast_encoder=True)
+        pool = client.connection_pool
+        self.assertIsInstance(pool, TairConnectionPool)
+        self.assertEqual({'created': 3, 'idle': 3, 'in_use': 0},
+                         {k: v for k, v in pool.stats().items() if k in ('created', 'idle', 'in_use')})
+        self.assertTrue(all(c._sock is not None for c in pool._connections))
+        self.assertEqual(1, client.exhset('key', 'a', 1))
+        self.assertEqual([b'1'], client.pipeline(transaction=False).exhget('key', 'a').execute())
+        self.assertEqual(3, pool.stats()['created'])
+
+    def test_blocking_checkout(self):
+        client = Client(port=self.server.port, max_connections=1, pool_timeout=0.05)
+        pool = client.connection_pool
+        held = pool.get_connection('PING')
+        with self.assertRaises(redis.exceptions.ConnectionError):
+            client.ping()
+        self.assertEqual(1, pool.stats()['timeouts'])
+        self.assertEqual(1, pool.stats()['in_use'])
+        threading.Timer(0.02, pool.release, [held]).start()
+        self.assertTrue(client.ping())
+        stats = pool.stats()
+        self.assertEqual(1, stats['created'])
+        self.assertTrue(stats['max_wait'] >= 0.01)
+
+    def test_health_checks(self):
+        pool = TairConnectionPool(port=self.server.port, max_connections=2, warm_up=2)
+        broken = pool._connections[0]
+        broken._sock.close()
+        self.assertEqual(2, pool.check_idle(0))
+        stats = pool.stats()
+        self.assertEqual(2, stats['health_checks'])
+        self.assertEqual(1, stats['health_failures'])
+        self.assertEqual(2, stats['idle'])
+        self.assertIsNotNone(broken._sock)
+        self.assertTrue(Client(connection_pool=pool).ping())
+
+        pool.start_health_checks(0.01)
+        sleep(0.1)
+        pool.stop_health_checks()
+        self.assertTrue(pool.stats()['health_checks'] > 2)
+
+    def test_close_stops_health_checks(self):
+        client = Client(port=self.server.port, idle_check_interval=0.01)
+        checker = client.connection_pool._checker
+        self.assertTrue(checker.is_alive())
+        client.close()
+        self.assertFalse(checker.is_alive())
+
+    def test_needs_tair_pool(self):
+        with self.assertRaises(redis.exceptions.DataError):
+            Client(connection_pool=redis.ConnectionPool(port=self.server.port), warm_up=1)
+
+
+if __name__ == '__main__':
+    main()
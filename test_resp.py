@@ -0,0 +1,135 @@
+from array import array
+from unittest import TestCase, main
+
+from redis.connection import Connection, ConnectionPool, Encoder, PythonParser, SocketBuffer
+from redis.exceptions import DataError, ResponseError
+
+from tairClient.bench import encode_reply
+from tairClient.resp import CommandPacker, PackerConnection, install_packer, iter_array_reply, read_numeric_reply
+
+
+class TestCommandPacker(TestCase):
+    COMMANDS = [
+        ('EXHSET', 'key', 'field', 'value', 'EX', 10, 'VER', 3),
+        ('EXHSET', b'key', 'field', b'x' * 7000, 'PX', 5),
+        ('EXHINCRBYFLOAT', 'key', 'field', 1.5, 'Min', -3),
+        ('CLIENT TRACKING', 'ON'),
+    ]
+
+    def test_same_bytes_as_redis_py(self):
+        connection = Connection()
+        packer = CommandPacker(Encoder('utf-8', 'strict', False))
+        buffer = bytearray()
+        for _ in range(3):
+            for command in self.COMMANDS:
+                expected = b''.join(connection.pack_command(*command))
+                self.assertEqual(expected, b''.join(packer.pack([command], buffer, 6000)))
+        expected = b''.join(connection.pack_commands(self.COMMANDS))
+        self.assertEqual(expected, b''.join(packer.pack(self.COMMANDS, buffer, 6000)))
+
+    def test_caches(self):
+        packer = CommandPacker(Encoder('utf-8', 'strict', False), max_entries=100, max_length=8)
+        buffer = bytearray()
+        for _ in range(2):
+            packer.pack([('EXHGET', 'key', 'field'), ('EXHGET', 'key', 'a' * 9)], buffer, 6000)
+        self.assertIn(('EXHGET', 3), packer._headers)
+        self.assertIn('field', packer._bulks)
+        self.assertNotIn('a' * 9, packer._bulks)
+        self.assertIn('WITHVERSION', packer._bulks)
+
+    def test_install_packer(self):
+        pool = ConnectionPool()
+        packer = install_packer(pool)
+        self.assertTrue(issubclass(pool.connection_class, PackerConnection))
+        self.assertIs(packer, install_packer(pool))
+        self.assertIs(packer, pool.make_connection().packer)
+
+
+class ChunkedSocket(object):
+    def __init__(self, data, size):
+        self.chunks = [data[i:i + size] for i in range(0, len(data), size)]
+
+    def recv(self, size):
+        return self.chunks.pop(0)
+
+    def settimeout(self, timeout):
+        pass
+
+
+def chunked_parser(data, size):
+    parser = PythonParser(65536)
+    parser._buffer = SocketBuffer(ChunkedSocket(data, size), 65536, None)
+    parser.encoder = Encoder('utf-8', 'strict', False)
+    return parser
+
+
+class TestNumericReply(TestCase):
+    VALUES = [b'%d.25' % i for i in range(500)]
+
+    def test_array(self):
+        for size in (1, 7, 4096, 1 << 20):
+            parser = chunked_parser(encode_reply(self.VALUES) + encode_reply([b'1', None]), size)
+            values, mask = read_numeric_reply(parser)
+            self.assertEqual(array('d', [i + 0.25 for i in range(500)]), values)
+            self.assertEqual(bytearray(500), mask)
+            # the next reply is untouched
+            self.assertEqual([b'1', None], parser.read_response())
+
+    def test_missing(self):
+        reply = [b'1', None, b'-3', None]
+        for size in (1, 5, 4096):
+            parser = chunked_parser(encode_reply(reply) + encode_reply(reply), size)
+            for _ in range(2):
+                values, mask = read_numeric_reply(parser, 'q')
+                self.assertEqual(array('q', [1, 0, -3, 0]), values)
+                self.assertEqual(bytearray([0, 1, 0, 1]), mask)
+
+    def test_other_replies(self):
+        parser = chunked_parser(b'-ERR wrong type\r\n*-1\r\n*0\r\n', 3)
+        self.assertIsInstance(read_numeric_reply(parser), ResponseError)
+        self.assertIsNone(read_numeric_reply(parser))
+        self.assertEqual((array('d'), bytearray()), read_numeric_reply(parser))
+
+    def test_line_break_in_value(self):
+        parser = chunked_parser(encode_reply([b'1', b'2\r\n3']) + encode_reply([b'4']), 4)
+        with self.assertRaises(ValueError):
+            read_numeric_reply(parser)
+        self.assertEqual((array('d', [4.0]), bytearray(1)), read_numeric_reply(parser))
+
+
+class TestStreamReply(TestCase):
+    REPLY = [b'field:%d' % i if i % 2 else b'v\r\n' * (i % 7) for i in range(2000)] + [None, 42, b'x' * 20000]
+
+    def test_elements(self):
+        for size in (5, 13, 4096, 1 << 20):
+            parser = chunked_parser(encode_reply(self.REPLY) + encode_reply([b'next']), size)
+            self.assertEqual(self.REPLY, list(iter_array_reply(parser, compact_at=1000)))
+            self.assertEqual([b'next'], parser.read_response())
+
+    def test_buffer_stays_small(self):
+        reply = [b'%08d' % i for i in range(50000)]
+        parser = chunked_parser(encode_reply(reply), 4096)
+        largest = 0
+        for i, item in enumerate(iter_array_reply(parser, compact_at=16384)):
+            self.assertEqual(reply[i], item)
+            largest = max(largest, parser._buffer.bytes_written)
+        self.assertEqual(50000, i + 1)
+        self.assertLess(largest, 16384 + 2 * 4096)
+
+    def test_other_replies(self):
+        parser = chunked_parser(b'*0\r\n*-1\r\n-WRONGTYPE no\r\n:1\r\n', 2)
+        self.assertEqual([], list(iter_array_reply(parser)))
+        self.assertEqual([], list(iter_array_reply(parser)))
+        with self.assertRaises(ResponseError):
+            list(iter_array_reply(parser))
+        with self.assertRaises(DataError):
+            list(iter_array_reply(parser))
+
+    def test_decode_responses(self):
+        parser = chunked_parser(encode_reply([b'a', 'é'.encode()]), 3)
+        parser.encoder = Encoder('utf-8', 'strict', True)
+        self.assertEqual(['a', 'é'], list(iter_array_reply(parser)))
+
+
+if __name__ == '__main__':
+    main()
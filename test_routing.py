@@ -0,0 +1,132 @@
+from time import sleep
+from unittest import TestCase, main
+
+import redis
+
+from tairClient.client import Client
+from tairClient.routing import written_version
+from tairClient.server import TairHashServer
+
+
+class TestReplicaRouter(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.primary = TairHashServer(port=0).start()
+        cls.replica = TairHashServer(port=0).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.primary.stop()
+        cls.replica.stop()
+
+    def setUp(self):
+        self.client = Client(port=self.primary.port)
+        self.on_replica = Client(port=self.replica.port)
+        self.client.flushall()
+        self.on_replica.flushall()
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_written_version(self):
+        self.assertEqual(4, written_version('EXHSET', ['EXHSET', 'k', 'f', 'v', 'VER', 3]))
+        self.assertEqual(9, written_version('EXHSET', ['EXHSET', 'k', 'f', 'v', 'EX', 5, 'ABS', 9]))
+        self.assertEqual(7, written_version('EXHSETVER', ['EXHSETVER', 'k', 'f', 7]))
+        self.assertIsNone(written_version('EXHSET', ['EXHSET', 'k', 'f', 'v']))
+        self.assertIsNone(written_version('EXHDEL', ['EXHDEL', 'k', 'f']))
+
+    def test_reads_go_to_replica(self):
+        router = self.client.enable_replica_reads([('localhost', self.replica.port)])
+        self.assertEqual(1, self.client.exhset('key', 'a', 'primary'))
+        self.on_replica.exhset('key', 'a', 'replica')
+        self.assertEqual(b'replica', self.client.exhget('key', 'a'))
+        self.assertEqual([b'replica', None], self.client.exhmget('key', ['a', 'b']))
+        self.assertEqual({b'a': b'replica'}, self.client.exhgetall('key'))
+        self.assertEqual(1, self.client.exhlen('key'))
+        # pipelines stay on the primary
+        self.assertEqual([b'primary'], self.client.pipeline(transaction=False).exhget('key', 'a').execute())
+        stats = router.stats()
+        self.assertEqual(4, stats['replicas']['localhost:%d' % self.replica.port]['reads'])
+        self.assertEqual(0, stats['primary_reads'])
+
+        self.client.disable_replica_reads()
+        self.assertEqual(b'primary', self.client.exhget('key', 'a'))
+
+    def test_least_outstanding(self):
+        other = TairHashServer(port=0).start()
+        try:
+            router = self.client.enable_replica_reads([('localhost', self.replica.port), ('localhost', other.port)])
+            busy, idle = router.replicas
+            busy.outstanding = 5
+            for _ in range(10):
+                self.client.exhget('key', 'a')
+            self.assertEqual((0, 10), (busy.reads, idle.reads))
+            busy.outstanding = 0
+            for _ in range(200):
+                self.client.exhget('key', 'a')
+            self.assertGreater(busy.reads, 0)
+        finally:
+            other.stop()
+
+    def test_replica_down_falls_back_to_primary(self):
+        down = TairHashServer(port=0).start()
+        port = down.port
+        down.stop()
+        router = self.client.enable_replica_reads([('localhost', port)], retry_interval=60)
+        self.client.exhset('key', 'a', 'primary')
+        self.assertEqual(b'primary', self.client.exhget('key', 'a'))
+        self.assertEqual(b'primary', self.client.exhget('key', 'a'))
+        stats = router.stats()
+        self.assertEqual(1, stats['replicas']['localhost:%d' % port]['errors'])
+        self.assertEqual(2, stats['primary_reads'])
+
+    def test_error_reply_not_outstanding(self):
+        router = self.client.enable_replica_reads([('localhost', self.replica.port)])
+        for _ in range(3):
+            with self.assertRaises(redis.exceptions.ResponseError):
+                self.client.execute_command('EXHSCAN', 'key', 'not-a-cursor')
+        replica = router.stats()['replicas']['localhost:%d' % self.replica.port]
+        self.assertEqual((0, 0), (replica['outstanding'], replica['errors']))
+        self.assertEqual(0, router.stats()['primary_reads'])
+
+    def test_read_your_writes(self):
+        router = self.client.enable_replica_reads([('localhost', self.replica.port)], read_your_writes=True,
+                                                  max_lag=0.2)
+        self.on_replica.exhset('key', 'b', 'replica')
+        self.client.exhset('key', 'a', 'v1')
+        # the written field and key-level reads of its key are pinned, other fields are not
+        self.assertEqual(b'v1', self.client.exhget('key', 'a'))
+        self.assertEqual([b'v1', None], self.client.exhmget('key', ['a', 'b']))
+        self.assertEqual({b'a': b'v1'}, self.client.exhgetall('key'))
+        self.assertEqual(b'replica', self.client.exhget('key', 'b'))
+        self.assertEqual(None, self.client.exhget('other', 'a'))
+        self.assertEqual(3, router.stats()['primary_reads'])
+        sleep(0.25)
+        self.assertEqual(None, self.client.exhget('key', 'a'))
+
+        # a pipelined delete pins the whole key
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete('key')
+        pipe.execute()
+        self.assertEqual(None, self.client.exhget('key', 'b'))
+        self.assertEqual(4, router.stats()['primary_reads'])
+
+    def test_read_your_writes_until_replica_has_version(self):
+        router = self.client.enable_replica_reads([('localhost', self.replica.port)], read_your_writes=True,
+                                                  max_lag=60)
+        self.client.exhset('key', 'a', 'v5', abs=5)
+        self.on_replica.exhset('key', 'a', 'old', abs=4)
+        self.assertEqual(b'v5', self.client.exhget('key', 'a'))
+        self.assertEqual(1, router.stats()['primary_reads'])
+
+        self.on_replica.exhset('key', 'a', 'v5', abs=5)
+        self.assertEqual((b'v5', 5), tuple(self.client.exhgetwithver('key', 'a')))
+        stats = router.stats()
+        self.assertEqual((1, 1, 0), (stats['primary_reads'], stats['caught_up'], stats['pinned_fields']))
+        # the pin is gone, the next read is a plain replica read
+        self.assertEqual(b'v5', self.client.exhget('key', 'a'))
+        self.assertEqual(1, router.stats()['primary_reads'])
+
+
+if __name__ == '__main__':
+    main()
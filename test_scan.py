@@ -0,0 +1,37 @@
+from unittest import TestCase, main
+
+from tairClient.scan import AdaptiveCount, page_items, partition_ranges
+
+
+class TestAdaptiveCount(TestCase):
+    def test_grows_on_fast_small_pages(self):
+        tuner = AdaptiveCount(initial=100, target_latency=0.01, target_bytes=1024 * 1024)
+        self.assertEqual(200, tuner.update(0.001, 1000))
+        self.assertEqual(400, tuner.update(0.001, 1000))
+
+    def test_shrinks_on_slow_or_large_pages(self):
+        tuner = AdaptiveCount(initial=100, target_latency=0.01, target_bytes=1024)
+        self.assertEqual(50, tuner.update(0.1, 100))
+        self.assertEqual(40, tuner.update(0.001, 1280))
+
+    def test_bounds(self):
+        tuner = AdaptiveCount(initial=100, minimum=80, maximum=150)
+        self.assertEqual(150, tuner.update(0, 0))
+        self.assertEqual(80, tuner.update(10, 0))
+        self.assertEqual(80, tuner.update(10, 0))
+
+
+class TestPageItems(TestCase):
+    def test_decoded_and_raw_pages(self):
+        self.assertEqual([(b'a', b'1')], page_items({b'a': b'1'}))
+        self.assertEqual([(b'a', b'1'), (b'b', b'2')], page_items([b'a', b'1', b'b', b'2']))
+
+
+class TestPartitionRanges(TestCase):
+    def test_ranges(self):
+        self.assertEqual([(None, None)], partition_ranges([]))
+        self.assertEqual([(None, b'g'), (b'g', b'p'), (b'p', None)], partition_ranges([b'g', b'p']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+from time import monotonic, sleep
+from unittest import TestCase, main
+
+from tairClient.client import Client
+from tairClient.server import TairHashServer
+
+
+class TestTairHashServer(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = TairHashServer(port=0, active_expire_interval=0.01).start()
+        cls.client = Client(port=cls.server.port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.close()
+        cls.server.stop()
+
+    def setUp(self):
+        self.client.flushall()
+
+    def test_exhlen_noexp(self):
+        client = self.client
+        self.assertEqual(1, client.exhset('key', 'a', 1, px=20, noactive=True))
+        self.assertEqual(1, client.exhset('key', 'b', 2))
+        sleep(0.05)
+        # NOACTIVE fields are only deleted when accessed, so plain EXHLEN still counts them
+        self.assertEqual(2, client.exhlen('key'))
+        self.assertEqual(1, client.exhlen('key', noexp=True))
+        self.assertIsNone(client.exhget('key', 'a'))
+        self.assertEqual(1, client.exhlen('key'))
+
+    def test_active_expire(self):
+        self.assertEqual(1, self.client.exhset('key', 'a', 1, px=20))
+        sleep(0.1)
+        self.assertEqual(0, self.client.exhlen('key'))
+        self.assertEqual(0, self.client.exists('key'))
+
+    def test_exhscan_cursor_survives_deletes(self):
+        client = self.client
+        client.exhmset('key', {'f%d' % i: i for i in range(100)})
+        cursor, page = client.exhscan('key', 0, count=30)
+        client.exhdel('key', *page)
+        seen = set(page)
+        while cursor:
+            cursor, page = client.exhscan('key', cursor, count=30)
+            seen.update(page)
+        self.assertEqual(100, len(seen))
+
+    def test_exhscan_partitioned(self):
+        mapping = {'f%03d' % i: i for i in range(300)}
+        self.client.exhmset('key', mapping)
+        expected = {k.encode(): str(v).encode() for k, v in mapping.items()}
+        self.assertEqual(expected, dict(self.client.exhscan_partitioned('key', partitions=4, count=17)))
+        pages = []
+        counts = self.client.exhscan_partitioned('key', boundaries=['f100'], count=50,
+                                                 callback=lambda partition, items: pages.append(partition))
+        self.assertEqual([100, 200], counts)
+        self.assertEqual({0, 1}, set(pages))
+        # a partition stops at its end even when MATCH filters out every field: 2 calls below f100, 4 from it
+        processed = self.server.commands_processed
+        counts = self.client.exhscan_partitioned('key', boundaries=['f100'], count=50, match='nomatch*',
+                                                 callback=lambda partition, items: None)
+        self.assertEqual([0, 0], counts)
+        self.assertEqual(6, self.server.commands_processed - processed)
+
+    def test_rtt_is_paid_once_per_pipeline(self):
+        with TairHashServer(port=0, rtt=0.05) as slow:
+            client = Client(port=slow.port)
+            client.ping()
+            start = monotonic()
+            pipe = client.pipeline(transaction=False)
+            for i in range(50):
+                pipe.exhset('key', i, i)
+            pipe.execute()
+            elapsed = monotonic() - start
+            client.close()
+        self.assertGreaterEqual(elapsed, 0.05)
+        self.assertLess(elapsed, 0.5)
+
+    def test_per_command_latency(self):
+        with TairHashServer(port=0, latency={'exhgetall': 0.05}) as slow:
+            client = Client(port=slow.port)
+            start = monotonic()
+            client.exhget('key', 'a')
+            fast = monotonic() - start
+            start = monotonic()
+            client.exhgetall('key')
+            slow_elapsed = monotonic() - start
+            client.close()
+        self.assertLess(fast, 0.05)
+        self.assertGreaterEqual(slow_elapsed, 0.05)
+
+
+if __name__ == '__main__':
+    main()
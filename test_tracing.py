@@ -0,0 +1,41 @@
+from unittest import TestCase, main
+
+from redis.connection import Connection
+
+from tairClient.tracing import CommandTracer, reply_size, request_size
+
+
+class TestSizes(TestCase):
+    def test_request_size(self):
+        connection = Connection()
+        args = ('EXHSET', 'key', 'field', 'value' * 100, 'EX', 10)
+        self.assertEqual(len(b''.join(connection.pack_command(*args))), request_size(connection.encoder, args))
+
+    def test_reply_size(self):
+        self.assertEqual((0, 0), reply_size(None))
+        self.assertEqual((3, 1), reply_size(b'abc'))
+        self.assertEqual((4, 4), reply_size({b'a': b'1', b'b': b'2'}))
+        self.assertEqual((11, 3), reply_size([b'0', [b'ab', 5]]))
+
+
+class TestCommandTracer(TestCase):
+    def test_top_n(self):
+        seen = []
+        tracer = CommandTracer(sample_rate=1.0, top_n=2, callback=seen.append)
+        for i in range(5):
+            tracer.observe(('EXHGET', 'key', 'f'), b'v' * i, 0.001 * (5 - i))
+        self.assertEqual(5, len(seen))
+        self.assertEqual([4, 3], [r['reply_bytes'] for r in tracer.largest()])
+        self.assertEqual([0.005, 0.004], [r['duration'] for r in tracer.slowest()])
+        self.assertEqual('key', seen[0]['key'])
+        self.assertEqual(2, seen[0]['args'])
+
+    def test_sampling(self):
+        tracer = CommandTracer(sample_rate=0.0, slow_threshold=0.01)
+        self.assertIsNone(tracer.observe(('EXHGET', 'key', 'f'), None, 0.001))
+        self.assertIsNotNone(tracer.observe(('EXHGET', 'key', 'f'), None, 0.02))
+        self.assertEqual(1, tracer.recorded)
+
+
+if __name__ == '__main__':
+    main()